@@ -4,13 +4,57 @@ Budget Buddy Web Application
 Flask-based personal finance management system
 """
 
-from flask import Flask, render_template, request, jsonify, session
-import json
+from flask import Flask, Response, g, make_response, render_template, request, jsonify, send_from_directory, session
+from flask.json.provider import DefaultJSONProvider
+import cProfile
+import hashlib
+import hmac
+import io
+import math
 import os
-from datetime import datetime
-from functools import wraps
+import random
+import re
+import threading
+import time
+from datetime import date, datetime
+from functools import partial, wraps
+
+from budgets import budget_limits, budget_status, evaluate, parse_limit, record_alerts
+from exporter import gzip_chunks, iter_backend_entries, iter_export, iter_export_records
+from forecast import DEFAULT_MONTHS, DEFAULT_PATHS, MAX_MONTHS, MAX_PATHS, ForecastCache, project
+from importer import import_stream, parse_date
+from ledger import ensure_aggregates, matches_filters, summarize_aggregates, verify_aggregates
+from metrics import AGGREGATION_SECONDS, REGISTRY, SERIALIZE_SECONDS
+from recurring import (combine_summaries, describe_rule, merge_series, page_occurrences,
+                       parse_occurrence_cursor, parse_rule, parse_rule_changes, recurring_rules,
+                       rules_month_spent, summarize_rules)
+from serialization import MIN_COMPRESS_SIZE, compress, compressible, dumps, loads, negotiate_encoding
+from storage import JsonBackend, LedgerCache
+from sync import apply_push, build_delta
+from tenants import new_user_id
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, encoding through the serialization layer and timing responses"""
+    
+    def dumps(self, obj, **kwargs):
+        with SERIALIZE_SECONDS.time(target='response'):
+            return super().dumps(obj, **kwargs)
+    
+    def loads(self, s, **kwargs):
+        return loads(s) if not kwargs else super().loads(s, **kwargs)
+    
+    def response(self, *args, **kwargs):
+        """Build a compact JSON response straight from encoded bytes"""
+        if self._app.debug:
+            # Keep Flask's indented output while debugging
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        with SERIALIZE_SECONDS.time(target='response'):
+            body = dumps(obj, sort_keys=self.sort_keys, default=self.default)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
 
 app = Flask(__name__)
+app.json = TimedJSONProvider(app)
 app.secret_key = 'budget_buddy_secret_key_2024'  # Change in production
 
 DATA_DIR = 'user_data'
@@ -30,36 +74,560 @@ PROFESSIONAL_CATEGORIES = [
     "Shopping", "Savings & Investment", "Other"
 ]
 
-def get_user_file():
-    """Get user data file path"""
-    user_id = session.get('user_id', 'default_user')
-    return os.path.join(DATA_DIR, f'{user_id}_data.json')
+def create_backend():
+    """Create the storage backend selected by BUDGET_BUDDY_STORAGE"""
+    if os.environ.get('BUDGET_BUDDY_STORAGE', 'json') == 'sqlite':
+        from sqlite_store import SQLiteBackend
+        return SQLiteBackend(
+            os.path.join(DATA_DIR, 'budget_buddy.db'),
+            pool_size=int(os.environ.get('BUDGET_BUDDY_POOL_SIZE', 8))
+        )
+    # Parsed ledgers are shared between requests in this process
+    cache = LedgerCache(
+        max_entries=int(os.environ.get('BUDGET_BUDDY_CACHE_ENTRIES', 256)),
+        max_bytes=int(os.environ.get('BUDGET_BUDDY_CACHE_BYTES', 64 * 1024 * 1024))
+    )
+    return JsonBackend(DATA_DIR, cache)
+
+backend = create_backend()
+
+# Forecasts are reused until the ledger version or the day changes
+forecasts = ForecastCache()
+
+# /api/admin/* answers 403 unless this bearer token is configured and sent
+ADMIN_TOKEN = os.environ.get('BUDGET_BUDDY_ADMIN_TOKEN')
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'budget_buddy_request_duration_seconds',
+    'Request latency by route, method and status', ['route', 'method', 'status'])
+CACHE_ENTRIES = REGISTRY.gauge(
+    'budget_buddy_ledger_cache_entries', 'Ledgers held in the cache')
+CACHE_BYTES = REGISTRY.gauge(
+    'budget_buddy_ledger_cache_bytes', 'On-disk size of the ledgers held in the cache')
+RESPONSE_BYTES = REGISTRY.counter(
+    'budget_buddy_response_bytes_total',
+    'Buffered response body bytes sent, by content encoding', ['encoding'])
+
+# Slow-request profiling is off unless BUDGET_BUDDY_PROFILE_SLOW_MS is set.
+# A sampled request is run under cProfile, and if it takes at least that
+# many milliseconds its stats are dumped to PROFILE_DIR as a .prof file.
+PROFILE_SLOW_MS = (float(os.environ['BUDGET_BUDDY_PROFILE_SLOW_MS'])
+                   if os.environ.get('BUDGET_BUDDY_PROFILE_SLOW_MS') else None)
+PROFILE_SAMPLE_RATE = float(os.environ.get('BUDGET_BUDDY_PROFILE_SAMPLE_RATE', 1.0))
+PROFILE_DIR = os.environ.get('BUDGET_BUDDY_PROFILE_DIR', 'profiles')
+# Only one profiler can be active at a time
+profile_lock = threading.Lock()
+
+@app.before_request
+def start_request_timer():
+    """Record the request start time and maybe start profiling"""
+    g.request_started = time.perf_counter()
+    if (PROFILE_SLOW_MS is not None and random.random() < PROFILE_SAMPLE_RATE
+            and profile_lock.acquire(blocking=False)):
+        g.profiler = cProfile.Profile()
+        g.profiler.enable()
+
+@app.after_request
+def record_request_metrics(response):
+    """Observe request latency and dump the profile of a slow request"""
+    elapsed = time.perf_counter() - g.request_started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUEST_SECONDS.observe(elapsed, route=route, method=request.method,
+                            status=str(response.status_code))
+    
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        profile_lock.release()
+        if elapsed * 1000 >= PROFILE_SLOW_MS:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            name = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+            filename = f'{time.time_ns()}-{request.method}-{name}-{elapsed * 1000:.0f}ms.prof'
+            profiler.dump_stats(os.path.join(PROFILE_DIR, filename))
+    return response
+
+@app.after_request
+def compress_response(response):
+    """Compress large buffered responses with the best encoding the client accepts"""
+    if (response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers or not compressible(response.mimetype)):
+        return response
+    body = response.get_data()
+    encoding = None
+    if len(body) >= MIN_COMPRESS_SIZE:
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is not None:
+        body = compress(body, encoding)
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        # The compressed bytes differ, so a strong ETag would be wrong
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+    RESPONSE_BYTES.inc(len(body), encoding=encoding or 'identity')
+    return response
+
+@app.route('/metrics')
+def metrics():
+    """Expose request, storage and cache metrics in Prometheus text format"""
+    cache = getattr(backend, 'cache', None)
+    if cache is not None:
+        CACHE_ENTRIES.set(len(cache))
+        CACHE_BYTES.set(cache.size_bytes)
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+def get_user_id():
+    """Get the current session's user id, assigning a new one on first visit"""
+    user_id = session.get('user_id')
+    if user_id is None:
+        user_id = session['user_id'] = new_user_id()
+    return user_id
 
 def load_user_data():
-    """Load user data from file"""
-    file_path = get_user_file()
-    if os.path.exists(file_path):
+    """Load user data from the storage backend"""
+    return backend.load(get_user_id())
+
+def save_user_data(data, record=None):
+    """Save user data, applying a single change record when given.
+
+    Returns the entry the record added or removed, if any.
+    """
+    return backend.save(get_user_id(), data, record)
+
+# Category lists never change, so clients may keep them for a day
+CATEGORIES_MAX_AGE = 86400
+CATEGORY_ETAGS = {
+    mode: hashlib.sha1('\n'.join(categories).encode('utf-8')).hexdigest()[:16]
+    for mode, categories in (('student', STUDENT_CATEGORIES),
+                             ('professional', PROFESSIONAL_CATEGORIES))
+}
+
+def ledger_etag(user_id):
+    """Strong ETag for the current version of a user's ledger"""
+    # The user hash keeps one browser from reusing another session's ETag
+    user_hash = hashlib.sha1(user_id.encode('utf-8')).hexdigest()[:8]
+    # Recurring occurrences fall due as days pass, without a new version
+    return f'{user_hash}-{backend.version(user_id)}-{date.today():%Y%m%d}'
+
+def conditional(view):
+    """Tag GET responses with the ledger version and answer If-None-Match with 304.
+
+    The version is checked before the view runs, so a matching request
+    never loads or serializes the ledger.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method != 'GET':
+            return view(*args, **kwargs)
+        etag = ledger_etag(get_user_id())
+        # Compressed responses carry the weak form of the tag
+        if request.if_none_match.contains_weak(etag):
+            response = Response(status=304)
+        else:
+            response = make_response(view(*args, **kwargs))
+            if response.status_code != 200 or response.get_etag()[0]:
+                return response
+        response.set_etag(etag)
+        # Clients may store the response but must revalidate before reuse
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+        return response
+    return wrapper
+
+# Page sizes for the transaction listing endpoints
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Accepted from/to formats by length: a year, month, day or ledger timestamp
+DATE_FILTER_FORMATS = {4: '%Y', 7: '%Y-%m', 10: '%Y-%m-%d', 19: '%Y-%m-%d %H:%M:%S'}
+
+def parse_date_range(args):
+    """Parse from/to query parameters as a year, month, day or full timestamp.
+
+    Raises ValueError on malformed values.
+    """
+    filters = {}
+    for key in ('from', 'to'):
+        value = args.get(key)
+        if value:
+            date_format = DATE_FILTER_FORMATS.get(len(value))
+            if date_format is None:
+                raise ValueError(f'{key} is not a date')
+            datetime.strptime(value, date_format)
+            filters[key] = value
+    return filters
+
+def parse_filters(args):
+    """Parse date, category and amount filter query parameters.
+
+    Raises ValueError on malformed values.
+    """
+    filters = parse_date_range(args)
+    if args.get('category'):
+        filters['category'] = args['category']
+    for key in ('min_amount', 'max_amount'):
+        if args.get(key):
+            filters[key] = float(args[key])
+    return filters
+
+def parse_listing_args(args):
+    """Parse pagination and filter query parameters.
+
+    Raises ValueError on malformed values.
+    """
+    filters = parse_filters(args)
+    limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError('limit out of range')
+    cursor = args.get('cursor')
+    after = int(cursor) if cursor else None
+    return filters, after, limit
+
+def parse_recurring_cursor(args):
+    """Parse the recurring_cursor query parameter, or None when absent.
+
+    Raises ValueError on a malformed cursor.
+    """
+    cursor = args.get('recurring_cursor')
+    return parse_occurrence_cursor(cursor) if cursor else None
+
+def parse_forecast_args(args):
+    """Parse forecast horizon and path count query parameters.
+
+    Raises ValueError on malformed values.
+    """
+    months = int(args.get('months', DEFAULT_MONTHS))
+    paths = int(args.get('paths', DEFAULT_PATHS))
+    if not 0 < months <= MAX_MONTHS or not 0 < paths <= MAX_PATHS:
+        raise ValueError('months or paths out of range')
+    return months, paths
+
+def is_admin(authorization):
+    """Check an Authorization header against the configured admin token"""
+    if not ADMIN_TOKEN or not authorization.startswith('Bearer '):
+        return False
+    return hmac.compare_digest(authorization[len('Bearer '):].encode('utf-8'),
+                               ADMIN_TOKEN.encode('utf-8'))
+
+def parse_tenant_args(args):
+    """Parse tenant listing pagination parameters.
+
+    Raises ValueError on malformed values.
+    """
+    limit = int(args.get('limit', DEFAULT_PAGE_SIZE))
+    if not 0 < limit <= MAX_PAGE_SIZE:
+        raise ValueError('limit out of range')
+    return args.get('cursor') or None, limit
+
+def parse_amount(value):
+    """Validate a JSON amount as a positive, finite float.
+
+    Raises ValueError otherwise.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not (value > 0 and math.isfinite(value)):
+        raise ValueError('invalid amount')
+    return float(value)
+
+# Fields PATCH may change, per kind
+EDITABLE_FIELDS = {
+    'income_sources': ('source', 'amount'),
+    'expenses': ('category', 'description', 'amount')
+}
+
+def parse_changes(payload, kind, categories=None):
+    """Validate a PATCH body into the fields to change.
+
+    A new category must be one of categories, when given. Raises
+    ValueError on unknown fields or invalid values.
+    """
+    if not isinstance(payload, dict) or not payload:
+        raise ValueError('nothing to change')
+    changes = {}
+    for key, value in payload.items():
+        if key not in EDITABLE_FIELDS[kind]:
+            raise ValueError(f'{key} cannot be changed')
+        if key == 'amount':
+            changes[key] = parse_amount(value)
+        else:
+            if not isinstance(value, str) or not value.strip():
+                raise ValueError(f'invalid {key}')
+            changes[key] = value.strip()
+    if categories is not None and 'category' in changes and changes['category'] not in categories:
+        raise ValueError('unknown category')
+    return changes
+
+# Offline pushes are applied in batches of at most this many changes
+MAX_PUSH_CHANGES = 1000
+
+# Sync payload kinds, as the ledger names them
+SYNC_KINDS = {'income': 'income_sources', 'expenses': 'expenses'}
+
+def parse_sync_entry(payload, kind):
+    """Validate an entry created offline into a ledger entry.
+
+    Raises ValueError on missing or invalid fields.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError('invalid entry')
+    fields = ('source',) if kind == 'income_sources' else ('category', 'description')
+    entry = {}
+    for key in fields:
+        value = payload.get(key) or ''
+        if not isinstance(value, str):
+            raise ValueError(f'invalid {key}')
+        entry[key] = value.strip()
+    if not entry[fields[0]]:
+        raise ValueError(f'missing {fields[0]}')
+    if kind == 'expenses':
+        entry['description'] = entry['description'] or entry['category']
+    entry['amount'] = parse_amount(payload.get('amount'))
+    # Entries keep the time they were made offline, not the time they synced
+    date = payload.get('date')
+    if not isinstance(date, (str, type(None))):
+        raise ValueError('invalid date')
+    entry['date'] = parse_date(date) if date else datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return entry
+
+def parse_sync_change(change):
+    """Validate one queued offline change.
+
+    Raises ValueError on an unknown op or invalid fields.
+    """
+    if not isinstance(change, dict):
+        raise ValueError('invalid change')
+    op = change.get('op')
+    parsed = {'op': op, 'client_id': change.get('client_id')}
+    if op == 'mode':
+        if change.get('mode') not in ['student', 'professional']:
+            raise ValueError('invalid mode')
+        parsed['mode'] = change['mode']
+        return parsed
+    if op == 'clear':
+        return parsed
+    if op not in ['add', 'update', 'delete']:
+        raise ValueError('unknown op')
+    if change.get('kind') not in SYNC_KINDS:
+        raise ValueError('invalid kind')
+    kind = parsed['kind'] = SYNC_KINDS[change['kind']]
+    if op == 'add':
+        parsed['entry'] = parse_sync_entry(change.get('entry'), kind)
+        return parsed
+    entry_id = change.get('id')
+    if isinstance(entry_id, bool) or not isinstance(entry_id, int) or entry_id < 0:
+        raise ValueError('invalid id')
+    parsed['id'] = entry_id
+    # The entry as the client last saw it; a change against a stale copy conflicts
+    base = change.get('base')
+    if base is not None and not isinstance(base, dict):
+        raise ValueError('invalid base')
+    parsed['base'] = base
+    if op == 'update':
+        parsed['changes'] = parse_changes(change.get('changes'), kind)
+    return parsed
+
+def parse_push(payload):
+    """Validate a sync push body into (base_version, changes).
+
+    Raises ValueError naming the first invalid change.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    base_version = payload.get('base_version')
+    if isinstance(base_version, bool) or not isinstance(base_version, int) or base_version < 0:
+        raise ValueError('invalid base_version')
+    changes = payload.get('changes')
+    if not isinstance(changes, list) or len(changes) > MAX_PUSH_CHANGES:
+        raise ValueError('invalid changes')
+    parsed = []
+    for position, change in enumerate(changes):
         try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except:
+            parsed.append(parse_sync_change(change))
+        except ValueError as e:
+            raise ValueError(f'change {position}: {e}')
+    return base_version, parsed
+
+def parse_budget(payload, categories, removing=False):
+    """Validate a budget request body into a set_budget record.
+
+    Raises ValueError on an unknown category or an invalid limit.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    category = payload.get('category')
+    if category not in categories:
+        raise ValueError('unknown category')
+    limit = None if removing else parse_limit(payload.get('limit'))
+    return {'op': 'set_budget', 'category': category, 'limit': limit}
+
+def month_spent(user_id, data):
+    """Return spent(category, month), counting recurring expenses due in the month"""
+    spent = partial(backend.month_spent, user_id)
+    rules = recurring_rules(data)
+    if not rules:
+        return spent
+    return lambda category, month: spent(category, month) + rules_month_spent(rules, category, month)
+
+def budget_alerts(user_id, data, record, result):
+    """Evaluate the budget limits a saved expense record touched"""
+    return record_alerts(budget_limits(data), record, result, month_spent(user_id, data))
+
+def build_budgets(user_id, data, method, payload, month):
+    """Build the /api/budgets response for a GET, POST or DELETE"""
+    if not data['mode']:
+        return {'success': False, 'error': 'Please select a mode first'}, 400
+    spent = month_spent(user_id, data)
+    if method == 'GET':
+        month = month or datetime.now().strftime('%Y-%m')
+        if not re.fullmatch(r'\d{4}-(0[1-9]|1[0-2])', month):
+            return {'success': False, 'error': 'Invalid month'}, 400
+        return {'month': month, 'budgets': budget_status(budget_limits(data), month, spent)}, 200
+    
+    categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+    try:
+        record = parse_budget(payload, categories, removing=method == 'DELETE')
+    except ValueError as e:
+        return {'success': False, 'error': f'Invalid input: {e}'}, 400
+    backend.save(user_id, data, record)
+    if record['limit'] is None:
+        return {'success': True, 'category': record['category']}, 200
+    month = datetime.now().strftime('%Y-%m')
+    budget = evaluate(record['category'], month, record['limit'], spent(record['category'], month))
+    return {'success': True, 'budget': budget}, 200
+
+def build_recurring(user_id, data, method, payload, rule_id=None):
+    """Build the /api/recurring response for a GET, POST, PATCH or DELETE"""
+    if method == 'GET':
+        return {'recurring': [describe_rule(rule) for rule in recurring_rules(data)]}, 200
+    if method == 'DELETE':
+        try:
+            return {'success': True, 'deleted': backend.save(user_id, data,
+                                                             {'op': 'delete_rule', 'id': rule_id})}, 200
+        except KeyError:
+            return {'success': False, 'error': 'Not found'}, 404
+    
+    if not data['mode']:
+        return {'success': False, 'error': 'Please select a mode first'}, 400
+    categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+    if method == 'POST':
+        try:
+            record = {'op': 'add_rule', 'rule': parse_rule(payload, categories)}
+        except ValueError as e:
+            return {'success': False, 'error': f'Invalid input: {e}'}, 400
+    else:
+        rule = next((rule for rule in recurring_rules(data) if rule['id'] == rule_id), None)
+        if rule is None:
+            return {'success': False, 'error': 'Not found'}, 404
+        try:
+            record = {'op': 'update_rule', 'id': rule_id,
+                      'changes': parse_rule_changes(payload, rule, categories)}
+        except ValueError as e:
+            return {'success': False, 'error': f'Invalid input: {e}'}, 400
+    try:
+        rule = backend.save(user_id, data, record)
+    except KeyError:
+        return {'success': False, 'error': 'Not found'}, 404
+    return {'success': True, 'rule': describe_rule(rule)}, 200
+
+def delete_record(op, payload):
+    """Build a delete record from a request body, or None if it names no entry.
+
+    Bodies name an entry by 'id', or by list 'index' for older clients.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    for key in ('id', 'index'):
+        value = payload.get(key)
+        if isinstance(value, int) and not isinstance(value, bool) and value >= 0:
+            return {'op': op, key: value}
+    return None
+
+def delete_entry(data, op, payload):
+    """Delete the entry a request body names"""
+    record = delete_record(op, payload)
+    if record is not None:
+        try:
+            deleted = save_user_data(data, record)
+            return jsonify({'success': True, 'deleted': deleted})
+        except (IndexError, KeyError):
             pass
-    return {
-        'mode': None,
-        'income_sources': [],
-        'expenses': []
-    }
+    return jsonify({'success': False, 'error': 'Invalid id'}), 400
+
+def edit_entry(kind, entry_id):
+    """Apply a PATCH or DELETE to one entry by id"""
+    suffix = 'income' if kind == 'income_sources' else 'expense'
+    data = load_user_data()
+    if request.method == 'DELETE':
+        record = {'op': f'delete_{suffix}', 'id': entry_id}
+    else:
+        categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+        try:
+            record = {'op': f'update_{suffix}', 'id': entry_id,
+                      'changes': parse_changes(request.get_json(silent=True), kind, categories)}
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid input: {e}'}), 400
+    try:
+        entry = save_user_data(data, record)
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Not found'}), 404
+    if request.method == 'DELETE':
+        return jsonify({'success': True, 'deleted': entry})
+    response = {'success': True, 'entry': entry}
+    if kind == 'expenses':
+        response['alerts'] = budget_alerts(get_user_id(), data, record, entry)
+    return jsonify(response)
+
+def recurring_page(user_id, kind, filters, after=None, limit=DEFAULT_PAGE_SIZE):
+    """Return one page of the recurring occurrences of a kind that are due and match filters, and the next cursor"""
+    return page_occurrences(recurring_rules(backend.load(user_id)), kind, filters, after, limit)
 
-def save_user_data(data):
-    """Save user data to file"""
-    file_path = get_user_file()
-    with open(file_path, 'w') as f:
-        json.dump(data, f, indent=2)
+def summary_occurrences(user_id, filters):
+    """Return the first page of each kind's recurring occurrences for a summary, and their cursors"""
+    pages = {kind: recurring_page(user_id, kind, filters) for kind in ('income_sources', 'expenses')}
+    return ({kind: page for kind, (page, _) in pages.items()},
+            {kind: cursor for kind, (_, cursor) in pages.items()})
 
-def calculate_totals(data):
-    """Calculate financial totals"""
-    total_income = sum(item['amount'] for item in data['income_sources'])
-    total_expenses = sum(item['amount'] for item in data['expenses'])
+def build_trends(user_id, granularity, filters):
+    """Build rollup buckets within a date range, with recurring occurrences added"""
+    with AGGREGATION_SECONDS.time(operation='trends'):
+        series = backend.trends(user_id, granularity, filters)
+        return merge_series(series, recurring_rules(backend.load(user_id)), granularity, filters)
+
+def list_page(kind):
+    """Respond with one page of the user's income_sources or expenses"""
+    try:
+        filters, after, limit = parse_listing_args(request.args)
+        recurring_after = parse_recurring_cursor(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    entries, next_cursor = backend.page(get_user_id(), kind, filters, after, limit)
+    response = {kind: entries, 'next_cursor': next_cursor}
+    # Recurring occurrences have no entry ids, so they page by their own cursor from the first page
+    if after is None or recurring_after is not None:
+        response['recurring'], response['recurring_cursor'] = recurring_page(
+            get_user_id(), kind, filters, recurring_after, limit)
+    return jsonify(response)
+
+def add_recurring(data, range_summary, filters):
+    """Add the recurring occurrences due within a date range to a summary.
+
+    range_summary is None for the whole ledger, which is then read from
+    the aggregates. Returns it unchanged when there are no rules.
+    """
+    rules = recurring_rules(data)
+    if not rules:
+        return range_summary
+    with AGGREGATION_SECONDS.time(operation='recurring'):
+        return combine_summaries(range_summary or summarize_aggregates(ensure_aggregates(data)),
+                                 summarize_rules(rules, filters))
+
+@AGGREGATION_SECONDS.time(operation='totals')
+def calculate_totals(data, range_summary=None):
+    """Calculate financial totals from the maintained aggregates,
+    or from a backend range summary when one is given"""
+    if range_summary is None:
+        aggregates = ensure_aggregates(data)
+        total_income = aggregates['total_income']
+        total_expenses = aggregates['total_expenses']
+    else:
+        total_income, total_expenses, _ = range_summary
     balance = total_income - total_expenses
     
     return {
@@ -69,14 +637,30 @@ def calculate_totals(data):
         'savings_rate': (balance / total_income * 100) if total_income > 0 else 0
     }
 
-def get_category_breakdown(data):
+def cached_forecast(user_id, data, months, paths):
+    """Project a user's ledger, reusing the last result for the same ledger version and day"""
+    version = (backend.version(user_id), date.today())
+    result = forecasts.get((user_id, months, paths), version)
+    if result is None:
+        with AGGREGATION_SECONDS.time(operation='forecast'):
+            # Recurring rules are projected as known amounts, not from history
+            series = backend.trends(user_id, 'month', {})
+            rules = recurring_rules(data)
+            income, expenses, _ = summarize_rules(rules)
+            balance = sum(month['net'] for month in series) + income - expenses
+            result = project(series, rules, balance, months, paths)
+        forecasts.put((user_id, months, paths), version, result)
+    return result
+
+@AGGREGATION_SECONDS.time(operation='breakdown')
+def get_category_breakdown(data, range_summary=None):
     """Get expense breakdown by category"""
     categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
-    breakdown = {cat: 0 for cat in categories}
-    
-    for expense in data['expenses']:
-        if expense['category'] in breakdown:
-            breakdown[expense['category']] += expense['amount']
+    if range_summary is None:
+        totals = {cat: bucket['amount'] for cat, bucket in ensure_aggregates(data)['categories'].items()}
+    else:
+        totals = range_summary[2]
+    breakdown = {cat: totals.get(cat, 0) for cat in categories}
     
     total_expenses = sum(breakdown.values())
     
@@ -95,13 +679,16 @@ def get_category_breakdown(data):
 @app.route('/')
 def index():
     """Home page"""
-    if 'user_id' not in session:
-        session['user_id'] = 'default_user'
-    
     data = load_user_data()
     return render_template('index.html', mode=data['mode'])
 
+@app.route('/offline')
+def offline():
+    """Serve the standalone page, which works offline and syncs through /api/sync"""
+    return send_from_directory(app.root_path, 'budget-buddy.html')
+
 @app.route('/api/mode', methods=['GET', 'POST'])
+@conditional
 def mode():
     """Get or set user mode"""
     data = load_user_data()
@@ -109,16 +696,20 @@ def mode():
     if request.method == 'POST':
         new_mode = request.json.get('mode')
         if new_mode in ['student', 'professional']:
-            data['mode'] = new_mode
-            save_user_data(data)
+            save_user_data(data, {'op': 'set_mode', 'mode': new_mode})
             return jsonify({'success': True, 'mode': new_mode})
         return jsonify({'success': False, 'error': 'Invalid mode'}), 400
     
     return jsonify({'mode': data['mode']})
 
 @app.route('/api/categories')
+@conditional
 def categories():
-    """Get categories for current mode"""
+    """Get categories for current mode, or for ?mode= if given"""
+    mode = request.args.get('mode')
+    if mode:
+        return static_categories(mode)
+    
     data = load_user_data()
     if data['mode'] == 'student':
         return jsonify({'categories': STUDENT_CATEGORIES})
@@ -126,7 +717,22 @@ def categories():
         return jsonify({'categories': PROFESSIONAL_CATEGORIES})
     return jsonify({'categories': []}), 400
 
+def static_categories(mode):
+    """Serve one mode's category list with a long-lived, shared-cacheable ETag"""
+    if mode not in ['student', 'professional']:
+        return jsonify({'success': False, 'error': 'Invalid mode'}), 400
+    categories = STUDENT_CATEGORIES if mode == 'student' else PROFESSIONAL_CATEGORIES
+    etag = CATEGORY_ETAGS[mode]
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify({'categories': categories})
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'public, max-age={CATEGORIES_MAX_AGE}'
+    return response
+
 @app.route('/api/income', methods=['GET', 'POST', 'DELETE'])
+@conditional
 def income():
     """Manage income sources"""
     data = load_user_data()
@@ -134,33 +740,36 @@ def income():
     if request.method == 'POST':
         income_data = request.json
         source = income_data.get('source', '').strip()
-        amount = income_data.get('amount')
+        try:
+            amount = parse_amount(income_data.get('amount'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid input'}), 400
         
-        if not source or not amount or amount <= 0:
+        if not source:
             return jsonify({'success': False, 'error': 'Invalid input'}), 400
         
         entry = {
             'source': source,
-            'amount': float(amount),
+            'amount': amount,
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        data['income_sources'].append(entry)
-        save_user_data(data)
+        save_user_data(data, {'op': 'add_income', 'entry': entry})
         
         return jsonify({'success': True, 'entry': entry})
     
     elif request.method == 'DELETE':
-        index = request.json.get('index')
-        if 0 <= index < len(data['income_sources']):
-            deleted = data['income_sources'].pop(index)
-            save_user_data(data)
-            return jsonify({'success': True, 'deleted': deleted})
-        return jsonify({'success': False, 'error': 'Invalid index'}), 400
+        return delete_entry(data, 'delete_income', request.json)
     
-    return jsonify({'income_sources': data['income_sources']})
+    return list_page('income_sources')
+
+@app.route('/api/income/<int:entry_id>', methods=['PATCH', 'DELETE'])
+def income_entry(entry_id):
+    """Edit or delete one income entry by id"""
+    return edit_entry('income_sources', entry_id)
 
 @app.route('/api/expenses', methods=['GET', 'POST', 'DELETE'])
+@conditional
 def expenses():
     """Manage expenses"""
     data = load_user_data()
@@ -169,34 +778,61 @@ def expenses():
         expense_data = request.json
         category = expense_data.get('category', '').strip()
         description = expense_data.get('description', '').strip()
-        amount = expense_data.get('amount')
+        try:
+            amount = parse_amount(expense_data.get('amount'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid input'}), 400
         
-        if not category or not amount or amount <= 0:
+        if not category:
             return jsonify({'success': False, 'error': 'Invalid input'}), 400
         
         entry = {
             'category': category,
             'description': description or category,
-            'amount': float(amount),
+            'amount': amount,
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        data['expenses'].append(entry)
-        save_user_data(data)
+        record = {'op': 'add_expense', 'entry': entry}
+        save_user_data(data, record)
         
-        return jsonify({'success': True, 'entry': entry})
+        return jsonify({'success': True, 'entry': entry,
+                        'alerts': budget_alerts(get_user_id(), data, record, entry)})
     
     elif request.method == 'DELETE':
-        index = request.json.get('index')
-        if 0 <= index < len(data['expenses']):
-            deleted = data['expenses'].pop(index)
-            save_user_data(data)
-            return jsonify({'success': True, 'deleted': deleted})
-        return jsonify({'success': False, 'error': 'Invalid index'}), 400
+        return delete_entry(data, 'delete_expense', request.json)
     
-    return jsonify({'expenses': data['expenses']})
+    return list_page('expenses')
+
+@app.route('/api/expenses/<int:entry_id>', methods=['PATCH', 'DELETE'])
+def expense_entry(entry_id):
+    """Edit or delete one expense by id"""
+    return edit_entry('expenses', entry_id)
+
+@app.route('/api/budgets', methods=['GET', 'POST', 'DELETE'])
+def budgets():
+    """Get each category limit's status for a month (?month=YYYY-MM), or set or remove a limit"""
+    payload, status_code = build_budgets(get_user_id(), load_user_data(), request.method,
+                                         request.get_json(silent=True), request.args.get('month'))
+    return jsonify(payload), status_code
+
+@app.route('/api/recurring', methods=['GET', 'POST'])
+@conditional
+def recurring():
+    """List recurring rules with their occurrences so far, or add a rule"""
+    payload, status_code = build_recurring(get_user_id(), load_user_data(), request.method,
+                                           request.get_json(silent=True))
+    return jsonify(payload), status_code
+
+@app.route('/api/recurring/<int:rule_id>', methods=['PATCH', 'DELETE'])
+def recurring_rule(rule_id):
+    """Change or end one recurring rule by id"""
+    payload, status_code = build_recurring(get_user_id(), load_user_data(), request.method,
+                                           request.get_json(silent=True), rule_id)
+    return jsonify(payload), status_code
 
 @app.route('/api/summary')
+@conditional
 def summary():
     """Get financial summary"""
     data = load_user_data()
@@ -204,25 +840,178 @@ def summary():
     if not data['mode']:
         return jsonify({'error': 'Please select a mode first'}), 400
     
-    totals = calculate_totals(data)
-    breakdown = get_category_breakdown(data)
+    # ?from=&to= summarizes a date range with columnar reductions
+    try:
+        filters = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    stored_summary = None
+    if filters:
+        with AGGREGATION_SECONDS.time(operation='range_summary'):
+            stored_summary = backend.summarize(get_user_id(), filters)
+    range_summary = add_recurring(data, stored_summary, filters)
+    
+    totals = calculate_totals(data, range_summary)
+    breakdown = get_category_breakdown(data, range_summary)
     
-    return jsonify({
+    response = {
         'totals': totals,
-        'breakdown': breakdown,
-        'income_sources': data['income_sources'],
-        'expenses': data['expenses']
-    })
+        'breakdown': breakdown
+    }
+    # ?lists=0 leaves out the raw transaction lists
+    if request.args.get('lists') != '0':
+        response['income_sources'] = [entry for entry in data['income_sources']
+                                      if matches_filters(entry, filters)]
+        response['expenses'] = [entry for entry in data['expenses']
+                                if matches_filters(entry, filters)]
+        response['recurring'], response['recurring_cursor'] = summary_occurrences(
+            get_user_id(), filters)
+    
+    # ?verify=1 checks the aggregates against a full recompute
+    if request.args.get('verify') == '1':
+        response['verified'] = verify_aggregates(data)
+        if not response['verified']:
+            save_user_data(data)
+            range_summary = add_recurring(data, stored_summary, filters)
+            response['totals'] = calculate_totals(data, range_summary)
+            response['breakdown'] = get_category_breakdown(data, range_summary)
+    
+    return jsonify(response)
+
+@app.route('/api/trends')
+@conditional
+def trends():
+    """Get income, expense and category totals per day or month"""
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in ['day', 'month']:
+        return jsonify({'success': False, 'error': 'Invalid granularity'}), 400
+    
+    try:
+        filters = parse_date_range(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    series = build_trends(get_user_id(), granularity, filters)
+    return jsonify({'granularity': granularity, 'series': series})
+
+@app.route('/api/forecast')
+@conditional
+def forecast():
+    """Project balance and category spend for the next ?months=, with Monte Carlo bands"""
+    data = load_user_data()
+    if not data['mode']:
+        return jsonify({'success': False, 'error': 'Please select a mode first'}), 400
+    try:
+        months, paths = parse_forecast_args(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    try:
+        return jsonify(cached_forecast(get_user_id(), data, months, paths))
+    except RuntimeError as e:
+        return jsonify({'success': False, 'error': str(e)}), 501
+
+@app.route('/api/search')
+@conditional
+def search():
+    """Search transaction descriptions and income sources, best matches first"""
+    query = request.args.get('q', '').strip()
+    try:
+        filters, after, limit = parse_listing_args(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    if not query:
+        return jsonify({'success': False, 'error': 'Missing query'}), 400
+    
+    results, next_cursor = backend.search(get_user_id(), query, filters, after, limit)
+    return jsonify({'query': query, 'results': results, 'next_cursor': next_cursor})
+
+@app.route('/api/sync', methods=['GET', 'POST'])
+@conditional
+def sync():
+    """Get the changes after ?since=<version>, or push queued offline changes and get them"""
+    user_id = get_user_id()
+    if request.method == 'POST':
+        try:
+            since, changes = parse_push(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': f'Invalid input: {e}'}), 400
+        results = apply_push(backend, user_id, since, changes)
+    else:
+        try:
+            since = int(request.args.get('since', 0))
+            if since < 0:
+                raise ValueError('since out of range')
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+        results = None
+    
+    delta = build_delta(backend, user_id, since)
+    if results is not None:
+        delta['results'] = results
+    return jsonify(delta)
+
+@app.route('/api/import', methods=['POST'])
+def import_statement():
+    """Import a CSV or NDJSON statement streamed in the request body"""
+    data = load_user_data()
+    
+    if not data['mode']:
+        return jsonify({'success': False, 'error': 'Please select a mode first'}), 400
+    
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ['csv', 'ndjson']:
+        return jsonify({'success': False, 'error': 'Invalid format'}), 400
+    
+    categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+    report = import_stream(lines, fmt, categories,
+                           lambda record: save_user_data(data, record))
+    report['success'] = True
+    return jsonify(report)
+
+@app.route('/api/export')
+def export():
+    """Stream the user's transactions as CSV or NDJSON, optionally gzipped"""
+    fmt = request.args.get('format', 'csv')
+    kind = request.args.get('type')
+    if fmt not in ['csv', 'ndjson'] or kind not in [None, 'income', 'expense']:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    try:
+        filters = parse_filters(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    
+    user_id = get_user_id()
+    income = iter_backend_entries(backend, user_id, 'income_sources', filters) if kind != 'expense' else []
+    expenses = iter_backend_entries(backend, user_id, 'expenses', filters) if kind != 'income' else []
+    chunks = iter_export(iter_export_records(income, expenses), fmt)
+    
+    filename = f'budget_buddy_export.{fmt}'
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if request.args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(chunks, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@app.route('/api/admin/tenants')
+def admin_tenants():
+    """List users with their ledger size, entry counts and last change"""
+    if not is_admin(request.headers.get('Authorization', '')):
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    try:
+        after, limit = parse_tenant_args(request.args)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Invalid query parameters'}), 400
+    
+    tenants, next_cursor = backend.list_tenants(after, limit)
+    return jsonify({'tenants': tenants, 'next_cursor': next_cursor})
 
 @app.route('/api/clear', methods=['POST'])
 def clear_data():
     """Clear all data"""
-    data = {
-        'mode': load_user_data()['mode'],
-        'income_sources': [],
-        'expenses': []
-    }
-    save_user_data(data)
+    save_user_data(load_user_data(), {'op': 'clear'})
     return jsonify({'success': True})
 
 if __name__ == '__main__':
@@ -0,0 +1,616 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy ASGI Application
+Async variant of the /api/* contract for ASGI servers such as uvicorn
+"""
+
+from datetime import datetime
+from functools import wraps
+
+import anyio
+from anyio.from_thread import run as run_from_thread
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+# Share storage, helpers and the session secret with the Flask app
+from app import (CATEGORIES_MAX_AGE, CATEGORY_ETAGS, PROFESSIONAL_CATEGORIES, STUDENT_CATEGORIES,
+                 add_recurring, app as flask_app, backend, budget_alerts, build_budgets,
+                 build_recurring, build_trends, cached_forecast, calculate_totals, delete_record,
+                 get_category_breakdown, is_admin, ledger_etag, parse_amount, parse_changes,
+                 parse_date_range, parse_filters, parse_forecast_args, parse_listing_args, parse_push,
+                 parse_recurring_cursor, parse_tenant_args, recurring_page, summary_occurrences)
+from exporter import gzip_chunks, iter_backend_entries, iter_export, iter_export_records
+from importer import import_stream
+from ledger import matches_filters, verify_aggregates
+from serialization import MIN_COMPRESS_SIZE, compress, compressible, dumps, negotiate_encoding
+from sync import apply_push, build_delta
+from tenants import new_user_id
+
+# Lines buffered between the request body and the importer thread
+IMPORT_BUFFER_LINES = 1000
+
+session_serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+
+
+def session_user_id(request):
+    """Get the user id from the Flask session cookie, or None without a valid one"""
+    cookie = request.cookies.get(flask_app.config['SESSION_COOKIE_NAME'])
+    if cookie:
+        try:
+            return session_serializer.loads(cookie).get('user_id')
+        except Exception:
+            pass
+    return None
+
+
+def get_user_id(request):
+    """Get the request's user id, from its cookie or as assigned by UserIdMiddleware"""
+    return session_user_id(request) or request.state.user_id
+
+
+class UserIdMiddleware:
+    """Give requests without a session a new user id and a Flask-compatible session cookie"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or session_user_id(Request(scope)) is not None:
+            await self.app(scope, receive, send)
+            return
+        user_id = new_user_id()
+        scope.setdefault('state', {})['user_id'] = user_id
+        cookie = (f"{flask_app.config['SESSION_COOKIE_NAME']}="
+                  f"{session_serializer.dumps({'user_id': user_id})}; HttpOnly; Path=/")
+
+        async def send_with_cookie(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'set-cookie', cookie.encode('latin-1')))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_cookie)
+
+
+class JSONResponse(StarletteJSONResponse):
+    """Starlette's JSONResponse, encoded through the serialization layer"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+class CompressionMiddleware:
+    """Compress large non-streamed responses with the best encoding the client accepts.
+
+    Streamed responses (exports) pass through as they are; they have
+    their own gzip option.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get('accept-encoding'))
+        start = None
+
+        async def send_compressed(message):
+            nonlocal start
+            if message['type'] == 'http.response.start':
+                # Hold the headers until the body shows whether to compress
+                start = message
+                return
+            if start is not None:
+                held, start = start, None
+                body = message.get('body', b'')
+                headers = MutableHeaders(raw=list(held.get('headers', [])))
+                if (message['type'] == 'http.response.body' and not message.get('more_body')
+                        and 'content-encoding' not in headers
+                        and compressible(headers.get('content-type', ''))
+                        and len(body) >= MIN_COMPRESS_SIZE):
+                    headers.add_vary_header('Accept-Encoding')
+                    if encoding is not None:
+                        body = compress(body, encoding)
+                        headers['Content-Encoding'] = encoding
+                        headers['Content-Length'] = str(len(body))
+                        etag = headers.get('etag')
+                        if etag and not etag.startswith('W/'):
+                            headers['ETag'] = 'W/' + etag
+                        message = dict(message, body=body)
+                await send(dict(held, headers=headers.raw))
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+
+def conditional(view):
+    """Tag GET responses with the ledger version and answer If-None-Match with 304"""
+    @wraps(view)
+    async def wrapper(request):
+        if request.method != 'GET':
+            return await view(request)
+        etag = f'"{await run_in_threadpool(ledger_etag, get_user_id(request))}"'
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache', 'Vary': 'Cookie'}
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        response = await view(request)
+        if response.status_code == 200 and 'etag' not in response.headers:
+            response.headers.update(headers)
+        return response
+    return wrapper
+
+
+def error(message, status_code=400):
+    """Build a JSON error response"""
+    return JSONResponse({'success': False, 'error': message}, status_code=status_code)
+
+
+def apply_change(user_id, record):
+    """Load a ledger and apply one change record to it"""
+    return backend.save(user_id, backend.load(user_id), record)
+
+
+async def save(request, record):
+    """Apply a change record for the request's user in a worker thread"""
+    return await run_in_threadpool(apply_change, get_user_id(request), record)
+
+
+def apply_expense_change(user_id, record):
+    """Apply an expense change record and evaluate the budget limits it touched"""
+    data = backend.load(user_id)
+    entry = backend.save(user_id, data, record)
+    return entry, budget_alerts(user_id, data, record, entry)
+
+
+@conditional
+async def mode(request):
+    """Get or set user mode"""
+    if request.method == 'POST':
+        new_mode = (await request.json()).get('mode')
+        if new_mode in ['student', 'professional']:
+            await save(request, {'op': 'set_mode', 'mode': new_mode})
+            return JSONResponse({'success': True, 'mode': new_mode})
+        return error('Invalid mode')
+
+    data = await run_in_threadpool(backend.load, get_user_id(request))
+    return JSONResponse({'mode': data['mode']})
+
+
+@conditional
+async def categories(request):
+    """Get categories for current mode, or for ?mode= if given"""
+    mode = request.query_params.get('mode')
+    if mode:
+        if mode not in ['student', 'professional']:
+            return error('Invalid mode')
+        categories = STUDENT_CATEGORIES if mode == 'student' else PROFESSIONAL_CATEGORIES
+        etag = f'"{CATEGORY_ETAGS[mode]}"'
+        headers = {'ETag': etag, 'Cache-Control': f'public, max-age={CATEGORIES_MAX_AGE}'}
+        if etag in request.headers.get('if-none-match', ''):
+            return Response(status_code=304, headers=headers)
+        return JSONResponse({'categories': categories}, headers=headers)
+
+    data = await run_in_threadpool(backend.load, get_user_id(request))
+    if data['mode'] == 'student':
+        return JSONResponse({'categories': STUDENT_CATEGORIES})
+    elif data['mode'] == 'professional':
+        return JSONResponse({'categories': PROFESSIONAL_CATEGORIES})
+    return JSONResponse({'categories': []}, status_code=400)
+
+
+async def list_page(request, kind):
+    """Respond with one page of the user's income_sources or expenses"""
+    try:
+        filters, after, limit = parse_listing_args(request.query_params)
+        recurring_after = parse_recurring_cursor(request.query_params)
+    except ValueError:
+        return error('Invalid query parameters')
+    entries, next_cursor = await run_in_threadpool(
+        backend.page, get_user_id(request), kind, filters, after, limit)
+    response = {kind: entries, 'next_cursor': next_cursor}
+    if after is None or recurring_after is not None:
+        response['recurring'], response['recurring_cursor'] = await run_in_threadpool(
+            recurring_page, get_user_id(request), kind, filters, recurring_after, limit)
+    return JSONResponse(response)
+
+
+async def delete_entry(request, op):
+    """Delete the income or expense the request body names"""
+    record = delete_record(op, await request.json())
+    if record is not None:
+        try:
+            deleted = await save(request, record)
+            return JSONResponse({'success': True, 'deleted': deleted})
+        except (IndexError, KeyError):
+            pass
+    return error('Invalid id')
+
+
+async def edit_entry(request, kind):
+    """Apply a PATCH or DELETE to one entry by id"""
+    suffix = 'income' if kind == 'income_sources' else 'expense'
+    entry_id = request.path_params['entry_id']
+    if request.method == 'DELETE':
+        record = {'op': f'delete_{suffix}', 'id': entry_id}
+    else:
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        data = await run_in_threadpool(backend.load, get_user_id(request))
+        categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+        try:
+            record = {'op': f'update_{suffix}', 'id': entry_id,
+                      'changes': parse_changes(payload, kind, categories)}
+        except ValueError as e:
+            return error(f'Invalid input: {e}')
+    try:
+        if request.method == 'PATCH' and kind == 'expenses':
+            entry, alerts = await run_in_threadpool(apply_expense_change, get_user_id(request), record)
+            return JSONResponse({'success': True, 'entry': entry, 'alerts': alerts})
+        entry = await save(request, record)
+    except KeyError:
+        return error('Not found', 404)
+    return JSONResponse({'success': True, 'deleted' if request.method == 'DELETE' else 'entry': entry})
+
+
+async def income_entry(request):
+    """Edit or delete one income entry by id"""
+    return await edit_entry(request, 'income_sources')
+
+
+async def expense_entry(request):
+    """Edit or delete one expense by id"""
+    return await edit_entry(request, 'expenses')
+
+
+@conditional
+async def income(request):
+    """Manage income sources"""
+    if request.method == 'POST':
+        income_data = await request.json()
+        source = income_data.get('source', '').strip()
+        try:
+            amount = parse_amount(income_data.get('amount'))
+        except ValueError:
+            return error('Invalid input')
+
+        if not source:
+            return error('Invalid input')
+
+        entry = {
+            'source': source,
+            'amount': amount,
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        await save(request, {'op': 'add_income', 'entry': entry})
+        return JSONResponse({'success': True, 'entry': entry})
+
+    elif request.method == 'DELETE':
+        return await delete_entry(request, 'delete_income')
+
+    return await list_page(request, 'income_sources')
+
+
+@conditional
+async def expenses(request):
+    """Manage expenses"""
+    if request.method == 'POST':
+        expense_data = await request.json()
+        category = expense_data.get('category', '').strip()
+        description = expense_data.get('description', '').strip()
+        try:
+            amount = parse_amount(expense_data.get('amount'))
+        except ValueError:
+            return error('Invalid input')
+
+        if not category:
+            return error('Invalid input')
+
+        entry = {
+            'category': category,
+            'description': description or category,
+            'amount': amount,
+            'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        }
+        entry, alerts = await run_in_threadpool(
+            apply_expense_change, get_user_id(request), {'op': 'add_expense', 'entry': entry})
+        return JSONResponse({'success': True, 'entry': entry, 'alerts': alerts})
+
+    elif request.method == 'DELETE':
+        return await delete_entry(request, 'delete_expense')
+
+    return await list_page(request, 'expenses')
+
+
+def build_summary(user_id, args):
+    """Build the /api/summary payload; runs in a worker thread"""
+    data = backend.load(user_id)
+    if not data['mode']:
+        return {'error': 'Please select a mode first'}, 400
+
+    try:
+        filters = parse_date_range(args)
+    except ValueError:
+        return {'success': False, 'error': 'Invalid query parameters'}, 400
+    stored_summary = None
+    if filters:
+        stored_summary = backend.summarize(user_id, filters)
+    range_summary = add_recurring(data, stored_summary, filters)
+
+    response = {
+        'totals': calculate_totals(data, range_summary),
+        'breakdown': get_category_breakdown(data, range_summary)
+    }
+    if args.get('lists') != '0':
+        response['income_sources'] = [entry for entry in data['income_sources']
+                                      if matches_filters(entry, filters)]
+        response['expenses'] = [entry for entry in data['expenses']
+                                if matches_filters(entry, filters)]
+        response['recurring'], response['recurring_cursor'] = summary_occurrences(user_id, filters)
+
+    if args.get('verify') == '1':
+        response['verified'] = verify_aggregates(data)
+        if not response['verified']:
+            backend.save(user_id, data)
+            range_summary = add_recurring(data, stored_summary, filters)
+            response['totals'] = calculate_totals(data, range_summary)
+            response['breakdown'] = get_category_breakdown(data, range_summary)
+    return response, 200
+
+
+async def budgets(request):
+    """Get each category limit's status for a month (?month=YYYY-MM), or set or remove a limit"""
+    user_id = get_user_id(request)
+    try:
+        payload = await request.json() if request.method != 'GET' else None
+    except ValueError:
+        payload = None
+    data = await run_in_threadpool(backend.load, user_id)
+    response, status_code = await run_in_threadpool(
+        build_budgets, user_id, data, request.method, payload, request.query_params.get('month'))
+    return JSONResponse(response, status_code=status_code)
+
+
+async def recurring_response(request, rule_id=None):
+    """Run build_recurring for a request in a worker thread"""
+    user_id = get_user_id(request)
+    try:
+        payload = await request.json() if request.method in ('POST', 'PATCH') else None
+    except ValueError:
+        payload = None
+    data = await run_in_threadpool(backend.load, user_id)
+    response, status_code = await run_in_threadpool(
+        build_recurring, user_id, data, request.method, payload, rule_id)
+    return JSONResponse(response, status_code=status_code)
+
+
+@conditional
+async def recurring(request):
+    """List recurring rules with their occurrences so far, or add a rule"""
+    return await recurring_response(request)
+
+
+async def recurring_rule(request):
+    """Change or end one recurring rule by id"""
+    return await recurring_response(request, request.path_params['rule_id'])
+
+
+@conditional
+async def summary(request):
+    """Get financial summary"""
+    payload, status_code = await run_in_threadpool(
+        build_summary, get_user_id(request), request.query_params)
+    return JSONResponse(payload, status_code=status_code)
+
+
+@conditional
+async def trends(request):
+    """Get income, expense and category totals per day or month"""
+    granularity = request.query_params.get('granularity', 'month')
+    if granularity not in ['day', 'month']:
+        return error('Invalid granularity')
+
+    try:
+        filters = parse_date_range(request.query_params)
+    except ValueError:
+        return error('Invalid query parameters')
+    series = await run_in_threadpool(build_trends, get_user_id(request), granularity, filters)
+    return JSONResponse({'granularity': granularity, 'series': series})
+
+
+@conditional
+async def forecast(request):
+    """Project balance and category spend for the next ?months=, with Monte Carlo bands"""
+    user_id = get_user_id(request)
+    data = await run_in_threadpool(backend.load, user_id)
+    if not data['mode']:
+        return error('Please select a mode first')
+    try:
+        months, paths = parse_forecast_args(request.query_params)
+    except ValueError:
+        return error('Invalid query parameters')
+    try:
+        result = await run_in_threadpool(cached_forecast, user_id, data, months, paths)
+    except RuntimeError as e:
+        return error(str(e), 501)
+    return JSONResponse(result)
+
+
+@conditional
+async def search(request):
+    """Search transaction descriptions and income sources, best matches first"""
+    query = request.query_params.get('q', '').strip()
+    try:
+        filters, after, limit = parse_listing_args(request.query_params)
+    except ValueError:
+        return error('Invalid query parameters')
+    if not query:
+        return error('Missing query')
+
+    results, next_cursor = await run_in_threadpool(
+        backend.search, get_user_id(request), query, filters, after, limit)
+    return JSONResponse({'query': query, 'results': results, 'next_cursor': next_cursor})
+
+
+def push_and_sync(user_id, since, changes):
+    """Apply queued offline changes, then build the delta after since; runs in a worker thread"""
+    results = apply_push(backend, user_id, since, changes)
+    delta = build_delta(backend, user_id, since)
+    delta['results'] = results
+    return delta
+
+
+@conditional
+async def sync(request):
+    """Get the changes after ?since=<version>, or push queued offline changes and get them"""
+    user_id = get_user_id(request)
+    if request.method == 'POST':
+        try:
+            payload = await request.json()
+        except ValueError:
+            payload = None
+        try:
+            since, changes = parse_push(payload)
+        except ValueError as e:
+            return error(f'Invalid input: {e}')
+        return JSONResponse(await run_in_threadpool(push_and_sync, user_id, since, changes))
+
+    try:
+        since = int(request.query_params.get('since', 0))
+        if since < 0:
+            raise ValueError('since out of range')
+    except ValueError:
+        return error('Invalid query parameters')
+    return JSONResponse(await run_in_threadpool(build_delta, backend, user_id, since))
+
+
+async def import_statement(request):
+    """Import a CSV or NDJSON statement streamed in the request body"""
+    user_id = get_user_id(request)
+    data = await run_in_threadpool(backend.load, user_id)
+    if not data['mode']:
+        return error('Please select a mode first')
+
+    fmt = request.query_params.get('format', 'csv')
+    if fmt not in ['csv', 'ndjson']:
+        return error('Invalid format')
+
+    categories = STUDENT_CATEGORIES if data['mode'] == 'student' else PROFESSIONAL_CATEGORIES
+    send, receive = anyio.create_memory_object_stream(IMPORT_BUFFER_LINES)
+
+    def lines():
+        # Pull decoded lines from the event loop, which reads the body
+        while True:
+            try:
+                yield run_from_thread(receive.receive)
+            except anyio.EndOfStream:
+                return
+
+    def run_import():
+        return import_stream(lines(), fmt, categories,
+                             lambda record: backend.save(user_id, data, record))
+
+    async def feed():
+        async with send:
+            pending = b''
+            async for chunk in request.stream():
+                pending += chunk
+                *complete, pending = pending.split(b'\n')
+                for line in complete:
+                    await send.send(line.decode('utf-8') + '\n')
+            if pending:
+                await send.send(pending.decode('utf-8'))
+
+    report = {}
+
+    async def consume():
+        async with receive:
+            report.update(await run_in_threadpool(run_import))
+
+    async with anyio.create_task_group() as tasks:
+        tasks.start_soon(feed)
+        tasks.start_soon(consume)
+    report['success'] = True
+    return JSONResponse(report)
+
+
+async def export(request):
+    """Stream the user's transactions as CSV or NDJSON, optionally gzipped"""
+    args = request.query_params
+    fmt = args.get('format', 'csv')
+    kind = args.get('type')
+    if fmt not in ['csv', 'ndjson'] or kind not in [None, 'income', 'expense']:
+        return error('Invalid query parameters')
+    try:
+        filters = parse_filters(args)
+    except ValueError:
+        return error('Invalid query parameters')
+
+    user_id = get_user_id(request)
+    income = iter_backend_entries(backend, user_id, 'income_sources', filters) if kind != 'expense' else []
+    expenses = iter_backend_entries(backend, user_id, 'expenses', filters) if kind != 'income' else []
+    chunks = iter_export(iter_export_records(income, expenses), fmt)
+
+    filename = f'budget_buddy_export.{fmt}'
+    media_type = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    if args.get('gzip') == '1':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        media_type = 'application/gzip'
+
+    # Starlette iterates a plain generator in its thread pool
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+
+async def clear_data(request):
+    """Clear all data"""
+    await save(request, {'op': 'clear'})
+    return JSONResponse({'success': True})
+
+
+async def admin_tenants(request):
+    """List users with their ledger size, entry counts and last change"""
+    if not is_admin(request.headers.get('authorization', '')):
+        return error('Forbidden', 403)
+    try:
+        after, limit = parse_tenant_args(request.query_params)
+    except ValueError:
+        return error('Invalid query parameters')
+    tenants, next_cursor = await run_in_threadpool(backend.list_tenants, after, limit)
+    return JSONResponse({'tenants': tenants, 'next_cursor': next_cursor})
+
+
+app = Starlette(routes=[
+    Route('/api/mode', mode, methods=['GET', 'POST']),
+    Route('/api/categories', categories),
+    Route('/api/income', income, methods=['GET', 'POST', 'DELETE']),
+    Route('/api/income/{entry_id:int}', income_entry, methods=['PATCH', 'DELETE']),
+    Route('/api/expenses', expenses, methods=['GET', 'POST', 'DELETE']),
+    Route('/api/expenses/{entry_id:int}', expense_entry, methods=['PATCH', 'DELETE']),
+    Route('/api/budgets', budgets, methods=['GET', 'POST', 'DELETE']),
+    Route('/api/recurring', recurring, methods=['GET', 'POST']),
+    Route('/api/recurring/{rule_id:int}', recurring_rule, methods=['PATCH', 'DELETE']),
+    Route('/api/summary', summary),
+    Route('/api/trends', trends),
+    Route('/api/forecast', forecast),
+    Route('/api/search', search),
+    Route('/api/sync', sync, methods=['GET', 'POST']),
+    Route('/api/import', import_statement, methods=['POST']),
+    Route('/api/export', export),
+    Route('/api/admin/tenants', admin_tenants),
+    Route('/api/clear', clear_data, methods=['POST'])
+], middleware=[Middleware(CompressionMiddleware), Middleware(UserIdMiddleware)])
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8000)
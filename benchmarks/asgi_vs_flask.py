@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+"""
+ASGI vs Flask Benchmark
+Compares throughput and p99 latency of app.py and asgi_app.py under concurrent clients
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SERVERS = {
+    'flask': [sys.executable, '-c',
+              'import app; app.app.run(host="127.0.0.1", port={port}, threaded=True)'],
+    'asgi': [sys.executable, '-m', 'uvicorn', 'asgi_app:app', '--host', '127.0.0.1',
+             '--port', '{port}', '--log-level', 'warning']
+}
+
+
+def seed(data_dir, rows, cookies, seed=42):
+    """Write a ledger for default_user through the configured backend, and queue its session cookie"""
+    os.chdir(data_dir)
+    from app import PROFESSIONAL_CATEGORIES, app, backend
+    rng = random.Random(seed)
+    data = backend.load('default_user')
+    backend.save('default_user', data, {'op': 'set_mode', 'mode': 'professional'})
+    expenses = [{
+        'category': rng.choice(PROFESSIONAL_CATEGORIES),
+        'description': 'Seeded expense',
+        'amount': round(rng.uniform(1, 500), 2),
+        'date': f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00'
+    } for _ in range(rows)]
+    income = [{'source': 'Salary', 'amount': 5000.0, 'date': '2024-01-01 09:00:00'}]
+    backend.save('default_user', data, {'op': 'add_batch', 'income': income, 'expenses': expenses})
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookies.put(f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': 'default_user'})}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(name, data_dir):
+    """Start a server in data_dir and wait until it accepts connections"""
+    port = free_port()
+    command = [part.replace('{port}', str(port)) for part in SERVERS[name]]
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    process = subprocess.Popen(command, cwd=data_dir, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return process, port
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f'{name} server did not start')
+
+
+async def fetch(connection, port, path, cookie):
+    """Send one keep-alive GET, reconnecting when the server closed the socket"""
+    if connection[0] is None:
+        connection[:] = await asyncio.open_connection('127.0.0.1', port)
+    reader, writer = connection
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n'.encode('ascii'))
+    await writer.drain()
+    head = await reader.readuntil(b'\r\n\r\n')
+    headers = head.decode('latin-1').lower()
+    if not headers.startswith('http/1.1 200') and not headers.startswith('http/1.0 200'):
+        raise RuntimeError(headers.split('\r\n', 1)[0])
+    length = int(headers.split('content-length:', 1)[1].split('\r\n', 1)[0])
+    await reader.readexactly(length)
+    if 'connection: close' in headers or headers.startswith('http/1.0'):
+        writer.close()
+        connection[:] = [None, None]
+
+
+async def client(port, path, cookie, requests, latencies, errors):
+    connection = [None, None]
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            await fetch(connection, port, path, cookie)
+            latencies.append(time.perf_counter() - started)
+        except (OSError, RuntimeError, ValueError, IndexError, asyncio.IncompleteReadError):
+            errors.append(1)
+            if connection[1] is not None:
+                connection[1].close()
+            connection[:] = [None, None]
+    if connection[1] is not None:
+        connection[1].close()
+
+
+async def run_level(port, path, cookie, concurrency, requests):
+    """Run concurrency clients of requests each and summarize latencies"""
+    latencies, errors = [], []
+    started = time.perf_counter()
+    await asyncio.gather(*(client(port, path, cookie, requests, latencies, errors)
+                           for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000 if latencies else None
+
+    return {
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'requests_per_sec': len(latencies) / elapsed,
+        'p50_ms': percentile(0.50),
+        'p99_ms': percentile(0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10_000)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 100, 1000])
+    parser.add_argument('--requests', type=int, default=20, help='requests per client')
+    parser.add_argument('--path', default='/api/summary?lists=0')
+    parser.add_argument('--servers', nargs='+', default=list(SERVERS), choices=list(SERVERS))
+    args = parser.parse_args()
+
+    results = {
+        'rows': args.rows,
+        'path': args.path,
+        'storage': os.environ.get('BUDGET_BUDDY_STORAGE', 'json'),
+        'servers': {}
+    }
+    for name in args.servers:
+        with tempfile.TemporaryDirectory() as data_dir:
+            # app.py opens its storage on import, so seed from a child process
+            cookies = multiprocessing.Queue()
+            seeder = multiprocessing.Process(target=seed, args=(data_dir, args.rows, cookies))
+            seeder.start()
+            cookie = cookies.get()
+            seeder.join()
+            process, port = start_server(name, data_dir)
+            try:
+                # Warm the ledger cache so every level measures steady state
+                asyncio.run(run_level(port, args.path, cookie, 1, 3))
+                results['servers'][name] = [
+                    asyncio.run(run_level(port, args.path, cookie, concurrency, args.requests))
+                    for concurrency in args.concurrency
+                ]
+            finally:
+                process.terminate()
+                process.wait()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
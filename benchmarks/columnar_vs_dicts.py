@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Columnar vs Dict Benchmark
+Compares memory and aggregation time of the two transaction representations
+"""
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import ColumnarLedger, np
+
+CATEGORIES = [
+    "Housing & Rent", "Utilities", "Groceries", "Transportation",
+    "Healthcare", "Insurance", "Entertainment", "Dining Out",
+    "Shopping", "Savings & Investment", "Other"
+]
+DESCRIPTIONS = ["Weekly groceries", "Monthly rent", "Bus pass", "Movie tickets",
+                "Doctor visit", "Electricity bill", "Coffee", "Lunch"]
+
+
+def make_expenses(rows, seed=42):
+    """Generate dict-based expenses the way the ledger stores them"""
+    rng = random.Random(seed)
+    start = 1704067200  # 2024-01-01
+    expenses = []
+    for _ in range(rows):
+        epoch = start + rng.randrange(365 * 86400)
+        expenses.append({
+            'category': rng.choice(CATEGORIES),
+            'description': rng.choice(DESCRIPTIONS),
+            'amount': round(rng.uniform(1, 500), 2),
+            'date': time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+        })
+    return expenses
+
+
+def measure(build):
+    """Return (result, bytes allocated) for building a structure"""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def timed(function, repeat=3):
+    """Return the best wall time of several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def dict_breakdown(expenses, start, end):
+    totals = {}
+    for expense in expenses:
+        if start <= expense['date'] < end:
+            totals[expense['category']] = totals.get(expense['category'], 0) + expense['amount']
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    source = make_expenses(args.rows)
+    # Round-trip through JSON so the dicts look exactly like a loaded ledger
+    encoded = json.dumps(source)
+    del source
+
+    dicts, dict_bytes = measure(lambda: json.loads(encoded))
+    columns, column_bytes = measure(
+        lambda: ColumnarLedger.from_ledger({'income_sources': [], 'expenses': dicts}, CATEGORIES))
+
+    filters = {'from': '2024-03-01', 'to': '2024-05-31'}
+    results = {
+        'rows': args.rows,
+        'numpy': np is not None,
+        'dict_bytes': dict_bytes,
+        'columnar_bytes': column_bytes,
+        'dict_total_seconds': timed(lambda: sum(expense['amount'] for expense in dicts)),
+        'columnar_total_seconds': timed(lambda: columns.expenses.total()),
+        'dict_range_breakdown_seconds': timed(
+            lambda: dict_breakdown(dicts, filters['from'], filters['to'] + '~')),
+        'columnar_range_breakdown_seconds': timed(lambda: columns.summarize(filters))
+    }
+    results['memory_ratio'] = dict_bytes / column_bytes
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Fleet Report Scaling Benchmark
+Times fleet_report.py over generated sharded user files at several worker counts
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fleet_report import run_report
+from ledger_generator import generate_ledger, write_ledger
+from tenants import DATA_SUFFIX, shard_dir
+
+
+def write_fleet(data_dir, users, transactions, seed):
+    """Write one generated ledger per user into the sharded layout"""
+    rng = random.Random(seed)
+    for number in range(users):
+        user_id = f'{number:032x}'
+        directory = shard_dir(data_dir, user_id)
+        os.makedirs(directory, exist_ok=True)
+        mode = rng.choice(['student', 'professional'])
+        size = rng.randrange(1, 2 * transactions)
+        write_ledger(os.path.join(directory, user_id + DATA_SUFFIX),
+                     generate_ledger(mode, size, seed + number))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--transactions', type=int, default=50,
+                        help='average transactions per user')
+    parser.add_argument('--workers', type=int, nargs='+',
+                        help='worker counts to time (default: 1, 2, 4, ... up to the CPU count)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    cpus = os.cpu_count() or 1
+    workers = args.workers or sorted({1, cpus} | {2 ** n for n in range(1, cpus.bit_length())
+                                                  if 2 ** n <= cpus})
+    with tempfile.TemporaryDirectory() as data_dir:
+        started = time.perf_counter()
+        write_fleet(data_dir, args.users, args.transactions, args.seed)
+        results = {
+            'python': sys.version.split()[0],
+            'cpus': cpus,
+            'users': args.users,
+            'generate_seconds': time.perf_counter() - started,
+            'runs': []
+        }
+        baseline = None
+        for count in workers:
+            report = run_report(data_dir, workers=count)
+            seconds = report['elapsed_seconds']
+            baseline = baseline or seconds
+            results['runs'].append({
+                'workers': count,
+                'seconds': seconds,
+                'ledgers_per_sec': report['ledgers'] / seconds,
+                'speedup': baseline / seconds
+            })
+            print(f"✓ {count} workers: {seconds:.2f}s", file=sys.stderr)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
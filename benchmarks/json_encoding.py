@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+JSON Encoding Benchmark
+Compares file size, dump and parse time of the snapshot encodings, and response bytes per content encoding
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ledger import ensure_aggregates
+from ledger_generator import generate_ledger
+from serialization import JSON_BACKEND, compress, dumps, loads, negotiate_encoding
+
+
+def best_time(function, repeat):
+    """Return the best wall time of several runs"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--transactions', type=int, default=100_000)
+    parser.add_argument('--mode', choices=['student', 'professional'], default='professional')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    data = generate_ledger(args.mode, args.transactions)
+    ensure_aggregates(data)
+    # name: (encode, decode)
+    encodings = {
+        'indented (json, indent=2)': (lambda: json.dumps(data, indent=2).encode('utf-8'), json.loads),
+        'compact (json)': (lambda: json.dumps(data, separators=(',', ':')).encode('utf-8'), json.loads),
+        f'compact ({JSON_BACKEND})': (lambda: dumps(data), loads)
+    }
+    results = {'python': sys.version.split()[0], 'backend': JSON_BACKEND,
+               'transactions': args.transactions, 'snapshot': {}, 'response': {}}
+    for name, (encode, decode) in encodings.items():
+        payload = encode()
+        results['snapshot'][name] = {
+            'bytes': len(payload),
+            'dump_seconds': best_time(encode, args.repeat),
+            'parse_seconds': best_time(lambda: decode(payload), args.repeat)
+        }
+
+    # A /api/expenses page of the largest allowed size, as sent on the wire
+    body = dumps({'expenses': data['expenses'][-1000:], 'next_cursor': None})
+    results['response']['identity'] = len(body)
+    for encoding in ('gzip', 'br'):
+        if negotiate_encoding(encoding) == encoding:
+            results['response'][encoding] = len(compress(body, encoding))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Synthetic Ledger Generator
+Seeded, realistic student and professional ledgers of any size
+"""
+
+import argparse
+import calendar
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ledger import compute_aggregates
+
+# Per mode: recurring monthly income, then (category, weight, amount range,
+# descriptions) for everyday expenses. Weights are relative frequencies.
+PROFILES = {
+    'student': {
+        'income': [("Monthly Allowance", 400, 700), ("Part-time Job", 300, 900)],
+        'expenses': [
+            ("Food & Dining", 30, (3, 40), ["Canteen lunch", "Groceries", "Coffee", "Pizza night"]),
+            ("Transportation", 15, (1, 25), ["Bus fare", "Metro card top-up", "Cab ride"]),
+            ("Entertainment", 10, (5, 60), ["Movie tickets", "Streaming subscription", "Concert"]),
+            ("Books & Supplies", 8, (5, 120), ["Textbook", "Stationery", "Lab manual"]),
+            ("Personal Care", 8, (3, 50), ["Haircut", "Toiletries", "Pharmacy"]),
+            ("Accommodation", 2, (150, 600), ["Hostel fee", "Room rent"]),
+            ("Tuition & Fees", 1, (200, 2500), ["Semester fee", "Exam fee"]),
+            ("Other", 6, (1, 80), ["Gift", "Miscellaneous"])
+        ]
+    },
+    'professional': {
+        'income': [("Monthly Salary", 3500, 7000), ("Freelance Project", 200, 2000)],
+        'expenses': [
+            ("Groceries", 25, (10, 180), ["Weekly groceries", "Supermarket run", "Farmers market"]),
+            ("Dining Out", 18, (8, 120), ["Lunch with team", "Dinner out", "Coffee"]),
+            ("Transportation", 15, (2, 90), ["Fuel", "Parking", "Train ticket", "Taxi"]),
+            ("Shopping", 10, (10, 400), ["Clothes", "Electronics", "Household items"]),
+            ("Entertainment", 8, (5, 150), ["Cinema", "Streaming subscription", "Concert"]),
+            ("Utilities", 4, (30, 250), ["Electricity bill", "Water bill", "Internet"]),
+            ("Healthcare", 3, (15, 400), ["Doctor visit", "Pharmacy", "Dental checkup"]),
+            ("Insurance", 1, (50, 400), ["Car insurance", "Health insurance"]),
+            ("Housing & Rent", 1, (800, 2500), ["Monthly rent"]),
+            ("Savings & Investment", 2, (100, 1500), ["Index fund", "Savings transfer"]),
+            ("Other", 5, (1, 100), ["Gift", "Miscellaneous"])
+        ]
+    }
+}
+
+# Roughly one income entry per this many transactions
+INCOME_EVERY = 40
+
+
+def generate_ledger(mode, transactions, seed=42, start_year=2020):
+    """Generate a ledger of about ``transactions`` entries, oldest first.
+
+    The same mode, size and seed always give the same ledger. Entries are
+    spread across as many months as keeps the per-month volume plausible.
+    """
+    rng = random.Random(seed)
+    profile = PROFILES[mode]
+    categories = [expense[0] for expense in profile['expenses']]
+    weights = [expense[1] for expense in profile['expenses']]
+    months = max(1, min(transactions // 60, 240))
+    start = calendar.timegm((start_year, 1, 1, 0, 0, 0))
+    span = months * 30 * 86400
+
+    epochs = sorted(start + rng.randrange(span) for _ in range(transactions))
+    income_sources = []
+    expenses = []
+    for epoch in epochs:
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(epoch))
+        if rng.randrange(INCOME_EVERY) == 0:
+            source, low, high = rng.choice(profile['income'])
+            income_sources.append({'source': source, 'amount': round(rng.uniform(low, high), 2),
+                                   'date': date})
+            continue
+        index = rng.choices(range(len(categories)), weights)[0]
+        category, _, (low, high), descriptions = profile['expenses'][index]
+        expenses.append({
+            'category': category,
+            'description': rng.choice(descriptions),
+            'amount': round(rng.uniform(low, high), 2),
+            'date': date
+        })
+
+    data = {'mode': mode, 'income_sources': income_sources, 'expenses': expenses}
+    data['aggregates'] = compute_aggregates(data)
+    return data
+
+
+def write_ledger(path, data):
+    """Write a generated ledger as a snapshot file, returning its size in bytes"""
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+    return os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('mode', choices=list(PROFILES))
+    parser.add_argument('transactions', type=int)
+    parser.add_argument('-o', '--output', default='budget_data.json')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    size = write_ledger(args.output, generate_ledger(args.mode, args.transactions, args.seed))
+    print(f"✓ Wrote {args.transactions} {args.mode} transactions to {args.output} ({size} bytes)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Benchmark Suite
+Times the CLI, the web helpers and every API route on generated ledgers
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from ledger_generator import generate_ledger, write_ledger
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+
+NEW_EXPENSE = {'category': 'Other', 'description': 'Benchmark', 'amount': 1.0}
+
+GET_ROUTES = [
+    '/api/mode',
+    '/api/categories',
+    '/api/income',
+    '/api/expenses',
+    '/api/expenses?from=2020-06-01&to=2020-06-30',
+    '/api/summary',
+    '/api/summary?lists=0',
+    '/api/summary?from=2020-01-01&to=2020-12-31&lists=0',
+    '/api/trends?granularity=month',
+    '/api/trends?granularity=day',
+    '/api/forecast?months=24',
+    '/api/export?format=csv',
+    '/api/export?format=ndjson&gzip=1'
+]
+
+
+def timed(function, repeat, setup=None):
+    """Return the best wall time of several runs, calling setup untimed before each"""
+    best = float('inf')
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_cli(data, repeat):
+    """Time BudgetBuddy methods against a budget_data.json in the working directory, then in binary"""
+    write_ledger('budget_data.json', data)
+    with contextlib.redirect_stdout(io.StringIO()):
+        from budget_buddy import BudgetBuddy
+        buddy = BudgetBuddy()
+        expense = dict(NEW_EXPENSE, date=data['expenses'][-1]['date'])
+        results = {
+            'load_data': timed(buddy.load_data, repeat),
+            'save_data_record': timed(
+                lambda: buddy.save_data({'op': 'add_expense', 'entry': expense}), repeat),
+            'save_data_snapshot': timed(buddy.save_data, repeat),
+            'calculate_totals': timed(lambda: (buddy.calculate_total_income(),
+                                               buddy.calculate_total_expenses(),
+                                               buddy.calculate_balance()), repeat),
+            'view_summary': timed(buddy.view_summary, repeat)
+        }
+        # Startup and a summary straight off the memory-mapped binary format
+        buddy.convert_data('binary')
+        results['binary'] = {
+            'file_bytes': os.path.getsize('budget_data.json'),
+            'startup': timed(BudgetBuddy, repeat),
+            'startup_and_summary': timed(lambda: BudgetBuddy().view_summary(), repeat),
+            'load_data_full': timed(lambda: BudgetBuddy().data, repeat)
+        }
+    return results
+
+
+def bench_web(data, repeat):
+    """Time app.py helpers and routes through the Flask test client"""
+    import app
+    user_id = f"bench_{data['mode']}"
+    # Seed through the backend so BUDGET_BUDDY_STORAGE=sqlite works too
+    app.backend.load(user_id)
+    app.backend.save(user_id, data)
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['user_id'] = user_id
+
+    def cold():
+        if hasattr(app.backend, 'cache'):
+            app.backend.cache.invalidate(user_id)
+
+    results = {}
+    with app.app.test_request_context():
+        app.session['user_id'] = user_id
+        results['load_user_data_cold'] = timed(app.load_user_data, repeat, setup=cold)
+        results['load_user_data_warm'] = timed(app.load_user_data, repeat)
+        loaded = app.load_user_data()
+        expense = dict(NEW_EXPENSE, date=data['expenses'][-1]['date'])
+        results['save_user_data_record'] = timed(
+            lambda: app.save_user_data(app.load_user_data(), {'op': 'add_expense', 'entry': expense}),
+            repeat)
+        results['calculate_totals'] = timed(lambda: app.calculate_totals(loaded), repeat)
+        results['get_category_breakdown'] = timed(lambda: app.get_category_breakdown(loaded), repeat)
+        results['forecast_cold'] = timed(
+            lambda: app.cached_forecast(user_id, loaded, 24, app.DEFAULT_PATHS), repeat,
+            setup=app.forecasts.clear)
+
+    def get(path):
+        response = client.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        response.get_data()
+
+    routes = {path: timed(lambda: get(path), repeat) for path in GET_ROUTES}
+    routes['POST /api/expenses'] = timed(
+        lambda: client.post('/api/expenses', json={'category': 'Other', 'amount': 1}), repeat)
+    routes['DELETE /api/expenses'] = timed(
+        lambda: client.delete('/api/expenses', json={'index': 0}), repeat)
+    etag = client.get('/api/summary?lists=0').headers['ETag']
+    routes['/api/summary (304)'] = timed(
+        lambda: client.get('/api/summary', headers={'If-None-Match': etag}), repeat)
+    results['routes'] = routes
+    return results
+
+
+def run_case(mode, size, seed, repeat, queue):
+    """Generate one ledger and benchmark it in a fresh working directory"""
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        started = time.perf_counter()
+        data = generate_ledger(mode, size, seed)
+        generate_seconds = time.perf_counter() - started
+        file_bytes = write_ledger('generated.json', data)
+        result = {
+            'mode': mode,
+            'transactions': size,
+            'file_bytes': file_bytes,
+            'generate_seconds': generate_seconds,
+            'cli': bench_cli(data, repeat),
+            'web': bench_web(data, repeat)
+        }
+        # ru_maxrss is KiB on Linux
+        result['peak_rss_bytes'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    queue.put(result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='transaction counts (add 10000000 for the largest tier)')
+    parser.add_argument('--modes', nargs='+', default=['student', 'professional'],
+                        choices=['student', 'professional'])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('-o', '--output', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {
+        'python': sys.version.split()[0],
+        'storage': os.environ.get('BUDGET_BUDDY_STORAGE', 'json'),
+        'seed': args.seed,
+        'repeat': args.repeat,
+        'cases': []
+    }
+    for mode in args.modes:
+        for size in args.sizes:
+            # One process per case keeps peak memory and caches separate
+            queue = multiprocessing.Queue()
+            process = multiprocessing.Process(target=run_case,
+                                              args=(mode, size, args.seed, args.repeat, queue))
+            process.start()
+            process.join()
+            if process.exitcode:
+                sys.exit(f"✗ {mode} {size} failed")
+            results['cases'].append(queue.get())
+            print(f"✓ {mode} {size}", file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
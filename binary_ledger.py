@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Binary Ledger
+Fixed-width transaction records and a string table, read through mmap
+"""
+
+import json
+import mmap
+import struct
+import sys
+from array import array
+
+from ledger import compute_aggregates
+from serialization import dumps as dumps_json, loads
+
+# columnar (and through it NumPy) is imported only by the functions that
+# decode records, so mapping a file or reading its header stays cheap
+
+MAGIC = b'BBLEDGR\x01'
+
+# magic, journal seq, income count, expense count, string count, then the
+# offsets of the string table, the meta block and the aggregates block
+HEADER = struct.Struct('<8s7Q')
+
+# amount, epoch seconds, category string, label string, extras string and
+# entry id (0 for none, as in files written before entries had ids)
+RECORD = struct.Struct('<dqIIII')
+
+# String index meaning "no string": the key is absent from the entry
+NO_STRING = 0xFFFFFFFF
+
+# Entry keys with a fixed-width slot, per kind
+SLOT_KEYS = {
+    'income_sources': ('source', 'amount', 'date', 'id'),
+    'expenses': ('category', 'description', 'amount', 'date', 'id')
+}
+LABEL_KEYS = {'income_sources': 'source', 'expenses': 'description'}
+LEDGER_KEYS = ('journal_seq', 'income_sources', 'expenses', 'aggregates')
+
+RECORD_FIELDS = {
+    'names': ['amount', 'epoch', 'category', 'label', 'extras', 'id'],
+    'formats': ['<f8', '<i8', '<u4', '<u4', '<u4', '<u4'],
+    'offsets': [0, 8, 16, 20, 24, 28],
+    'itemsize': RECORD.size
+}
+
+
+def is_binary_ledger(path):
+    """Check whether a file starts with the binary ledger magic"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def header_seq(head):
+    """Return the journal seq from the first HEADER.size bytes of a binary ledger"""
+    return HEADER.unpack_from(head)[1]
+
+
+def _epoch_parser():
+    """Return a function mapping canonical ledger timestamps to epoch seconds.
+
+    Anything that would not format back to the same string maps to None.
+    Days and times of day are parsed once each and cached.
+    """
+    from columnar import from_epoch, to_epoch
+    days = {}
+    clocks = {}
+
+    def parse_day(day):
+        try:
+            start = to_epoch(day + ' 00:00:00')
+        except (ValueError, OverflowError, OSError):
+            return None
+        return start if from_epoch(start)[:10] == day else None
+
+    def parse_clock(clock):
+        digits = clock[0:2] + clock[3:5] + clock[6:8]
+        if clock[2:3] != ':' or clock[5:6] != ':' or not (digits.isascii() and digits.isdigit()):
+            return None
+        hours, minutes, seconds = int(digits[0:2]), int(digits[2:4]), int(digits[4:6])
+        if hours > 23 or minutes > 59 or seconds > 59:
+            return None
+        return hours * 3600 + minutes * 60 + seconds
+
+    def parse(date):
+        if type(date) is not str or len(date) != 19 or date[10] != ' ':
+            return None
+        day, clock = date[:10], date[11:]
+        start = days[day] if day in days else days.setdefault(day, parse_day(day))
+        seconds = clocks[clock] if clock in clocks else clocks.setdefault(clock, parse_clock(clock))
+        if start is None or seconds is None:
+            return None
+        return start + seconds
+
+    return parse
+
+
+def _epoch_formatter():
+    """Return a cached inverse of _epoch_parser"""
+    from columnar import from_epoch
+    days = {}
+    clocks = {}
+
+    def format(epoch):
+        day, seconds = divmod(epoch, 86400)
+        text = days.get(day)
+        if text is None:
+            text = days[day] = from_epoch(day * 86400)[:10] + ' '
+        clock = clocks.get(seconds)
+        if clock is None:
+            clock = clocks[seconds] = from_epoch(seconds)[11:]
+        return text + clock
+
+    return format
+
+
+def _pack_fields(entry, kind, intern, parse_epoch):
+    """Split an entry into record fields.
+
+    Anything a slot cannot hold exactly (an int amount, a date that does
+    not round-trip through epoch seconds, a non-string label, an id
+    outside 1..2**32-1 or an unknown key) is kept as JSON in the entry's
+    extras string.
+    """
+    slots = SLOT_KEYS[kind]
+    extras = {key: value for key, value in entry.items() if key not in slots}
+
+    amount = entry['amount']
+    if type(amount) is not float:
+        extras['amount'] = amount
+        amount = float(amount) if type(amount) is int else 0.0
+
+    epoch = parse_epoch(entry['date'])
+    if epoch is None:
+        epoch = 0
+        extras['date'] = entry['date']
+
+    entry_id = entry.get('id', 0)
+    if 'id' in entry and (type(entry_id) is not int or not 0 < entry_id <= NO_STRING):
+        extras['id'] = entry_id
+        entry_id = 0
+
+    def string(key):
+        if key not in slots or key not in entry:
+            return NO_STRING
+        if type(entry[key]) is not str:
+            extras[key] = entry[key]
+            return NO_STRING
+        return intern(entry[key])
+
+    category = string('category')
+    label = string(LABEL_KEYS[kind])
+    extras_index = intern(json.dumps(extras)) if extras else NO_STRING
+    return amount, epoch, category, label, extras_index, entry_id
+
+
+def dumps(data, journal_seq=0):
+    """Encode a dict-based ledger in the binary format"""
+    strings = {}
+
+    def intern(value):
+        index = strings.get(value)
+        if index is None:
+            index = strings[value] = len(strings)
+        return index
+
+    parse_epoch = _epoch_parser()
+    income = data.get('income_sources', [])
+    expenses = data.get('expenses', [])
+    records = bytearray(RECORD.size * (len(income) + len(expenses)))
+    offset = 0
+    for kind, entries in (('income_sources', income), ('expenses', expenses)):
+        for entry in entries:
+            RECORD.pack_into(records, offset, *_pack_fields(entry, kind, intern, parse_epoch))
+            offset += RECORD.size
+
+    # Strings are stored back to back, indexed by an array of n + 1 offsets
+    blob = [value.encode('utf-8', 'surrogatepass') for value in strings]
+    offsets = array('Q', [0])
+    for encoded in blob:
+        offsets.append(offsets[-1] + len(encoded))
+    if sys.byteorder == 'big':
+        offsets.byteswap()
+
+    meta = {key: value for key, value in data.items() if key not in LEDGER_KEYS}
+    meta = dumps_json(meta)
+    aggregates = dumps_json(data.get('aggregates') or compute_aggregates(data))
+
+    strings_offset = HEADER.size + len(records)
+    meta_offset = strings_offset + len(offsets) * offsets.itemsize + sum(map(len, blob))
+    header = HEADER.pack(MAGIC, journal_seq, len(income), len(expenses), len(strings),
+                         strings_offset, meta_offset, meta_offset + len(meta))
+    return b''.join([header, records, offsets.tobytes(), *blob, meta, aggregates])
+
+
+class BinaryLedger:
+    """A binary ledger file mapped read-only into memory.
+
+    Opening reads only the fixed header and the small meta block, so it
+    costs the same for ten entries or ten million. Entries are decoded on
+    demand, and columns() scans the records without building dicts.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, self.journal_seq, self.income_count, self.expense_count, self.string_count,
+         self._strings_offset, self._meta_offset, self._aggregates_offset) = HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self._map.close()
+            raise ValueError(f"Not a binary ledger: {path}")
+        self._blob_offset = self._strings_offset + 8 * (self.string_count + 1)
+        self._strings = {}
+        self.meta = loads(self._map[self._meta_offset:self._aggregates_offset])
+
+    @property
+    def mode(self):
+        return self.meta.get('mode')
+
+    def close(self):
+        """Unmap the file"""
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def string(self, index):
+        """Decode one string from the string table"""
+        value = self._strings.get(index)
+        if value is None:
+            start, end = struct.unpack_from('<QQ', self._map, self._strings_offset + 8 * index)
+            value = self._map[self._blob_offset + start:self._blob_offset + end].decode(
+                'utf-8', 'surrogatepass')
+            self._strings[index] = value
+        return value
+
+    def _span(self, kind):
+        """Return (byte offset, count) of one kind's records"""
+        if kind == 'income_sources':
+            return HEADER.size, self.income_count
+        return HEADER.size + RECORD.size * self.income_count, self.expense_count
+
+    def iter_entries(self, kind):
+        """Decode one kind's entries into dicts, oldest first"""
+        label_key = LABEL_KEYS[kind]
+        format_epoch = _epoch_formatter()
+        start, count = self._span(kind)
+        for amount, epoch, category, label, extras, entry_id in RECORD.iter_unpack(
+                self._map[start:start + RECORD.size * count]):
+            entry = {}
+            if category != NO_STRING:
+                entry['category'] = self.string(category)
+            if label != NO_STRING:
+                entry[label_key] = self.string(label)
+            entry['amount'] = amount
+            entry['date'] = format_epoch(epoch)
+            if entry_id:
+                entry['id'] = entry_id
+            if extras != NO_STRING:
+                entry.update(json.loads(self.string(extras)))
+            yield entry
+
+    def to_ledger(self):
+        """Decode the whole file into a dict-based ledger"""
+        data = dict(self.meta)
+        data['income_sources'] = list(self.iter_entries('income_sources'))
+        data['expenses'] = list(self.iter_entries('expenses'))
+        data['aggregates'] = loads(self._map[self._aggregates_offset:])
+        return data
+
+    def columns(self, categories=()):
+        """Build a ColumnarLedger straight from the records"""
+        from columnar import ColumnarLedger, np
+        ledger = ColumnarLedger(categories)
+        for kind, columns in (('income_sources', ledger.income), ('expenses', ledger.expenses)):
+            start, count = self._span(kind)
+            if not count:
+                continue
+            if np is None:
+                for amount, epoch, category, label, _, entry_id in RECORD.iter_unpack(
+                        self._map[start:start + RECORD.size * count]):
+                    columns.ids.append(entry_id)
+                    columns.amounts.append(amount)
+                    columns.epochs.append(epoch)
+                    columns.codes.append(0 if category == NO_STRING else columns.code(self.string(category)))
+                    columns.labels.append(sys.intern(self.string(label)) if label != NO_STRING else '')
+                continue
+
+            records = np.frombuffer(self._map, np.dtype(RECORD_FIELDS), count, start)
+            columns.ids.frombytes(records['id'].astype(np.int64).tobytes())
+            columns.amounts.frombytes(records['amount'].astype(np.float64).tobytes())
+            columns.epochs.frombytes(records['epoch'].astype(np.int64).tobytes())
+            # Map each distinct string index once, then gather per record
+            indexes, inverse = np.unique(records['category'], return_inverse=True)
+            codes = np.array([0 if index == NO_STRING else columns.code(self.string(int(index)))
+                              for index in indexes], dtype=np.uint16)
+            columns.codes.frombytes(codes[inverse].tobytes())
+            indexes, inverse = np.unique(records['label'], return_inverse=True)
+            labels = np.array([sys.intern(self.string(int(index))) if index != NO_STRING else ''
+                               for index in indexes], dtype=object)
+            columns.labels = labels[inverse].tolist()
+            # Drop the view so the map can be closed
+            del records
+        return ledger
@@ -4,16 +4,40 @@ Budget Buddy - Personal Finance Management System
 A console-based application for tracking income, expenses, and savings
 """
 
-import os
+import argparse
+import contextlib
 import json
-from datetime import datetime
+import math
+import os
+import sys
+from datetime import date, datetime
+
+from binary_ledger import is_binary_ledger
+from budgets import budget_limits, budget_status, month_spent, parse_limit, record_alerts
+from ledger import (RULE_OPS, apply_record, apply_rule_record, empty_ledger, ensure_aggregates,
+                    rollup_series, summarize_aggregates)
+from recurring import (CADENCES, combine_summaries, describe_rule, merge_series, parse_rule,
+                       recurring_rules, rule_span, rules_month_spent, summarize_rules)
+from storage import JournalStore
+
+# columnar and forecast (NumPy), exporter, importer and search are imported where they are used,
+# so batch subcommands only pay for what they run
 
 class BudgetBuddy:
-    def __init__(self):
-        self.mode = None
-        self.income_sources = []
-        self.expenses = []
+    def __init__(self, load=True):
+        self._data = empty_ledger()
+        self._columns = None
+        self._search = None
+        self._forecasts = None
+        # Set while a binary snapshot is mapped but not yet decoded
+        self.binary = None
+        self._mode = None
+        # Budget limits and recurring rules while the ledger itself is not loaded
+        self._budgets = {}
+        self._recurring = []
+        self._pending = []
         self.data_file = "budget_data.json"
+        self.store = JournalStore(self.data_file)
         
         # Mode-specific expense categories
         self.student_categories = [
@@ -41,41 +65,149 @@ class BudgetBuddy:
             "Other"
         ]
         
-        self.load_data()
+        if load:
+            self.load_data()
+        else:
+            # Batch commands only append, so read just the mode for now
+            self._data = None
+            self._mode = self.store.mode()
+    
+    @property
+    def data(self):
+        """Dict-based ledger, loaded on first use after a binary or batch startup"""
+        if self._data is None:
+            self._data = self.store.load()
+            if self.binary is not None:
+                self.binary.close()
+                self.binary = None
+            self._pending = []
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        self._data = value
+        self._search = None
+    
+    @property
+    def mode(self):
+        return self._mode if self._data is None else self.data['mode']
+    
+    @mode.setter
+    def mode(self, value):
+        if self._data is None:
+            self._mode = value
+        else:
+            self.data['mode'] = value
+    
+    @property
+    def budgets(self):
+        """Monthly limit per category"""
+        return self._budgets if self._data is None else budget_limits(self.data)
+    
+    @property
+    def recurring(self):
+        """Recurring income and expense rules"""
+        return self._recurring if self._data is None else recurring_rules(self.data)
+    
+    @property
+    def income_sources(self):
+        return self.data['income_sources']
+    
+    @property
+    def expenses(self):
+        return self.data['expenses']
+    
+    @property
+    def columns(self):
+        """Columnar copy of the ledger, built on first use"""
+        if self._columns is None:
+            if self.binary is not None:
+                self._columns = self.binary.columns()
+                for record in self._pending:
+                    try:
+                        self._columns.apply(record)
+                    except (IndexError, KeyError):
+                        # A delete or update that lost a race for the same entry
+                        pass
+                self._pending = []
+            else:
+                from columnar import ColumnarLedger
+                self._columns = ColumnarLedger.from_ledger(self.data)
+        return self._columns
     
     def load_data(self):
         """Load data from file if exists"""
-        if os.path.exists(self.data_file):
+        if os.path.exists(self.data_file) or os.path.exists(self.store.journal_path):
             try:
-                with open(self.data_file, 'r') as f:
-                    data = json.load(f)
-                    self.mode = data.get('mode')
-                    self.income_sources = data.get('income_sources', [])
-                    self.expenses = data.get('expenses', [])
+                self._columns = None
+                self._search = None
+                if is_binary_ledger(self.data_file):
+                    # Map the binary snapshot; entries are only decoded on demand
+                    self.binary, records = self.store.load_binary()
+                    self._data = None
+                    self._mode = self.binary.mode
+                    self._budgets = dict(self.binary.meta.get('budgets', {}))
+                    self._recurring = list(self.binary.meta.get('recurring', []))
+                    self._pending = []
+                    for record in records:
+                        self.apply(record)
+                else:
+                    self.data = self.store.load()
                 print("✓ Previous session data loaded successfully!\n")
             except Exception as e:
                 print(f"⚠ Error loading data: {e}\n")
     
-    def save_data(self):
-        """Save data to file"""
+    def apply(self, record):
+        """Apply a change record to whichever in-memory views are loaded"""
+        if self._search is not None:
+            self._search.apply(self._data, record)
+        elif self._data is not None:
+            apply_record(self._data, record)
+        elif record['op'] == 'set_mode':
+            self._mode = record['mode']
+        elif record['op'] == 'set_budget':
+            if record['limit'] is None:
+                self._budgets.pop(record['category'], None)
+            else:
+                self._budgets[record['category']] = record['limit']
+        elif record['op'] in RULE_OPS:
+            # Journaled rules already carry their id
+            apply_rule_record(self._recurring, record)
+        elif record['op'] == 'clear':
+            self._recurring = []
+        if self._columns is not None:
+            self._columns.apply(record)
+        elif self.binary is not None:
+            self._pending.append(record)
+    
+    def save_data(self, record=None):
+        """Save data to file, applying and journaling a single record when given"""
+        if record is not None:
+            self.apply(record)
         try:
-            data = {
-                'mode': self.mode,
-                'income_sources': self.income_sources,
-                'expenses': self.expenses
-            }
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f, indent=2)
+            if record is None:
+                # A mapped binary snapshot has nothing beyond the journal to save
+                if self._data is not None:
+                    self.store.write_snapshot(self.data)
+            else:
+                self.store.append(record)
             print("✓ Data saved successfully!")
         except Exception as e:
             print(f"⚠ Error saving data: {e}")
     
+    def close(self):
+        """Finish compaction before exiting; every change is already journaled"""
+        self.store.wait_for_compaction()
+        if (self.store.journal_records >= self.store.max_records
+                or self.store.journal_bytes >= self.store.max_bytes):
+            self.store.compact(blocking=False)
+    
     def get_positive_float(self, prompt):
         """Validate and get positive float input"""
         while True:
             try:
                 value = float(input(prompt))
-                if value <= 0:
+                if not (value > 0 and math.isfinite(value)):
                     print("⚠ Please enter a positive value!")
                     continue
                 return value
@@ -108,6 +240,8 @@ class BudgetBuddy:
                 break
             else:
                 print("⚠ Invalid choice! Please select 1 or 2.")
+        
+        self.save_data({'op': 'set_mode', 'mode': self.mode})
     
     def add_income(self):
         """Add income source"""
@@ -134,9 +268,8 @@ class BudgetBuddy:
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        self.income_sources.append(income_entry)
         print(f"\n✓ Income of ₹{amount:.2f} from '{source}' added successfully!")
-        self.save_data()
+        self.save_data({'op': 'add_income', 'entry': income_entry})
     
     def add_expense(self):
         """Add expense"""
@@ -178,27 +311,59 @@ class BudgetBuddy:
             'date': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         }
         
-        self.expenses.append(expense_entry)
         print(f"\n✓ Expense of ₹{amount:.2f} for '{description}' added successfully!")
+        record = {'op': 'add_expense', 'entry': expense_entry}
+        self.save_data(record)
         
         # Check budget status
-        self.check_budget_alert()
-        self.save_data()
+        self.check_budget_alert(record)
     
     def calculate_total_income(self):
-        """Calculate total income"""
-        return sum(income['amount'] for income in self.income_sources)
+        """Calculate total income, including recurring income due so far"""
+        if self._data is None:
+            total = self.columns.income.total()
+        else:
+            total = ensure_aggregates(self.data)['total_income']
+        return total + summarize_rules(self.recurring)[0]
     
     def calculate_total_expenses(self):
-        """Calculate total expenses"""
-        return sum(expense['amount'] for expense in self.expenses)
+        """Calculate total expenses, including recurring expenses due so far"""
+        if self._data is None:
+            total = self.columns.expenses.total()
+        else:
+            total = ensure_aggregates(self.data)['total_expenses']
+        return total + summarize_rules(self.recurring)[1]
     
     def calculate_balance(self):
         """Calculate current balance"""
         return self.calculate_total_income() - self.calculate_total_expenses()
     
-    def check_budget_alert(self):
-        """Check if expenses exceed income"""
+    def month_spent(self, category, month):
+        """Return the spending in one category and YYYY-MM month"""
+        if self._data is None:
+            # A mapped binary snapshot has columns but no maintained rollups
+            spent = self.columns.summarize({'from': month, 'to': month})[2].get(category, 0.0)
+        else:
+            spent = month_spent(ensure_aggregates(self.data), category, month)
+        return spent + rules_month_spent(self.recurring, category, month)
+    
+    def print_budget_alert(self, alert):
+        """Print a category budget warning or overspend alert"""
+        if alert['level'] == 'exceeded':
+            print("\n" + "!"*50)
+            print(f"⚠ BUDGET ALERT: {alert['category']} is over its limit for {alert['month']}!")
+            print(f"Overspending: ₹{-alert['remaining']:.2f} (₹{alert['spent']:.2f} of ₹{alert['limit']:.2f})")
+            print("!"*50)
+        else:
+            print(f"\n⚠ Warning: You've used {alert['percentage']:.0f}% of your "
+                  f"{alert['category']} budget for {alert['month']}!")
+    
+    def check_budget_alert(self, record=None):
+        """Check the category limits a record touched, then whether expenses exceed income"""
+        if record is not None:
+            for alert in record_alerts(self.budgets, record, record.get('entry'), self.month_spent):
+                self.print_budget_alert(alert)
+        
         total_income = self.calculate_total_income()
         total_expenses = self.calculate_total_expenses()
         
@@ -224,24 +389,41 @@ class BudgetBuddy:
         total_expenses = self.calculate_total_expenses()
         balance = self.calculate_balance()
         
+        if self._data is None:
+            # Scan the mapped records instead of decoding every entry
+            income_rows = list(zip(self.columns.income.labels, self.columns.income.amounts))
+            expense_count = len(self.columns.expenses)
+            aggregated = self.columns.expenses.category_totals()
+        else:
+            income_rows = [(income['source'], income['amount']) for income in self.income_sources]
+            expense_count = len(self.expenses)
+            aggregated = {cat: bucket['amount']
+                          for cat, bucket in ensure_aggregates(self.data)['categories'].items()}
+        
+        # Each recurring rule is one row, totalling its occurrences so far
+        for rule in self.recurring:
+            first, stop = rule_span(rule)
+            if rule['type'] == 'income':
+                income_rows.append((f"{rule['source']} ({rule['cadence']})", rule['amount'] * (stop - first)))
+            elif stop > first:
+                expense_count += stop - first
+                aggregated[rule['category']] = aggregated.get(rule['category'], 0) + rule['amount'] * (stop - first)
+        
         # Income Summary
         print(f"\n{'INCOME SOURCES':-^50}")
-        if self.income_sources:
-            for income in self.income_sources:
-                print(f"  {income['source']:<30} ₹{income['amount']:>10.2f}")
+        if income_rows:
+            for source, amount in income_rows:
+                print(f"  {source:<30} ₹{amount:>10.2f}")
             print(f"  {'Total Income:':<30} ₹{total_income:>10.2f}")
         else:
             print("  No income recorded yet.")
         
         # Expense Summary
         print(f"\n{'EXPENSES':-^50}")
-        if self.expenses:
+        if expense_count:
             # Category-wise breakdown
             categories = self.student_categories if self.mode == 'student' else self.professional_categories
-            category_totals = {cat: 0 for cat in categories}
-            
-            for expense in self.expenses:
-                category_totals[expense['category']] += expense['amount']
+            category_totals = {cat: aggregated.get(cat, 0) for cat in categories}
             
             print("\nCategory-wise Breakdown:")
             for category, amount in category_totals.items():
@@ -268,6 +450,136 @@ class BudgetBuddy:
         
         print("="*50)
     
+    def view_range_summary(self):
+        """Display totals and category breakdown for a date range"""
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("DATE RANGE SUMMARY")
+        print("="*50)
+        
+        filters = {}
+        for key, label in (('from', "From date (YYYY-MM-DD, blank for start): "),
+                           ('to', "To date (YYYY-MM-DD, blank for latest): ")):
+            value = input(label).strip()
+            if value:
+                try:
+                    datetime.strptime(value, "%Y-%m-%d")
+                except ValueError:
+                    print("⚠ Invalid date! Please use YYYY-MM-DD.")
+                    return
+                filters[key] = value
+        
+        self.print_range_summary(filters)
+    
+    def print_range_summary(self, filters):
+        """Print totals and category breakdown for from/to date filters"""
+        total_income, total_expenses, category_totals = self.summarize(filters)
+        
+        print(f"\n{'CATEGORY-WISE BREAKDOWN':-^50}")
+        categories = self.student_categories if self.mode == 'student' else self.professional_categories
+        for category in categories:
+            amount = category_totals.get(category, 0)
+            if amount > 0:
+                percentage = (amount / total_expenses * 100) if total_expenses > 0 else 0
+                print(f"  {category:<30} ₹{amount:>10.2f} ({percentage:>5.1f}%)")
+        
+        print(f"\n  {'Total Income:':<30} ₹{total_income:>10.2f}")
+        print(f"  {'Total Expenses:':<30} ₹{total_expenses:>10.2f}")
+        print(f"  {'Balance:':<30} ₹{total_income - total_expenses:>10.2f}")
+        print("="*50)
+    
+    def view_monthly_report(self):
+        """Display income, expenses and top category for each month"""
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("MONTHLY REPORT")
+        print("="*50)
+        
+        series = merge_series(rollup_series(ensure_aggregates(self.data), 'month'), self.recurring, 'month')
+        if not series:
+            print("\nNo transactions recorded yet.")
+            print("="*50)
+            return
+        
+        print(f"\n  {'Month':<9} {'Income':>11} {'Expenses':>11} {'Net':>11}")
+        for month in series:
+            print(f"  {month['period']:<9} ₹{month['income']:>10.2f} "
+                  f"₹{month['expenses']:>10.2f} ₹{month['net']:>10.2f}")
+            if month['categories']:
+                top = max(month['categories'], key=month['categories'].get)
+                print(f"  {'':<9} Top spend: {top} (₹{month['categories'][top]:.2f})")
+        
+        print("="*50)
+    
+    def forecast(self, months, paths):
+        """Project balance and category spend, reusing the last result for the same ledger version and day"""
+        from forecast import ForecastCache, project
+        
+        if self._forecasts is None:
+            self._forecasts = ForecastCache()
+        version = (self.store.version(), date.today())
+        result = self._forecasts.get((months, paths), version)
+        if result is None:
+            series = rollup_series(ensure_aggregates(self.data), 'month')
+            result = project(series, self.recurring, self.calculate_balance(), months, paths)
+            self._forecasts.put((months, paths), version, result)
+        return result
+    
+    def print_forecast(self, result):
+        """Print the projected balance bands per month and next month's expected spend"""
+        print(f"\n  {'Month':<9} {'Net':>11} {'Low (p10)':>12} {'Balance':>12} {'High (p90)':>12}")
+        for month in result['projection']:
+            balance = month['balance']
+            print(f"  {month['period']:<9} ₹{month['net']:>10.2f} ₹{balance['p10']:>11.2f} "
+                  f"₹{balance['p50']:>11.2f} ₹{balance['p90']:>11.2f}")
+        
+        print(f"\n  {'Projected Savings Rate:':<30} {result['projected_savings_rate']:>10.1f}%")
+        print(f"  {'Chance of Going Negative:':<30} {result['shortfall_probability'] * 100:>10.1f}%")
+        
+        upcoming = result['projection'][0]
+        if upcoming['categories']:
+            print(f"\n{'EXPECTED SPEND ' + upcoming['period']:-^50}")
+            for category, spend in sorted(upcoming['categories'].items(),
+                                          key=lambda item: item[1]['expected'], reverse=True):
+                print(f"  {category:<22} ₹{spend['expected']:>9.2f} "
+                      f"(₹{spend['p10']:.0f}-₹{spend['p90']:.0f})")
+        if result['history_months'] < 3:
+            print("\n  ⚠ Little history yet, so this forecast is rough.")
+    
+    def view_forecast(self):
+        """Display a cash-flow forecast for the coming months"""
+        from forecast import DEFAULT_MONTHS, DEFAULT_PATHS, MAX_MONTHS
+        
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("CASH-FLOW FORECAST")
+        print("="*50)
+        
+        value = input(f"Months to project (1-{MAX_MONTHS}, blank for {DEFAULT_MONTHS}): ").strip()
+        try:
+            months = int(value) if value else DEFAULT_MONTHS
+        except ValueError:
+            print("⚠ Invalid input! Please enter a number.")
+            return
+        if not 1 <= months <= MAX_MONTHS:
+            print(f"⚠ Please select a number between 1 and {MAX_MONTHS}!")
+            return
+        
+        try:
+            self.print_forecast(self.forecast(months, DEFAULT_PATHS))
+        except RuntimeError as e:
+            print(f"⚠ {e}")
+        print("="*50)
+    
     def view_transactions(self):
         """View all transactions"""
         if not self.mode:
@@ -298,13 +610,300 @@ class BudgetBuddy:
         
         print("="*50)
     
+    def search(self, query, filters=None, after=None, limit=20):
+        """Return one page of ranked matches for a query, and the cursor for the next"""
+        if self._search is None:
+            from search import SearchIndex
+            self._search = SearchIndex.from_ledger(self.data)
+        return self._search.search(self.data, query, filters, after, limit)
+    
+    def print_search_results(self, results):
+        """Print search results, best match first"""
+        if not results:
+            print("\nNo matching transactions.")
+            return
+        for i, result in enumerate(results, 1):
+            entry = result['entry']
+            if result['type'] == 'expense':
+                print(f"\n{i}. {entry['description']} [{entry['category']}]")
+            else:
+                print(f"\n{i}. {entry['source']} [Income]")
+            print(f"   Amount: ₹{entry['amount']:.2f}")
+            print(f"   Date: {entry['date']}")
+    
+    def search_transactions(self):
+        """Search transaction descriptions and income sources"""
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("SEARCH TRANSACTIONS")
+        print("="*50)
+        
+        query = input("Search for: ").strip()
+        if not query:
+            print("⚠ Search cannot be empty!")
+            return
+        
+        after = None
+        while True:
+            results, after = self.search(query, after=after)
+            self.print_search_results(results)
+            if after is None or input("\nShow more? (yes/no): ").lower() != 'yes':
+                break
+        
+        print("="*50)
+    
+    def budget_report(self, month):
+        """Return every category limit's status for a YYYY-MM month"""
+        return budget_status(self.budgets, month, self.month_spent)
+    
+    def print_budget_report(self, month):
+        """Print spending against each category limit for a month"""
+        report = self.budget_report(month)
+        if not report:
+            print("\nNo budget limits set.")
+            return
+        print(f"\n{'BUDGET LIMITS ' + month:-^50}")
+        for status in report:
+            marker = {'exceeded': ' ⚠ OVER', 'warning': ' ⚠'}.get(status['level'], '')
+            print(f"  {status['category']:<22} ₹{status['spent']:>9.2f} / ₹{status['limit']:>9.2f} "
+                  f"({status['percentage']:>5.1f}%){marker}")
+    
+    def set_budget(self, category, limit):
+        """Set a category's monthly limit, or remove it when limit is None"""
+        self.save_data({'op': 'set_budget', 'category': category, 'limit': limit})
+    
+    def manage_budgets(self):
+        """Show this month's spending against each limit, and set or remove one"""
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("BUDGET LIMITS")
+        print("="*50)
+        
+        self.print_budget_report(datetime.now().strftime("%Y-%m"))
+        
+        if input("\nSet or remove a limit? (yes/no): ").lower() != 'yes':
+            return
+        
+        categories = self.student_categories if self.mode == 'student' else self.professional_categories
+        print("\nExpense Categories:")
+        for i, category in enumerate(categories, 1):
+            limit = self.budgets.get(category)
+            print(f"{i}. {category}" + (f" (₹{limit:.2f})" if limit is not None else ""))
+        
+        try:
+            choice = int(input(f"\nSelect category (1-{len(categories)}): "))
+        except ValueError:
+            print("⚠ Invalid input! Please enter a number.")
+            return
+        if not 1 <= choice <= len(categories):
+            print(f"⚠ Please select a number between 1 and {len(categories)}!")
+            return
+        category = categories[choice - 1]
+        
+        value = input("Monthly limit (blank to remove): ₹").strip()
+        if not value:
+            self.set_budget(category, None)
+            print(f"✓ Limit for {category} removed!")
+            return
+        try:
+            limit = parse_limit(value)
+        except ValueError:
+            print("⚠ Please enter a positive amount!")
+            return
+        self.set_budget(category, limit)
+        print(f"✓ Monthly limit for {category} set to ₹{limit:.2f}!")
+    
+    def summarize(self, filters=None):
+        """Return (total income, total expenses, per-category totals), optionally for a date range"""
+        if filters or self._data is None:
+            summary = self.columns.summarize(filters)
+        else:
+            summary = summarize_aggregates(ensure_aggregates(self.data))
+        if not self.recurring:
+            return summary
+        return combine_summaries(summary, summarize_rules(self.recurring, filters))
+    
+    def summary_report(self, filters=None):
+        """Return totals and category breakdown in the shape of /api/summary?lists=0"""
+        total_income, total_expenses, category_totals = self.summarize(filters)
+        balance = total_income - total_expenses
+        categories = self.student_categories if self.mode == 'student' else self.professional_categories
+        listed = {cat: category_totals[cat] for cat in categories if category_totals.get(cat, 0) > 0}
+        listed_total = sum(listed.values())
+        breakdown = [{'category': category, 'amount': amount, 'percentage': amount / listed_total * 100}
+                     for category, amount in listed.items()]
+        return {
+            'mode': self.mode,
+            'totals': {
+                'total_income': total_income,
+                'total_expenses': total_expenses,
+                'balance': balance,
+                'savings_rate': (balance / total_income * 100) if total_income > 0 else 0
+            },
+            'breakdown': sorted(breakdown, key=lambda x: x['amount'], reverse=True)
+        }
+    
+    def add_rule(self, rule):
+        """Add a recurring rule, numbered with the ledger's next id"""
+        # Ids come from the decoded ledger, not a mapped binary snapshot
+        self.data
+        self.save_data({'op': 'add_rule', 'rule': rule})
+        return rule
+    
+    def remove_rule(self, rule_id):
+        """Remove a recurring rule by id. Raises KeyError for an unknown id"""
+        self.data
+        self.save_data({'op': 'delete_rule', 'id': rule_id})
+    
+    def print_recurring(self):
+        """Print each recurring rule with its occurrences so far and next date"""
+        if not self.recurring:
+            print("\nNo recurring transactions.")
+            return
+        for rule in map(describe_rule, self.recurring):
+            if rule['type'] == 'income':
+                print(f"\n#{rule['id']} {rule['source']} [Income]")
+            else:
+                print(f"\n#{rule['id']} {rule['description']} [{rule['category']}]")
+            until = f" until {rule['end']}" if rule['end'] else ""
+            print(f"   ₹{rule['amount']:.2f} {rule['cadence']} from {rule['start']}{until}")
+            upcoming = f", next on {rule['next_date'][:10]}" if rule['next_date'] else ", ended"
+            print(f"   Occurred {rule['occurrences']} times{upcoming}")
+    
+    def manage_recurring(self):
+        """List recurring rules, and add or remove one"""
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return
+        
+        print("\n" + "="*50)
+        print("RECURRING TRANSACTIONS")
+        print("="*50)
+        
+        self.print_recurring()
+        
+        action = input("\nAdd or remove a rule? (add/remove/no): ").strip().lower()
+        if action == 'remove':
+            try:
+                self.remove_rule(int(input("Rule id to remove: #").strip()))
+            except ValueError:
+                print("⚠ Invalid input! Please enter a number.")
+                return
+            except KeyError:
+                print("⚠ No rule has that id!")
+                return
+            print("✓ Recurring rule removed!")
+            return
+        if action != 'add':
+            return
+        
+        categories = self.student_categories if self.mode == 'student' else self.professional_categories
+        payload = {'type': input("Income or expense? (income/expense): ").strip().lower()}
+        if payload['type'] == 'income':
+            payload['source'] = input("Income Source: ").strip()
+        elif payload['type'] == 'expense':
+            print("\nExpense Categories:")
+            for i, category in enumerate(categories, 1):
+                print(f"{i}. {category}")
+            try:
+                choice = int(input(f"\nSelect category (1-{len(categories)}): "))
+            except ValueError:
+                print("⚠ Invalid input! Please enter a number.")
+                return
+            if not 1 <= choice <= len(categories):
+                print(f"⚠ Please select a number between 1 and {len(categories)}!")
+                return
+            payload['category'] = categories[choice - 1]
+            payload['description'] = input("Description: ").strip()
+        else:
+            print("⚠ Please enter income or expense!")
+            return
+        payload['amount'] = self.get_positive_float("Amount: ₹")
+        payload['cadence'] = input(f"Repeats ({'/'.join(CADENCES)}): ").strip().lower()
+        payload['start'] = input("Start date (YYYY-MM-DD, blank for today): ").strip()
+        payload['end'] = input("End date (YYYY-MM-DD, blank for none): ").strip()
+        try:
+            rule = parse_rule(payload, categories)
+        except ValueError as e:
+            print(f"⚠ Invalid input: {e}")
+            return
+        self.add_rule(rule)
+        print(f"✓ Recurring rule #{rule['id']} added: ₹{rule['amount']:.2f} {rule['cadence']}!")
+    
+    def add_batch(self, income=(), expenses=()):
+        """Journal many entries as one record, without loading the ledger"""
+        record = {'op': 'add_batch', 'income': list(income), 'expenses': list(expenses)}
+        self.apply(record)
+        self.store.append(record)
+        self.store.wait_for_compaction()
+    
+    def import_statement(self, path, fmt=None):
+        """Import a CSV or NDJSON bank statement in batches; a path of - reads stdin"""
+        from importer import import_stream
+        
+        if not self.mode:
+            print("⚠ Please select a mode first!")
+            return None
+        
+        fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        categories = self.student_categories if self.mode == 'student' else self.professional_categories
+        
+        def commit(record):
+            self.apply(record)
+            self.store.append(record)
+        
+        if path == '-':
+            report = import_stream(sys.stdin, fmt, categories, commit)
+        else:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                report = import_stream(f, fmt, categories, commit)
+        self.store.wait_for_compaction()
+        
+        print(f"✓ Imported {report['imported']} rows "
+              f"({report['income']} income, {report['expenses']} expenses) "
+              f"at {report['rows_per_sec']:,.0f} rows/sec")
+        if report['rejected']:
+            print(f"⚠ Rejected {report['rejected']} rows:")
+            for error in report['errors']:
+                print(f"  Row {error['row']}: {error['error']}")
+        return report
+    
+    def export_transactions(self, out, fmt='csv', filters=None, compress=False):
+        """Stream transactions to a binary file object as CSV or NDJSON"""
+        from exporter import gzip_chunks, iter_export, iter_export_records, iter_ledger_entries
+        
+        filters = filters or {}
+        records = iter_export_records(
+            iter_ledger_entries(self.data, 'income_sources', filters),
+            iter_ledger_entries(self.data, 'expenses', filters)
+        )
+        chunks = iter_export(records, fmt)
+        if compress:
+            chunks = gzip_chunks(chunks)
+        else:
+            chunks = (chunk.encode('utf-8') for chunk in chunks)
+        for chunk in chunks:
+            out.write(chunk)
+    
+    def convert_data(self, fmt):
+        """Rewrite the data file as JSON or as a memory-mapped binary ledger"""
+        if not self.store.write_snapshot(self.data, binary=(fmt == 'binary')):
+            print("⚠ Data changed while converting; please try again.")
+            return False
+        print(f"✓ Converted {self.data_file} to {fmt}")
+        return True
+    
     def clear_data(self):
         """Clear all data"""
         confirm = input("\n⚠ Are you sure you want to clear all data? (yes/no): ").lower()
         if confirm == 'yes':
-            self.income_sources = []
-            self.expenses = []
-            self.save_data()
+            self.save_data({'op': 'clear'})
             print("✓ All data cleared successfully!")
         else:
             print("Operation cancelled.")
@@ -322,7 +921,13 @@ class BudgetBuddy:
         print("4. View Financial Summary")
         print("5. View Transaction History")
         print("6. Clear All Data")
-        print("7. Exit")
+        print("7. Date Range Summary")
+        print("8. Monthly Report")
+        print("9. Search Transactions")
+        print("10. Budget Limits")
+        print("11. Recurring Transactions")
+        print("12. Cash-Flow Forecast")
+        print("13. Exit")
         print("="*50)
     
     def run(self):
@@ -334,7 +939,7 @@ class BudgetBuddy:
         
         while True:
             self.display_menu()
-            choice = input("\nEnter your choice (1-7): ")
+            choice = input("\nEnter your choice (1-13): ")
             
             if choice == '1':
                 self.select_mode()
@@ -349,16 +954,377 @@ class BudgetBuddy:
             elif choice == '6':
                 self.clear_data()
             elif choice == '7':
-                self.save_data()
+                self.view_range_summary()
+            elif choice == '8':
+                self.view_monthly_report()
+            elif choice == '9':
+                self.search_transactions()
+            elif choice == '10':
+                self.manage_budgets()
+            elif choice == '11':
+                self.manage_recurring()
+            elif choice == '12':
+                self.view_forecast()
+            elif choice == '13':
+                self.close()
                 print("\n" + "="*50)
                 print("Thank you for using Budget Buddy!")
                 print("Stay financially smart! 💰")
                 print("="*50 + "\n")
                 break
             else:
-                print("⚠ Invalid choice! Please select 1-7.")
+                print("⚠ Invalid choice! Please select 1-13.")
 
 
-if __name__ == "__main__":
+def parse_entry(text, kind, categories, date):
+    """Parse one batch entry into an income or expense entry.
+
+    Expenses are written AMOUNT,CATEGORY[,DESCRIPTION] and income
+    AMOUNT,SOURCE; either may instead be a JSON object with those keys
+    and an optional date. Categories match the mode's list ignoring case.
+    """
+    text = text.strip()
+    if text.startswith('{'):
+        fields = json.loads(text)
+        if not isinstance(fields, dict):
+            raise ValueError("Expected a JSON object")
+    else:
+        names = ['amount', 'category', 'description'] if kind == 'expense' else ['amount', 'source']
+        fields = dict(zip(names, (part.strip() for part in text.split(',', len(names) - 1))))
+    
+    try:
+        amount = float(fields.get('amount'))
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid amount: {fields.get('amount')!r}")
+    if not (amount > 0 and math.isfinite(amount)):
+        raise ValueError("Amount must be a positive number")
+    if fields.get('date'):
+        from importer import parse_date
+        date = parse_date(str(fields['date']))
+    
+    if kind == 'income':
+        source = str(fields.get('source') or '').strip()
+        if not source:
+            raise ValueError("Source cannot be empty")
+        return {'source': source, 'amount': amount, 'date': date}
+    
+    category = {name.lower(): name for name in categories}.get(
+        str(fields.get('category') or '').strip().lower())
+    if category is None:
+        raise ValueError(f"Unknown category: {fields.get('category')!r}")
+    description = str(fields.get('description') or '').strip() or category
+    return {'category': category, 'description': description, 'amount': amount, 'date': date}
+
+
+def add_entries(args, kind):
+    """Run add-expense or add-income: validate every entry, then journal them in one write"""
+    app = BudgetBuddy(load=False)
+    if not app.mode:
+        print("⚠ Please select a mode first!", file=sys.stderr)
+        return 1
+    
+    if args.entries in ([], ['-']):
+        if not args.entries and sys.stdin.isatty():
+            print("⚠ No entries given!", file=sys.stderr)
+            return 1
+        lines = sys.stdin
+    else:
+        lines = args.entries
+    
+    date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    if args.date:
+        from importer import parse_date
+        try:
+            date = parse_date(args.date)
+        except ValueError as e:
+            print(f"⚠ {e}", file=sys.stderr)
+            return 1
+    
+    categories = app.student_categories if app.mode == 'student' else app.professional_categories
+    entries, errors = [], []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            entries.append(parse_entry(line, kind, categories, date))
+        except ValueError as e:
+            errors.append((number, e))
+    if errors:
+        print(f"⚠ Rejected {len(errors)} entries, so nothing was added:", file=sys.stderr)
+        for number, error in errors:
+            print(f"  Entry {number}: {error}", file=sys.stderr)
+        return 1
+    if not entries:
+        print("⚠ No entries given!", file=sys.stderr)
+        return 1
+    
+    if kind == 'expense':
+        app.add_batch(expenses=entries)
+    else:
+        app.add_batch(income=entries)
+    total = sum(entry['amount'] for entry in entries)
+    noun = 'entry' if len(entries) == 1 else 'entries'
+    print(f"✓ Added {len(entries)} {kind} {noun} totalling ₹{total:.2f}")
+    return 0
+
+
+def iso_date(value):
+    """argparse type for YYYY-MM-DD dates"""
+    try:
+        datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {value!r}, use YYYY-MM-DD")
+    return value
+
+
+def iso_month(value):
+    """argparse type for YYYY-MM months"""
+    try:
+        # strptime also accepts single-digit months
+        if len(value) != 7:
+            raise ValueError(value)
+        datetime.strptime(value, "%Y-%m")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid month {value!r}, use YYYY-MM")
+    return value
+
+
+def run_budget(args):
+    """Run the budget subcommand: set or remove a limit, then report a month"""
+    with contextlib.redirect_stdout(sys.stderr):
+        app = BudgetBuddy()
+    if not app.mode:
+        print("⚠ Please select a mode first!", file=sys.stderr)
+        return 1
+    
+    categories = app.student_categories if app.mode == 'student' else app.professional_categories
+    by_name = {name.lower(): name for name in categories}
+    changes = []
+    if args.set:
+        category = by_name.get(args.set[0].strip().lower())
+        try:
+            changes.append((category, parse_limit(args.set[1])))
+        except ValueError as e:
+            print(f"⚠ {e}", file=sys.stderr)
+            return 1
+    if args.remove:
+        changes.append((by_name.get(args.remove.strip().lower()), None))
+    for category, limit in changes:
+        if category is None:
+            print("⚠ Unknown category!", file=sys.stderr)
+            return 1
+        with contextlib.redirect_stdout(sys.stderr):
+            app.set_budget(category, limit)
+    
+    month = args.month or datetime.now().strftime("%Y-%m")
+    if args.json:
+        print(json.dumps({'month': month, 'budgets': app.budget_report(month)}))
+    else:
+        app.print_budget_report(month)
+    return 0
+
+
+def run_recurring(args):
+    """Run the recurring subcommand: add or remove a rule, then list the rules"""
+    with contextlib.redirect_stdout(sys.stderr):
+        app = BudgetBuddy()
+    if not app.mode:
+        print("⚠ Please select a mode first!", file=sys.stderr)
+        return 1
+    
+    categories = app.student_categories if app.mode == 'student' else app.professional_categories
+    if args.add_income or args.add_expense:
+        kind = 'income' if args.add_income else 'expense'
+        try:
+            entry = parse_entry(args.add_income or args.add_expense, kind, categories, None)
+            del entry['date']
+            rule = parse_rule(dict(entry, type=kind, cadence=args.cadence, start=args.start, end=args.end),
+                              categories)
+        except ValueError as e:
+            print(f"⚠ {e}", file=sys.stderr)
+            return 1
+        with contextlib.redirect_stdout(sys.stderr):
+            app.add_rule(rule)
+    if args.remove is not None:
+        try:
+            with contextlib.redirect_stdout(sys.stderr):
+                app.remove_rule(args.remove)
+        except KeyError:
+            print("⚠ No recurring rule has that id!", file=sys.stderr)
+            return 1
+    
+    if args.json:
+        print(json.dumps({'recurring': [describe_rule(rule) for rule in app.recurring]}))
+    else:
+        app.print_recurring()
+    return 0
+
+
+def run_forecast(args):
+    """Run the forecast subcommand: project the coming months as text or JSON"""
+    from forecast import MAX_MONTHS, MAX_PATHS
+    
+    with contextlib.redirect_stdout(sys.stderr):
+        app = BudgetBuddy()
+    if not app.mode:
+        print("⚠ Please select a mode first!", file=sys.stderr)
+        return 1
+    if not 1 <= args.months <= MAX_MONTHS or not 1 <= args.paths <= MAX_PATHS:
+        print(f"⚠ --months must be 1-{MAX_MONTHS} and --paths 1-{MAX_PATHS}!", file=sys.stderr)
+        return 1
+    
+    try:
+        result = app.forecast(args.months, args.paths)
+    except RuntimeError as e:
+        print(f"⚠ {e}", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps(result))
+    else:
+        app.print_forecast(result)
+    return 0
+
+
+def main(argv=None):
+    """Run a subcommand, or the interactive menu when none is given"""
+    parser = argparse.ArgumentParser(description="Budget Buddy - Personal Finance Management System")
+    subcommands = parser.add_subparsers(dest='command')
+    
+    import_parser = subcommands.add_parser('import', help="Import a CSV or NDJSON bank statement")
+    import_parser.add_argument('path', help="Statement file, or - for stdin")
+    import_parser.add_argument('--format', choices=['csv', 'ndjson'],
+                               help="Statement format (default: from the file extension)")
+    
+    expense_parser = subcommands.add_parser('add-expense', help="Add expenses without the menu")
+    expense_parser.add_argument('entries', nargs='*', metavar='AMOUNT,CATEGORY[,DESCRIPTION]',
+                                help="Expenses to add (default: one per line from stdin)")
+    expense_parser.add_argument('--date', help="Date for every entry (default: now)")
+    
+    income_parser = subcommands.add_parser('add-income', help="Add income without the menu")
+    income_parser.add_argument('entries', nargs='*', metavar='AMOUNT,SOURCE',
+                               help="Income to add (default: one per line from stdin)")
+    income_parser.add_argument('--date', help="Date for every entry (default: now)")
+    
+    summary_parser = subcommands.add_parser('summary', help="Print totals and category breakdown")
+    summary_parser.add_argument('--json', action='store_true', help="Print JSON like /api/summary?lists=0")
+    summary_parser.add_argument('--from', dest='date_from', type=iso_date, help="Earliest date (YYYY-MM-DD)")
+    summary_parser.add_argument('--to', dest='date_to', type=iso_date, help="Latest date, inclusive (YYYY-MM-DD)")
+    
+    export_parser = subcommands.add_parser('export', help="Export transactions as CSV or NDJSON")
+    export_parser.add_argument('--format', choices=['csv', 'ndjson'], default='csv')
+    export_parser.add_argument('--from', dest='date_from', type=iso_date, help="Earliest date (YYYY-MM-DD)")
+    export_parser.add_argument('--to', dest='date_to', type=iso_date, help="Latest date, inclusive (YYYY-MM-DD)")
+    export_parser.add_argument('--category', help="Only expenses in this category")
+    export_parser.add_argument('--gzip', action='store_true', help="Gzip-compress the output")
+    export_parser.add_argument('-o', '--output', help="Output file (default: stdout)")
+    
+    search_parser = subcommands.add_parser('search', help="Search descriptions and income sources")
+    search_parser.add_argument('query', nargs='+', help="Words to find; the last may be a prefix")
+    search_parser.add_argument('--category', help="Only expenses in this category")
+    search_parser.add_argument('--from', dest='date_from', type=iso_date, help="Earliest date (YYYY-MM-DD)")
+    search_parser.add_argument('--to', dest='date_to', type=iso_date, help="Latest date, inclusive (YYYY-MM-DD)")
+    search_parser.add_argument('--limit', type=int, default=20, help="Most results to print (default: 20)")
+    search_parser.add_argument('--json', action='store_true', help="Print JSON like /api/search")
+    
+    budget_parser = subcommands.add_parser('budget', help="Set monthly category limits and check spending")
+    budget_parser.add_argument('--set', nargs=2, metavar=('CATEGORY', 'LIMIT'),
+                               help="Set a category's monthly limit")
+    budget_parser.add_argument('--remove', metavar='CATEGORY', help="Remove a category's limit")
+    budget_parser.add_argument('--month', type=iso_month, help="Month to report (default: this month)")
+    budget_parser.add_argument('--json', action='store_true', help="Print JSON like /api/budgets")
+    
+    recurring_parser = subcommands.add_parser('recurring', help="Add, remove and list recurring transactions")
+    rule_group = recurring_parser.add_mutually_exclusive_group()
+    rule_group.add_argument('--add-income', metavar='AMOUNT,SOURCE', help="Add a recurring income")
+    rule_group.add_argument('--add-expense', metavar='AMOUNT,CATEGORY[,DESCRIPTION]',
+                            help="Add a recurring expense")
+    recurring_parser.add_argument('--cadence', choices=list(CADENCES), default='monthly',
+                                  help="How often a new rule repeats (default: monthly)")
+    recurring_parser.add_argument('--start', type=iso_date, help="First date of a new rule (default: today)")
+    recurring_parser.add_argument('--end', type=iso_date, help="Last date of a new rule (default: none)")
+    recurring_parser.add_argument('--remove', type=int, metavar='ID', help="Remove the rule with this id")
+    recurring_parser.add_argument('--json', action='store_true', help="Print JSON like /api/recurring")
+    
+    forecast_parser = subcommands.add_parser('forecast', help="Project balance and spending for the coming months")
+    forecast_parser.add_argument('--months', type=int, default=12, help="Months to project (default: 12)")
+    forecast_parser.add_argument('--paths', type=int, default=2000,
+                                 help="Simulated paths behind the bands (default: 2000)")
+    forecast_parser.add_argument('--json', action='store_true', help="Print JSON like /api/forecast")
+    
+    convert_parser = subcommands.add_parser('convert', help="Rewrite the data file as JSON or binary")
+    convert_parser.add_argument('format', choices=['json', 'binary'],
+                                help="binary starts faster on large ledgers")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command in ('add-expense', 'add-income'):
+        return add_entries(args, args.command[4:])
+    
+    if args.command == 'import':
+        app = BudgetBuddy(load=False)
+        report = app.import_statement(args.path, args.format)
+        return 0 if report is not None else 1
+    
+    if args.command == 'summary':
+        with contextlib.redirect_stdout(sys.stderr):
+            app = BudgetBuddy()
+        if not app.mode:
+            print("⚠ Please select a mode first!", file=sys.stderr)
+            return 1
+        filters = {key: value for key, value in (('from', args.date_from), ('to', args.date_to)) if value}
+        if args.json:
+            print(json.dumps(app.summary_report(filters)))
+        elif filters:
+            app.print_range_summary(filters)
+        else:
+            app.view_summary()
+        return 0
+    
+    if args.command == 'budget':
+        return run_budget(args)
+    
+    if args.command == 'recurring':
+        return run_recurring(args)
+    
+    if args.command == 'forecast':
+        return run_forecast(args)
+    
+    if args.command == 'search':
+        with contextlib.redirect_stdout(sys.stderr):
+            app = BudgetBuddy()
+        query = ' '.join(args.query)
+        filters = {key: value for key, value in (('from', args.date_from),
+                                                 ('to', args.date_to),
+                                                 ('category', args.category)) if value}
+        results, next_cursor = app.search(query, filters, limit=max(args.limit, 1))
+        if args.json:
+            print(json.dumps({'query': query, 'results': results, 'next_cursor': next_cursor}))
+        else:
+            app.print_search_results(results)
+        return 0
+    
+    if args.command == 'export':
+        # Keep stdout clean for the exported data
+        with contextlib.redirect_stdout(sys.stderr):
+            app = BudgetBuddy()
+        filters = {key: value for key, value in (('from', args.date_from),
+                                                 ('to', args.date_to),
+                                                 ('category', args.category)) if value}
+        if args.output:
+            with open(args.output, 'wb') as out:
+                app.export_transactions(out, args.format, filters, args.gzip)
+        else:
+            app.export_transactions(sys.stdout.buffer, args.format, filters, args.gzip)
+        return 0
+    
     app = BudgetBuddy()
+    
+    if args.command == 'convert':
+        return 0 if app.convert_data(args.format) else 1
+    
     app.run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
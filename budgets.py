@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Budgets
+Monthly per-category spending limits and the alerts they raise
+"""
+
+import math
+
+from ledger import ROLLUP_KEYS
+
+# Spending at or above this share of a limit raises a warning
+WARNING_SHARE = 0.9
+
+
+def month_of(date):
+    """Return the YYYY-MM month a ledger timestamp falls in"""
+    return date[:ROLLUP_KEYS['month']]
+
+
+def budget_limits(data):
+    """Return a ledger's monthly limit per category"""
+    return data['budgets'] if 'budgets' in data else {}
+
+
+def parse_limit(value):
+    """Validate a monthly limit into a float.
+
+    Raises ValueError unless it is a positive, finite number.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('invalid limit')
+    limit = float(value)
+    if not (limit > 0 and math.isfinite(limit)):
+        raise ValueError('limit must be a positive number')
+    return limit
+
+
+def month_spent(aggregates, category, month):
+    """Read one category's spending in a month from the ledger's month rollup"""
+    bucket = aggregates['rollups']['month'].get(month)
+    return bucket['categories'].get(category, 0.0) if bucket else 0.0
+
+
+def evaluate(category, month, limit, spent):
+    """Compare one category's spending in a month against its limit"""
+    if spent > limit:
+        level = 'exceeded'
+    elif spent >= limit * WARNING_SHARE:
+        level = 'warning'
+    else:
+        level = 'ok'
+    return {
+        'category': category,
+        'month': month,
+        'limit': limit,
+        'spent': spent,
+        'remaining': limit - spent,
+        'percentage': spent / limit * 100,
+        'level': level
+    }
+
+
+def touched(record, result):
+    """Return the (category, month) pairs whose spending a change record raised"""
+    op = record['op']
+    if op == 'add_expense':
+        entries = [record['entry']]
+    elif op == 'add_batch':
+        entries = record['expenses']
+    elif op == 'update_expense' and result is not None:
+        entries = [result]
+    else:
+        return []
+    return list(dict.fromkeys((entry['category'], month_of(entry['date'])) for entry in entries))
+
+
+def record_alerts(limits, record, result, spent):
+    """Return a warning or exceeded alert for each limit a change record pushed spending near or over.
+
+    Only the categories and months the record touched are looked up, and
+    spent(category, month) reads a running counter, so the cost per
+    record does not grow with the number of limits or entries.
+    """
+    alerts = []
+    for category, month in touched(record, result):
+        limit = limits.get(category)
+        if limit is None:
+            continue
+        status = evaluate(category, month, limit, spent(category, month))
+        if status['level'] != 'ok':
+            alerts.append(status)
+    return alerts
+
+
+def budget_status(limits, month, spent):
+    """Return every limit's status for a month, in category order"""
+    return [evaluate(category, month, limit, spent(category, month))
+            for category, limit in sorted(limits.items())]
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Columnar Transaction Store
+Typed-array columns for compact storage and vectorized aggregation
+"""
+
+import calendar
+import sys
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+try:
+    import numpy as np
+except ImportError:  # NumPy is optional; array reductions are the fallback
+    np = None
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def to_epoch(timestamp):
+    """Convert a ledger timestamp to integer seconds since the epoch"""
+    # Slicing the fixed-width fields is much faster than strptime
+    return calendar.timegm((int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                            int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19])))
+
+
+def from_epoch(epoch):
+    """Convert epoch seconds back to a ledger timestamp"""
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def _prefix_bounds(prefix):
+    """Return the [start, end) epoch range covered by a date prefix"""
+    if len(prefix) == 4:
+        year = int(prefix)
+        return (calendar.timegm((year, 1, 1, 0, 0, 0)),
+                calendar.timegm((year + 1, 1, 1, 0, 0, 0)))
+    if len(prefix) == 7:
+        year, month = int(prefix[:4]), int(prefix[5:7])
+        next_year, next_month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return (calendar.timegm((year, month, 1, 0, 0, 0)),
+                calendar.timegm((next_year, next_month, 1, 0, 0, 0)))
+    if len(prefix) == 10:
+        start = calendar.timegm(datetime.strptime(prefix, "%Y-%m-%d").timetuple())
+        return start, start + 86400
+    start = to_epoch(prefix)
+    return start, start + 1
+
+
+def epoch_bounds(filters):
+    """Translate from/to date filters into an inclusive-exclusive epoch range"""
+    start = _prefix_bounds(filters['from'])[0] if 'from' in filters else None
+    end = _prefix_bounds(filters['to'])[1] if 'to' in filters else None
+    return start, end
+
+
+class TransactionColumns:
+    """One kind of transaction stored column-wise.
+
+    Amounts live in an ``array('d')``, timestamps in an ``array('q')`` of
+    epoch seconds, and categories as small-int codes into a category
+    table that starts out as the mode's category list. Descriptions (or
+    income sources) are interned so repeated labels share one string.
+    Entry ids are kept in an ``array('q')`` in ascending order.
+    """
+
+    def __init__(self, categories=()):
+        self.ids = array('q')
+        self.amounts = array('d')
+        self.epochs = array('q')
+        self.codes = array('H')
+        self.labels = []
+        self.categories = list(categories)
+        self._category_codes = {category: code for code, category in enumerate(self.categories)}
+
+    def __len__(self):
+        return len(self.amounts)
+
+    def code(self, category):
+        """Return the code for a category, adding it to the table if new"""
+        code = self._category_codes.get(category)
+        if code is None:
+            code = self._category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        return code
+
+    def append(self, entry):
+        """Append one income or expense entry"""
+        self.ids.append(entry.get('id', 0))
+        self.amounts.append(entry['amount'])
+        self.epochs.append(to_epoch(entry['date']))
+        self.codes.append(self.code(entry['category']) if 'category' in entry else 0)
+        self.labels.append(sys.intern(entry.get('description', entry.get('source', ''))))
+
+    def extend(self, entries):
+        """Append many entries"""
+        for entry in entries:
+            self.append(entry)
+
+    def find(self, entry_id):
+        """Return the list position of an entry id, raising KeyError if absent"""
+        position = bisect_left(self.ids, entry_id)
+        if position == len(self.ids) or self.ids[position] != entry_id:
+            raise KeyError(entry_id)
+        return position
+
+    def pop(self, index):
+        """Remove the entry at a list position"""
+        self.ids.pop(index)
+        self.amounts.pop(index)
+        self.epochs.pop(index)
+        self.codes.pop(index)
+        self.labels.pop(index)
+
+    def update(self, index, changes):
+        """Change the amount, category or label of the entry at a list position"""
+        if 'amount' in changes:
+            self.amounts[index] = changes['amount']
+        if 'category' in changes:
+            self.codes[index] = self.code(changes['category'])
+        for key in ('description', 'source'):
+            if key in changes:
+                self.labels[index] = sys.intern(changes[key])
+
+    def clear(self):
+        """Remove every entry, keeping the category table"""
+        self.ids = array('q')
+        self.amounts = array('d')
+        self.epochs = array('q')
+        self.codes = array('H')
+        self.labels = []
+
+    def _mask(self, start, end):
+        epochs = np.frombuffer(self.epochs, dtype=np.int64)
+        mask = np.ones(len(epochs), dtype=bool)
+        if start is not None:
+            mask &= epochs >= start
+        if end is not None:
+            mask &= epochs < end
+        return mask
+
+    def total(self, start=None, end=None):
+        """Sum amounts, optionally within an epoch range"""
+        if not len(self):
+            return 0.0
+        if np is not None:
+            amounts = np.frombuffer(self.amounts, dtype=np.float64)
+            if start is None and end is None:
+                return float(amounts.sum())
+            return float(amounts[self._mask(start, end)].sum())
+        if start is None and end is None:
+            return sum(self.amounts)
+        return sum(amount for amount, epoch in zip(self.amounts, self.epochs)
+                   if (start is None or epoch >= start) and (end is None or epoch < end))
+
+    def category_totals(self, start=None, end=None):
+        """Sum amounts per category, optionally within an epoch range"""
+        if not len(self):
+            return {}
+        if np is not None:
+            codes = np.frombuffer(self.codes, dtype=np.uint16)
+            amounts = np.frombuffer(self.amounts, dtype=np.float64)
+            if start is not None or end is not None:
+                mask = self._mask(start, end)
+                codes, amounts = codes[mask], amounts[mask]
+            sums = np.bincount(codes, weights=amounts, minlength=len(self.categories))
+            return {category: float(sums[code]) for code, category in enumerate(self.categories)
+                    if sums[code]}
+        sums = [0.0] * len(self.categories)
+        for code, amount, epoch in zip(self.codes, self.amounts, self.epochs):
+            if (start is None or epoch >= start) and (end is None or epoch < end):
+                sums[code] += amount
+        return {category: sums[code] for code, category in enumerate(self.categories)
+                if sums[code]}
+
+
+class ColumnarLedger:
+    """Columnar mirror of a ledger, kept in step by applying change records"""
+
+    def __init__(self, categories=()):
+        self.income = TransactionColumns()
+        self.expenses = TransactionColumns(categories)
+
+    @classmethod
+    def from_ledger(cls, data, categories=()):
+        """Build columns from a dict-based ledger"""
+        columns = cls(categories)
+        columns.income.extend(data['income_sources'])
+        columns.expenses.extend(data['expenses'])
+        return columns
+
+    def apply(self, record):
+        """Mirror one change record (see ledger.apply_record)"""
+        op = record['op']
+        if op == 'add_income':
+            self.income.append(record['entry'])
+        elif op == 'add_expense':
+            self.expenses.append(record['entry'])
+        elif op == 'add_batch':
+            self.income.extend(record['income'])
+            self.expenses.extend(record['expenses'])
+        elif op in ('delete_income', 'delete_expense'):
+            columns = self.income if op == 'delete_income' else self.expenses
+            columns.pop(columns.find(record['id']) if 'id' in record else record['index'])
+        elif op in ('update_income', 'update_expense'):
+            columns = self.income if op == 'update_income' else self.expenses
+            columns.update(columns.find(record['id']), record['changes'])
+        elif op == 'clear':
+            self.income.clear()
+            self.expenses.clear()
+
+    def summarize(self, filters=None):
+        """Return (total income, total expenses, per-category totals) for a date range"""
+        start, end = epoch_bounds(filters or {})
+        return (self.income.total(start, end),
+                self.expenses.total(start, end),
+                self.expenses.category_totals(start, end))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Ledger Exporter
+Streaming CSV / NDJSON export with optional gzip
+"""
+
+import csv
+import io
+import json
+import zlib
+
+from ledger import matches_filters
+
+EXPORT_FIELDS = ['type', 'date', 'category', 'description', 'amount']
+EXPORT_CHUNK_SIZE = 1000
+
+
+def to_export_record(kind, entry):
+    """Flatten an income or expense entry into the export columns"""
+    if kind == 'income':
+        return {'type': 'income', 'date': entry['date'], 'category': '',
+                'description': entry['source'], 'amount': entry['amount']}
+    return {'type': 'expense', 'date': entry['date'], 'category': entry['category'],
+            'description': entry['description'], 'amount': entry['amount']}
+
+
+def iter_ledger_entries(data, kind, filters):
+    """Yield matching entries from an in-memory ledger"""
+    for entry in data[kind]:
+        if matches_filters(entry, filters):
+            yield entry
+
+
+def iter_backend_entries(backend, user_id, kind, filters, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield matching entries from a storage backend one page at a time"""
+    after = None
+    while True:
+        page, after = backend.page(user_id, kind, filters, after, chunk_size)
+        yield from page
+        if after is None:
+            return
+
+
+def iter_export_records(income_entries, expense_entries):
+    """Yield export records for income entries, then expenses"""
+    for entry in income_entries:
+        yield to_export_record('income', entry)
+    for entry in expense_entries:
+        yield to_export_record('expense', entry)
+
+
+def iter_export(records, fmt, chunk_size=EXPORT_CHUNK_SIZE):
+    """Encode export records as CSV or NDJSON text, chunk_size rows at a time"""
+    if fmt not in ('csv', 'ndjson'):
+        raise ValueError(f"Unsupported export format: {fmt}")
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    if fmt == 'csv':
+        writer.writeheader()
+    rows = 0
+    for record in records:
+        if fmt == 'csv':
+            writer.writerow(record)
+        else:
+            buffer.write(json.dumps(record) + '\n')
+        rows += 1
+        if rows % chunk_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def gzip_chunks(chunks):
+    """Gzip-compress a stream of text chunks incrementally"""
+    compressor = zlib.compressobj(wbits=31)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk.encode('utf-8'))
+        if compressed:
+            yield compressed
+    yield compressor.flush()
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Fleet Report
+Savings rates and category spend distributions across every user's ledger
+"""
+
+import argparse
+import contextlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+from functools import partial
+
+from ledger import ensure_aggregates, summarize_aggregates
+from recurring import combine_summaries, recurring_rules, summarize_rules
+from storage import JournalStore
+from tenants import DATA_SUFFIX, iter_shard_files, top_shards, user_ids
+
+# Task name for ledgers still in the flat, pre-sharding layout
+ROOT_TASK = '.'
+
+# Per-user category spend is counted into log-scale buckets, this many per
+# power of ten, from 10**MIN_DECADE up; the buckets merge by addition, so
+# workers can summarize their share without keeping every value
+BUCKETS_PER_DECADE = 10
+MIN_DECADE = -2
+BUCKET_COUNT = 12 * BUCKETS_PER_DECADE
+
+PERCENTILES = (50, 90, 99)
+
+# The checkpoint is rewritten at most this often, and once at the end
+CHECKPOINT_INTERVAL = 2.0
+
+CHECKPOINT_VERSION = 1
+
+
+def new_stats():
+    """Return empty partial aggregates"""
+    return {'ledgers': 0, 'errors': 0, 'modes': {}}
+
+
+def _new_mode():
+    return {
+        'users': 0,
+        'total_income': 0.0,
+        'total_expenses': 0.0,
+        'savings_users': 0,
+        'savings_rate_sum': 0.0,
+        'categories': {}
+    }
+
+
+def _new_distribution():
+    return {'users': 0, 'total': 0.0, 'min': None, 'max': None, 'buckets': [0] * BUCKET_COUNT}
+
+
+def _bucket(amount):
+    if amount <= 0:
+        return 0
+    index = math.floor((math.log10(amount) - MIN_DECADE) * BUCKETS_PER_DECADE)
+    return min(max(index, 0), BUCKET_COUNT - 1)
+
+
+def add_ledger(stats, data):
+    """Count one user's ledger into partial aggregates"""
+    income, expenses, categories = combine_summaries(summarize_aggregates(ensure_aggregates(data)),
+                                                     summarize_rules(recurring_rules(data)))
+    mode = stats['modes'].setdefault(data['mode'] or 'none', _new_mode())
+    mode['users'] += 1
+    mode['total_income'] += income
+    mode['total_expenses'] += expenses
+    if income > 0:
+        mode['savings_users'] += 1
+        mode['savings_rate_sum'] += (income - expenses) / income * 100
+    for category, spent in categories.items():
+        distribution = mode['categories'].setdefault(category, _new_distribution())
+        distribution['users'] += 1
+        distribution['total'] += spent
+        distribution['min'] = spent if distribution['min'] is None else min(distribution['min'], spent)
+        distribution['max'] = spent if distribution['max'] is None else max(distribution['max'], spent)
+        distribution['buckets'][_bucket(spent)] += 1
+    stats['ledgers'] += 1
+
+
+def merge_stats(into, other):
+    """Add one set of partial aggregates into another"""
+    into['ledgers'] += other['ledgers']
+    into['errors'] += other['errors']
+    for name, theirs in other['modes'].items():
+        mode = into['modes'].setdefault(name, _new_mode())
+        for key in ('users', 'total_income', 'total_expenses', 'savings_users', 'savings_rate_sum'):
+            mode[key] += theirs[key]
+        for category, source in theirs['categories'].items():
+            distribution = mode['categories'].setdefault(category, _new_distribution())
+            distribution['users'] += source['users']
+            distribution['total'] += source['total']
+            for key, pick in (('min', min), ('max', max)):
+                if distribution[key] is None:
+                    distribution[key] = source[key]
+                elif source[key] is not None:
+                    distribution[key] = pick(distribution[key], source[key])
+            distribution['buckets'] = [a + b for a, b in zip(distribution['buckets'], source['buckets'])]
+    return into
+
+
+def _percentile(distribution, percent):
+    """Estimate a percentile from the buckets, as the geometric middle of its bucket"""
+    rank = math.ceil(distribution['users'] * percent / 100)
+    seen = 0
+    for index, count in enumerate(distribution['buckets']):
+        seen += count
+        if seen >= rank:
+            value = 10 ** (MIN_DECADE + (index + 0.5) / BUCKETS_PER_DECADE)
+            return round(min(max(value, distribution['min']), distribution['max']), 2)
+    return distribution['max']
+
+
+def report_task(data_dir, task):
+    """Aggregate every ledger in one top-level shard (or the flat root) of data_dir"""
+    if task == ROOT_TASK:
+        files = ((user_id, os.path.join(data_dir, user_id + DATA_SUFFIX))
+                 for user_id in user_ids(os.listdir(data_dir)))
+    else:
+        files = iter_shard_files(data_dir, task)
+    stats = new_stats()
+    for _, path in files:
+        try:
+            data = JournalStore(path).load()
+        except (OSError, ValueError, KeyError, IndexError):
+            stats['errors'] += 1
+            continue
+        add_ledger(stats, data)
+    return task, stats
+
+
+def build_report(stats):
+    """Turn merged aggregates into per-mode averages and distribution summaries"""
+    modes = {}
+    for name, mode in sorted(stats['modes'].items()):
+        categories = {}
+        for category, distribution in sorted(mode['categories'].items()):
+            summary = {
+                'users': distribution['users'],
+                'total': distribution['total'],
+                'mean': distribution['total'] / distribution['users'],
+                'min': distribution['min']
+            }
+            for percent in PERCENTILES:
+                summary[f'p{percent}'] = _percentile(distribution, percent)
+            summary['max'] = distribution['max']
+            categories[category] = summary
+        income, expenses = mode['total_income'], mode['total_expenses']
+        modes[name] = {
+            'users': mode['users'],
+            'users_with_income': mode['savings_users'],
+            'average_savings_rate': (mode['savings_rate_sum'] / mode['savings_users']
+                                     if mode['savings_users'] else 0),
+            'overall_savings_rate': (income - expenses) / income * 100 if income > 0 else 0,
+            'total_income': income,
+            'total_expenses': expenses,
+            'categories': categories
+        }
+    return {'ledgers': stats['ledgers'], 'errors': stats['errors'], 'modes': modes}
+
+
+def load_checkpoint(path, data_dir):
+    """Return (finished tasks, partial aggregates) from a checkpoint, or a fresh start"""
+    try:
+        with open(path) as f:
+            checkpoint = json.load(f)
+    except FileNotFoundError:
+        return set(), new_stats()
+    if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('data_dir') != data_dir:
+        raise ValueError(f"Checkpoint {path} belongs to another report")
+    return set(checkpoint['done']), checkpoint['stats']
+
+
+def save_checkpoint(path, data_dir, done, stats):
+    """Atomically write the finished tasks and their merged aggregates"""
+    temp_path = path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump({'version': CHECKPOINT_VERSION, 'data_dir': data_dir,
+                   'done': sorted(done), 'stats': stats}, f)
+    os.replace(temp_path, path)
+
+
+def run_report(data_dir, workers=None, checkpoint=None, progress=None):
+    """Aggregate every ledger under data_dir across a pool of worker processes.
+
+    Each task covers one top-level shard directory (about 1/256 of the
+    users), and its partial aggregates are merged as it finishes. With a
+    checkpoint path, finished tasks and the merged aggregates are saved
+    as the job runs, and a rerun skips the tasks already done.
+    progress(done, total, ledgers) is called after each task.
+    """
+    data_dir = os.path.abspath(data_dir)
+    tasks = [ROOT_TASK] + top_shards(data_dir)
+    done, stats = load_checkpoint(checkpoint, data_dir) if checkpoint else (set(), new_stats())
+    pending = [task for task in tasks if task not in done]
+    workers = workers or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    last_saved = started
+    run = partial(report_task, data_dir)
+    with contextlib.ExitStack() as stack:
+        if workers > 1 and len(pending) > 1:
+            pool = stack.enter_context(multiprocessing.Pool(workers))
+            results = pool.imap_unordered(run, pending)
+        else:
+            results = map(run, pending)
+        for task, partial_stats in results:
+            merge_stats(stats, partial_stats)
+            done.add(task)
+            if progress:
+                progress(len(done), len(tasks), stats['ledgers'])
+            if checkpoint and time.perf_counter() - last_saved >= CHECKPOINT_INTERVAL:
+                save_checkpoint(checkpoint, data_dir, done, stats)
+                last_saved = time.perf_counter()
+    if checkpoint:
+        save_checkpoint(checkpoint, data_dir, done, stats)
+
+    report = build_report(stats)
+    report['data_dir'] = data_dir
+    report['workers'] = workers
+    report['elapsed_seconds'] = time.perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--data-dir', default='user_data')
+    parser.add_argument('--workers', type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument('--checkpoint', help="Save progress here and resume from it if present")
+    parser.add_argument('--quiet', action='store_true', help="Do not report progress on stderr")
+    parser.add_argument('-o', '--output', help="Also write the report to this file")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+
+    def progress(done, total, ledgers):
+        rate = ledgers / max(time.perf_counter() - started, 1e-9)
+        end = '\r' if sys.stderr.isatty() and done < total else '\n'
+        print(f"  {done}/{total} shards, {ledgers:,} ledgers ({rate:,.0f}/s)", end=end, file=sys.stderr)
+
+    try:
+        report = run_report(args.data_dir, args.workers, args.checkpoint,
+                            None if args.quiet else progress)
+    except ValueError as e:
+        sys.exit(f"✗ {e}")
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
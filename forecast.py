@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Forecast
+Vectorized cash-flow projection with Monte Carlo bands over month rollups
+"""
+
+import calendar
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+
+try:
+    import numpy as np
+except ImportError:  # Forecasts need NumPy; everything else runs without it
+    np = None
+
+from recurring import summarize_rules
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+DEFAULT_PATHS = 2000
+MAX_PATHS = 20000
+
+# Months averaged for the current level, and history needed before
+# calendar-month seasonality is estimated (two of each month)
+MOVING_AVERAGE_MONTHS = 6
+SEASONAL_MIN_MONTHS = 24
+
+# Percentiles reported for balances and category spend
+BANDS = (10, 50, 90)
+
+# Forecasts kept per process; each is a few kilobytes
+CACHE_MAX_ENTRIES = 256
+
+
+def _month_number(period):
+    return int(period[:4]) * 12 + int(period[5:7]) - 1
+
+
+def _period(number):
+    return f'{number // 12:04d}-{number % 12 + 1:02d}'
+
+
+def _month_end(number):
+    year, month = number // 12, number % 12 + 1
+    return date(year, month, calendar.monthrange(year, month)[1])
+
+
+def history_matrix(series, categories, stop):
+    """Return a (months, 1 + categories) matrix of income and per-category spend.
+
+    Rows run from the first month in the rollup series to the month
+    before stop, with months that have no entries left at zero.
+    """
+    months = [_month_number(bucket['period']) for bucket in series]
+    first = min(months, default=stop)
+    history = np.zeros((max(stop - first, 0), 1 + len(categories)))
+    columns = {category: column for column, category in enumerate(categories, 1)}
+    for number, bucket in zip(months, series):
+        if number >= stop:
+            continue
+        row = history[number - first]
+        row[0] = bucket['income']
+        for category, amount in bucket['categories'].items():
+            row[columns[category]] = amount
+    return history, first
+
+
+def fit(history, first, window=MOVING_AVERAGE_MONTHS):
+    """Return (level, seasonal offsets, one-step residuals) for a history matrix.
+
+    Seasonal offsets are each calendar month's mean less the overall
+    mean, and are zero until SEASONAL_MIN_MONTHS of history exist. The
+    level is the moving average of the last window deseasonalized
+    months. Residuals are what each month differed from the moving
+    average of the months before it, the errors the Monte Carlo paths
+    resample.
+    """
+    count, width = history.shape
+    seasonal = np.zeros((12, width))
+    if not count:
+        return np.zeros(width), seasonal, np.zeros((0, width))
+    calendar_months = (first + np.arange(count)) % 12
+    if count >= SEASONAL_MIN_MONTHS:
+        sums = np.zeros((12, width))
+        np.add.at(sums, calendar_months, history)
+        seasonal = sums / np.bincount(calendar_months, minlength=12)[:, None] - history.mean(axis=0)
+    adjusted = history - seasonal[calendar_months]
+    level = adjusted[-window:].mean(axis=0)
+
+    # Trailing means by cumulative sums: month t is fitted from months [t - window, t)
+    totals = np.vstack([np.zeros(width), np.cumsum(adjusted, axis=0)])
+    months = np.arange(1, count)
+    starts = np.maximum(months - window, 0)
+    fitted = (totals[months] - totals[starts]) / (months - starts)[:, None]
+    residuals = history[1:] - fitted - seasonal[calendar_months[1:]]
+    return level, seasonal, residuals
+
+
+def recurring_matrix(rules, categories, today, start, months):
+    """Return the (months, 1 + categories) recurring income and spend falling due in each future month.
+
+    The first month also counts occurrences still to come this month,
+    which the current balance does not hold yet.
+    """
+    scheduled = np.zeros((months, 1 + len(categories)))
+    if not rules:
+        return scheduled
+    horizon = _month_end(start + months - 1)
+    columns = {category: column for column, category in enumerate(categories, 1)}
+    for offset in range(months):
+        period = _period(start + offset)
+        date_from = (today + timedelta(days=1)).isoformat() if offset == 0 else period
+        income, _, spent = summarize_rules(rules, {'from': date_from, 'to': period}, horizon)
+        scheduled[offset, 0] = income
+        for category, amount in spent.items():
+            scheduled[offset, columns[category]] = amount
+    return scheduled
+
+
+def project(series, rules, balance, months=DEFAULT_MONTHS, paths=DEFAULT_PATHS, today=None, seed=0):
+    """Project monthly income, spend and balance for the months after this one.
+
+    series holds month rollup buckets of entered transactions (as from
+    ledger.rollup_series), without recurring occurrences; recurring
+    rules are added as known amounts instead of being forecast. Every
+    path resamples whole historical months of residuals, which keeps
+    income and categories moving together, and paths are cumulated into
+    balances from the current balance. The seed makes results repeatable.
+    Raises RuntimeError when NumPy is not installed.
+    """
+    if np is None:
+        raise RuntimeError('Forecasts need NumPy')
+    today = today or date.today()
+    start = today.year * 12 + today.month
+    categories = sorted({category for bucket in series for category in bucket['categories']}
+                        | {rule['category'] for rule in rules if rule['type'] == 'expense'})
+    history, first = history_matrix(series, categories, start - 1)
+    level, seasonal, residuals = fit(history, first)
+
+    future_months = (start + np.arange(months)) % 12
+    expected = np.maximum(level + seasonal[future_months], 0.0)
+    scheduled = recurring_matrix(rules, categories, today, start, months)
+
+    # (paths, months, 1 + categories) simulated amounts
+    if len(residuals):
+        draws = np.random.default_rng(seed).integers(0, len(residuals), size=(paths, months))
+        simulated = np.maximum(expected + residuals[draws], 0.0) + scheduled
+    else:
+        simulated = np.broadcast_to(expected + scheduled, (paths,) + scheduled.shape)
+    net = simulated[:, :, 0] - simulated[:, :, 1:].sum(axis=2)
+    balances = balance + np.cumsum(net, axis=1)
+
+    balance_bands = np.percentile(balances, BANDS, axis=0)
+    spend_bands = np.percentile(simulated[:, :, 1:], BANDS, axis=0)
+    means = simulated.mean(axis=0)
+    projection = []
+    for offset in range(months):
+        income = float(means[offset, 0])
+        expenses = float(means[offset, 1:].sum())
+        month = {
+            'period': _period(start + offset),
+            'income': income,
+            'expenses': expenses,
+            'net': income - expenses,
+            'balance': {'mean': float(balances[:, offset].mean())},
+            'categories': {}
+        }
+        for band, values in zip(BANDS, balance_bands):
+            month['balance'][f'p{band}'] = float(values[offset])
+        for column, category in enumerate(categories):
+            if not means[offset, column + 1]:
+                continue
+            spend = {'expected': float(means[offset, column + 1])}
+            for band, values in zip(BANDS, spend_bands):
+                spend[f'p{band}'] = float(values[offset, column])
+            month['categories'][category] = spend
+        projection.append(month)
+
+    income, expenses = float(means[:, 0].sum()), float(means[:, 1:].sum())
+    return {
+        'as_of': today.isoformat(),
+        'months': months,
+        'paths': paths,
+        'history_months': len(history),
+        'seasonal': len(history) >= SEASONAL_MIN_MONTHS,
+        'starting_balance': balance,
+        'projected_savings_rate': (income - expenses) / income * 100 if income > 0 else 0,
+        # Share of paths whose balance drops below zero at some point
+        'shortfall_probability': float((balances < 0).any(axis=1).mean()),
+        'projection': projection
+    }
+
+
+class ForecastCache:
+    """Per-process LRU cache of forecasts.
+
+    Each result remembers the version it was built at, normally the
+    ledger version and the day, and is rebuilt once either has moved on.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached forecast if it was built at version"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key, version, result):
+        """Cache a forecast, evicting the least recently used over the cap"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (version, result)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Forget every cached forecast"""
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Ledger Core
+Ledger mutations and incrementally maintained aggregates
+"""
+
+# Rollup granularities and the length of the date prefix that keys them
+ROLLUP_KEYS = {'day': 10, 'month': 7}
+
+ENTRY_KINDS = ('income_sources', 'expenses')
+
+# Change records for recurring rules, which add nothing to the aggregates
+RULE_OPS = ('add_rule', 'update_rule', 'delete_rule')
+
+
+def empty_ledger():
+    """Return a fresh, empty ledger"""
+    return {
+        'mode': None,
+        'income_sources': [],
+        'expenses': [],
+        'next_id': 1,
+        'aggregates': new_aggregates()
+    }
+
+
+def new_aggregates():
+    """Return an empty aggregate block with empty day and month rollups"""
+    return {
+        'total_income': 0.0,
+        'total_expenses': 0.0,
+        'categories': {},
+        'rollups': {granularity: {} for granularity in ROLLUP_KEYS}
+    }
+
+
+def compute_aggregates(data):
+    """Recompute the aggregate block from scratch"""
+    aggregates = new_aggregates()
+    for entry in data['income_sources']:
+        _count_income(aggregates, entry, 1)
+    for entry in data['expenses']:
+        _count_expense(aggregates, entry, 1)
+    return aggregates
+
+
+def ensure_aggregates(data):
+    """Return the ledger's aggregates, building them for older files"""
+    if 'aggregates' not in data or 'rollups' not in data['aggregates']:
+        data['aggregates'] = compute_aggregates(data)
+    return data['aggregates']
+
+
+def ensure_ids(data):
+    """Give every entry a stable id, numbering older files' entries in order"""
+    if 'next_id' not in data:
+        next_id = 1 + max((entry.get('id', 0) for kind in ENTRY_KINDS for entry in data[kind]),
+                          default=0)
+        for kind in ENTRY_KINDS:
+            for entry in data[kind]:
+                if 'id' not in entry:
+                    entry['id'] = next_id
+                    next_id += 1
+        data['next_id'] = next_id
+    return data
+
+
+def _assign_id(data, entry):
+    """Number a new entry with the ledger's next id.
+
+    A replayed entry keeps the id it was journaled with. Journals
+    written before ids were assigned under the store lock may hold an
+    id another process took first, which is then renumbered so replay
+    stays unique.
+    """
+    if entry.get('id', 0) < data['next_id']:
+        entry['id'] = data['next_id']
+    data['next_id'] = entry['id'] + 1
+
+
+def added_entries(record):
+    """Return the entries and rules a change record adds, in the order they are numbered"""
+    op = record['op']
+    if op in ('add_income', 'add_expense'):
+        return [record['entry']]
+    if op == 'add_batch':
+        return record['income'] + record['expenses']
+    if op == 'add_rule':
+        return [record['rule']]
+    return []
+
+
+def replay_next_id(records, next_id):
+    """Number the entries records add as replay onto a ledger whose next id was next_id would.
+
+    Returns the ledger's next id after them.
+    """
+    counter = {'next_id': next_id}
+    for record in records:
+        for entry in added_entries(record):
+            _assign_id(counter, entry)
+    return counter['next_id']
+
+
+def _bisect_id(entries, entry_id):
+    """Return the position of the first entry whose id is at least entry_id"""
+    low, high = 0, len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if entries[middle]['id'] < entry_id:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+def find_entry(entries, entry_id):
+    """Return the list position of the entry with an id.
+
+    Entries are appended in id order, so this is a binary search.
+    Raises KeyError if no entry has the id.
+    """
+    position = _bisect_id(entries, entry_id)
+    if position == len(entries) or entries[position]['id'] != entry_id:
+        raise KeyError(entry_id)
+    return position
+
+
+def summarize_aggregates(aggregates):
+    """Return (total income, total expenses, per-category totals) from an aggregate block"""
+    return (aggregates['total_income'], aggregates['total_expenses'],
+            {cat: bucket['amount'] for cat, bucket in aggregates['categories'].items()})
+
+
+def verify_aggregates(data, tolerance=0.005):
+    """Check the stored aggregates against a full recompute.
+
+    Any drift is repaired in place. Returns True if the stored block
+    already matched.
+    """
+    stored = ensure_aggregates(data)
+    actual = compute_aggregates(data)
+    matches = (
+        abs(stored['total_income'] - actual['total_income']) <= tolerance
+        and abs(stored['total_expenses'] - actual['total_expenses']) <= tolerance
+        and stored['categories'].keys() == actual['categories'].keys()
+        and all(
+            stored['categories'][cat]['count'] == bucket['count']
+            and abs(stored['categories'][cat]['amount'] - bucket['amount']) <= tolerance
+            for cat, bucket in actual['categories'].items()
+        )
+    )
+    data['aggregates'] = actual
+    return matches
+
+
+def _roll(aggregates, entry, sign, category=None):
+    """Add an entry to its day and month rollup buckets"""
+    for granularity, length in ROLLUP_KEYS.items():
+        buckets = aggregates['rollups'][granularity]
+        key = entry['date'][:length]
+        bucket = buckets.setdefault(
+            key, {'income': 0.0, 'expenses': 0.0, 'count': 0, 'categories': {}})
+        bucket['count'] += sign
+        if category is None:
+            bucket['income'] += sign * entry['amount']
+        else:
+            bucket['expenses'] += sign * entry['amount']
+            bucket['categories'][category] = (bucket['categories'].get(category, 0.0)
+                                              + sign * entry['amount'])
+            if abs(bucket['categories'][category]) < 1e-9:
+                del bucket['categories'][category]
+        if bucket['count'] <= 0:
+            del buckets[key]
+
+
+def _count_income(aggregates, entry, sign):
+    aggregates['total_income'] += sign * entry['amount']
+    _roll(aggregates, entry, sign)
+
+
+def _count_expense(aggregates, entry, sign):
+    aggregates['total_expenses'] += sign * entry['amount']
+    bucket = aggregates['categories'].setdefault(
+        entry['category'], {'amount': 0.0, 'count': 0})
+    bucket['amount'] += sign * entry['amount']
+    bucket['count'] += sign
+    if bucket['count'] <= 0:
+        del aggregates['categories'][entry['category']]
+    _roll(aggregates, entry, sign, entry['category'])
+
+
+# Entry list and aggregate counter touched by each per-entry operation
+ENTRY_OPS = {
+    'delete_income': ('income_sources', _count_income),
+    'update_income': ('income_sources', _count_income),
+    'delete_expense': ('expenses', _count_expense),
+    'update_expense': ('expenses', _count_expense)
+}
+
+
+def rollup_series(aggregates, granularity, filters=None):
+    """Return the rollup buckets for a granularity within a date range, oldest first"""
+    filters = filters or {}
+    length = ROLLUP_KEYS[granularity]
+    start = filters.get('from', '')[:length]
+    end = filters.get('to', '')[:length]
+    series = []
+    for key in sorted(aggregates['rollups'][granularity]):
+        if (start and key < start) or (end and key > end):
+            continue
+        bucket = aggregates['rollups'][granularity][key]
+        series.append({
+            'period': key,
+            'income': bucket['income'],
+            'expenses': bucket['expenses'],
+            'net': bucket['income'] - bucket['expenses'],
+            'categories': bucket['categories']
+        })
+    return series
+
+
+def apply_record(data, record):
+    """Apply one change record to a ledger in place.
+
+    New entries are given the ledger's next id. Deletes and updates
+    name their entry by id; deletes journaled before entries had ids
+    name a list index instead. Returns the entry that was added, changed
+    or removed, if any. Raises KeyError for an unknown id.
+    """
+    aggregates = ensure_aggregates(data)
+    ensure_ids(data)
+    op = record['op']
+    if op == 'set_mode':
+        data['mode'] = record['mode']
+    elif op == 'add_income':
+        _assign_id(data, record['entry'])
+        data['income_sources'].append(record['entry'])
+        _count_income(aggregates, record['entry'], 1)
+        return record['entry']
+    elif op == 'add_expense':
+        _assign_id(data, record['entry'])
+        data['expenses'].append(record['entry'])
+        _count_expense(aggregates, record['entry'], 1)
+        return record['entry']
+    elif op == 'add_batch':
+        for entry in record['income']:
+            _assign_id(data, entry)
+            data['income_sources'].append(entry)
+            _count_income(aggregates, entry, 1)
+        for entry in record['expenses']:
+            _assign_id(data, entry)
+            data['expenses'].append(entry)
+            _count_expense(aggregates, entry, 1)
+    elif op in ('delete_income', 'delete_expense'):
+        kind, count = ENTRY_OPS[op]
+        entries = data[kind]
+        position = find_entry(entries, record['id']) if 'id' in record else record['index']
+        entry = entries.pop(position)
+        count(aggregates, entry, -1)
+        return entry
+    elif op in ('update_income', 'update_expense'):
+        kind, count = ENTRY_OPS[op]
+        entry = data[kind][find_entry(data[kind], record['id'])]
+        count(aggregates, entry, -1)
+        entry.update(record['changes'])
+        count(aggregates, entry, 1)
+        return entry
+    elif op == 'set_budget':
+        # A None limit removes the category's limit
+        budgets = data.setdefault('budgets', {})
+        if record['limit'] is None:
+            budgets.pop(record['category'], None)
+        else:
+            budgets[record['category']] = record['limit']
+    elif op in RULE_OPS:
+        if op == 'add_rule':
+            _assign_id(data, record['rule'])
+        return apply_rule_record(data.setdefault('recurring', []), record)
+    elif op == 'clear':
+        data['income_sources'] = []
+        data['expenses'] = []
+        data.pop('recurring', None)
+        data['aggregates'] = new_aggregates()
+    else:
+        raise ValueError(f"Unknown ledger operation: {op}")
+    return None
+
+
+def apply_rule_record(rules, record):
+    """Apply an add_rule, update_rule or delete_rule record to a list of rules in place.
+
+    Added rules must already carry their id. Returns the rule added,
+    changed or removed. Raises KeyError for an unknown id.
+    """
+    if record['op'] == 'add_rule':
+        rules.append(record['rule'])
+        return record['rule']
+    position = find_entry(rules, record['id'])
+    if record['op'] == 'update_rule':
+        rules[position].update(record['changes'])
+        return rules[position]
+    return rules.pop(position)
+
+
+def touched_entries(records):
+    """Return, per kind, the ids of the entries a run of change records added, changed or removed.
+
+    Returns None if a record cleared the ledger or names its entry by
+    list index or not at all (records journaled before entries had ids),
+    since the touched entries cannot then be told apart.
+    """
+    touched = {kind: set() for kind in ENTRY_KINDS}
+    try:
+        for record in records:
+            op = record['op']
+            if op == 'add_income':
+                touched['income_sources'].add(record['entry']['id'])
+            elif op == 'add_expense':
+                touched['expenses'].add(record['entry']['id'])
+            elif op == 'add_batch':
+                touched['income_sources'].update(entry['id'] for entry in record['income'])
+                touched['expenses'].update(entry['id'] for entry in record['expenses'])
+            elif op in ENTRY_OPS:
+                touched[ENTRY_OPS[op][0]].add(record['id'])
+            elif op == 'clear':
+                return None
+    except KeyError:
+        return None
+    return touched
+
+
+def matches_filters(entry, filters):
+    """Check an entry against date, category and amount filters"""
+    if 'from' in filters and entry['date'] < filters['from']:
+        return False
+    if 'to' in filters and entry['date'][:len(filters['to'])] > filters['to']:
+        return False
+    if 'category' in filters and entry.get('category') != filters['category']:
+        return False
+    if 'min_amount' in filters and entry['amount'] < filters['min_amount']:
+        return False
+    if 'max_amount' in filters and entry['amount'] > filters['max_amount']:
+        return False
+    return True
+
+
+def page_entries(entries, filters, after, limit):
+    """Return one page of matching entries and the cursor for the next.
+
+    The cursor is the id of the last entry returned, so each page resumes
+    where the previous one stopped, even if earlier entries were deleted
+    in between, instead of re-scanning.
+    """
+    page = []
+    position = _bisect_id(entries, after + 1) if after is not None else 0
+    while position < len(entries):
+        entry = entries[position]
+        if matches_filters(entry, filters):
+            page.append(entry)
+            if len(page) == limit:
+                break
+        position += 1
+    next_cursor = entry['id'] if len(page) == limit and position + 1 < len(entries) else None
+    return page, next_cursor
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Metrics
+In-process counters and histograms rendered in Prometheus text format
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+# Prometheus' default latency buckets, in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for value in labels.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(labels, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Counter:
+    """A monotonically increasing value per label set"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter for a label set"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    @contextmanager
+    def time(self, **labels):
+        """Add the seconds spent inside the block to the counter"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        """Yield (suffix, labels, value) for every label set"""
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield '', dict(zip(self.labelnames, key)), value
+
+
+class Gauge(Counter):
+    """A value that is set rather than accumulated"""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        """Set the gauge for a label set"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Observations counted into cumulative buckets per label set"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """Record one observation"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One slot per bucket, then +Inf, then the running sum
+                counts = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            else:
+                counts[len(self.buckets)] += 1
+            counts[-1] += value
+
+    def samples(self):
+        """Yield (suffix, labels, value) for buckets, count and sum"""
+        with self._lock:
+            values = [(key, list(counts)) for key, counts in self._values.items()]
+        for key, counts in values:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _format_value(bound)
+                yield '_bucket', dict(labels, le=le), cumulative
+            yield '_count', labels, cumulative
+            yield '_sum', labels, counts[-1]
+
+
+class Registry:
+    """A set of metrics that can be rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        """Add a metric and return it"""
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        """Register a new counter"""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        """Register a new gauge"""
+        return self.register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        """Register a new histogram"""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for suffix, labels, value in metric.samples():
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+LEDGER_BYTES_READ = REGISTRY.counter(
+    'budget_buddy_ledger_bytes_read_total',
+    'Bytes of snapshot and journal files read', ['file'])
+LEDGER_BYTES_WRITTEN = REGISTRY.counter(
+    'budget_buddy_ledger_bytes_written_total',
+    'Bytes of snapshot and journal files written', ['file'])
+PARSE_SECONDS = REGISTRY.counter(
+    'budget_buddy_json_parse_seconds_total',
+    'Time spent decoding JSON', ['source'])
+SERIALIZE_SECONDS = REGISTRY.counter(
+    'budget_buddy_json_serialize_seconds_total',
+    'Time spent encoding JSON', ['target'])
+DISK_SECONDS = REGISTRY.counter(
+    'budget_buddy_disk_seconds_total',
+    'Time spent reading, writing and fsyncing ledger files', ['operation'])
+AGGREGATION_SECONDS = REGISTRY.counter(
+    'budget_buddy_aggregation_seconds_total',
+    'Time spent computing totals, breakdowns, range summaries and trends', ['operation'])
+CACHE_LOOKUPS = REGISTRY.counter(
+    'budget_buddy_ledger_cache_lookups_total',
+    'Ledger cache lookups by result', ['result'])
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Recurring Transactions
+Recurring income and expense rules, with occurrences materialized on demand
+"""
+
+import calendar
+import math
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from functools import lru_cache
+
+from ledger import ROLLUP_KEYS, matches_filters
+
+# Step between occurrences per cadence, as (months, days)
+CADENCES = {
+    'weekly': (0, 7),
+    'biweekly': (0, 14),
+    'monthly': (1, 0),
+    'quarterly': (3, 0),
+    'yearly': (12, 0)
+}
+
+# Ledger list each rule type adds its occurrences to
+RULE_KINDS = {'income': 'income_sources', 'expense': 'expenses'}
+
+# Fields a rule may be changed in after it is made, per type
+EDITABLE_RULE_FIELDS = {
+    'income': ('source', 'amount', 'end'),
+    'expense': ('category', 'description', 'amount', 'end')
+}
+
+# Occurrences are dated at the start of their day
+OCCURRENCE_TIME = ' 00:00:00'
+
+# Cached schedule spans; each is a key of short strings and two numbers,
+# well under a kilobyte
+CACHE_SIZE = 4096
+
+# Date runs are about 76 bytes per occurrence (a 19-character string and
+# its tuple slot). Runs up to a full listing page are cached, so the date
+# cache holds at most about 76 KB per entry and 10 MB in all; longer runs,
+# such as a trends series over years of a weekly rule, are rebuilt.
+CACHED_RUN_MAX = 1000
+DATES_CACHE_SIZE = 128
+
+
+def recurring_rules(data):
+    """Return a ledger's recurring rules, oldest first"""
+    return data['recurring'] if 'recurring' in data else []
+
+
+def occurrence_date(start, cadence, number):
+    """Return the ledger timestamp of a schedule's occurrence, counting from 0.
+
+    Monthly cadences keep the start's day of the month, or the month's
+    last day when it is shorter.
+    """
+    months, days = CADENCES[cadence]
+    if days:
+        day = start + timedelta(days=days * number)
+    else:
+        month = start.month - 1 + months * number
+        year, month = start.year + month // 12, month % 12 + 1
+        day = date(year, month, min(start.day, calendar.monthrange(year, month)[1]))
+    return day.isoformat() + OCCURRENCE_TIME
+
+
+class _Schedule:
+    """The first count occurrence dates of a schedule, as a lazy sorted sequence for bisect"""
+
+    def __init__(self, start, cadence, count):
+        self.start = start
+        self.cadence = cadence
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, number):
+        return occurrence_date(self.start, self.cadence, number)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def schedule_span(start, end, cadence, date_from, date_to, today):
+    """Return the [first, stop) occurrence numbers of a schedule within a date range.
+
+    Only occurrences on or before today (and the rule's end, if any) are
+    due. date_from and date_to follow ledger.matches_filters: date_from
+    is compared whole and date_to as a prefix, so '2024-05' includes all
+    of May. Found by bisection, so the cost does not grow with the span.
+    """
+    first_day = date.fromisoformat(start)
+    last = min(today, end) if end else today
+    if last < start:
+        return 0, 0
+    last_day = date.fromisoformat(last)
+    months, days = CADENCES[cadence]
+    if days:
+        count = (last_day - first_day).days // days + 1
+    else:
+        count = ((last_day.year - first_day.year) * 12 + last_day.month - first_day.month) // months + 1
+    schedule = _Schedule(first_day, cadence, count)
+    stop = bisect_right(schedule, last, key=lambda value: value[:len(last)])
+    if date_to:
+        stop = min(stop, bisect_right(schedule, date_to, key=lambda value: value[:len(date_to)]))
+    first = bisect_left(schedule, date_from) if date_from else 0
+    return first, max(first, stop)
+
+
+def schedule_dates(start, cadence, first, stop):
+    """Return the ledger timestamps of a schedule's occurrences first to stop - 1.
+
+    Runs of up to CACHED_RUN_MAX occurrences are cached.
+    """
+    if stop - first <= CACHED_RUN_MAX:
+        return _cached_dates(start, cadence, first, stop)
+    return _dates(start, cadence, first, stop)
+
+
+def _dates(start, cadence, first, stop):
+    start = date.fromisoformat(start)
+    return tuple(occurrence_date(start, cadence, number) for number in range(first, stop))
+
+
+_cached_dates = lru_cache(maxsize=DATES_CACHE_SIZE)(_dates)
+
+
+def _today(today):
+    return (today or date.today()).isoformat()
+
+
+def rule_span(rule, filters=None, today=None):
+    """Return the [first, stop) occurrence numbers of a rule due by today within from/to filters"""
+    filters = filters or {}
+    return schedule_span(rule['start'], rule.get('end'), rule['cadence'],
+                         filters.get('from'), filters.get('to'), _today(today))
+
+
+def describe_rule(rule, today=None):
+    """Return a rule with the number of occurrences due so far and the date of the next one"""
+    _, due = rule_span(rule, today=today)
+    upcoming = occurrence_date(date.fromisoformat(rule['start']), rule['cadence'], due)
+    if rule.get('end') and upcoming[:10] > rule['end']:
+        upcoming = None
+    return dict(rule, occurrences=due, next_date=upcoming)
+
+
+def rule_entry(rule, date_value):
+    """Return one occurrence of a rule as a ledger entry, marked with the rule's id"""
+    if rule['type'] == 'income':
+        entry = {'source': rule['source']}
+    else:
+        entry = {'category': rule['category'], 'description': rule['description']}
+    entry['amount'] = rule['amount']
+    entry['date'] = date_value
+    entry['rule_id'] = rule['id']
+    return entry
+
+
+def rule_occurrences(rule, filters=None, today=None):
+    """Materialize a rule's occurrences due by today within from/to filters, oldest first"""
+    first, stop = rule_span(rule, filters, today)
+    return [rule_entry(rule, date_value)
+            for date_value in schedule_dates(rule['start'], rule['cadence'], first, stop)]
+
+
+def parse_occurrence_cursor(cursor):
+    """Parse a '<rule id>:<occurrence number>' cursor. Raises ValueError if malformed"""
+    rule_id, number = cursor.split(':')
+    return int(rule_id), int(number)
+
+
+def page_occurrences(rules, kind, filters, after, limit, today=None):
+    """Return one page of the occurrences of every income_sources or expenses rule that match filters.
+
+    Occurrences run in rule id order, then by date. after is the
+    (rule id, occurrence number) of the last one already returned, and
+    the cursor for the next page is given in the same form as a string.
+    Only the returned occurrences are materialized.
+    """
+    filters = filters or {}
+    # An occurrence's category and amount are its rule's, so one check per rule covers them
+    undated = {key: value for key, value in filters.items() if key not in ('from', 'to')}
+    page = []
+    for rule in rules:
+        if RULE_KINDS[rule['type']] != kind or (after is not None and rule['id'] < after[0]):
+            continue
+        if not matches_filters(rule_entry(rule, ''), undated):
+            continue
+        first, stop = rule_span(rule, filters, today)
+        if after is not None and rule['id'] == after[0]:
+            first = max(first, after[1] + 1)
+        if first >= stop:
+            continue
+        if len(page) == limit:
+            # This rule still has occurrences for the next page
+            return page, cursor
+        end = min(stop, first + limit - len(page))
+        page.extend(rule_entry(rule, date_value)
+                    for date_value in schedule_dates(rule['start'], rule['cadence'], first, end))
+        cursor = f"{rule['id']}:{end - 1}"
+        if end < stop:
+            return page, cursor
+    return page, None
+
+
+def summarize_rules(rules, filters=None, today=None):
+    """Return (income, expenses, per-category expenses) of the occurrences due within from/to filters.
+
+    Occurrences are counted, not materialized, so the cost is per rule
+    whatever its span.
+    """
+    income = expenses = 0.0
+    categories = {}
+    for rule in rules:
+        first, stop = rule_span(rule, filters, today)
+        amount = rule['amount'] * (stop - first)
+        if rule['type'] == 'income':
+            income += amount
+        elif amount:
+            expenses += amount
+            categories[rule['category']] = categories.get(rule['category'], 0.0) + amount
+    return income, expenses, categories
+
+
+def combine_summaries(first, second):
+    """Add two (income, expenses, per-category expenses) summaries"""
+    categories = dict(first[2])
+    for category, amount in second[2].items():
+        categories[category] = categories.get(category, 0.0) + amount
+    return first[0] + second[0], first[1] + second[1], categories
+
+
+def rules_month_spent(rules, category, month, today=None):
+    """Return the recurring spending due in one category and YYYY-MM month"""
+    return summarize_rules([rule for rule in rules if rule.get('category') == category],
+                           {'from': month, 'to': month}, today)[1]
+
+
+def merge_series(series, rules, granularity, filters=None, today=None):
+    """Add the rules' occurrences within from/to filters to rollup buckets from ledger.rollup_series"""
+    if not rules:
+        return series
+    length = ROLLUP_KEYS[granularity]
+    buckets = {bucket['period']: dict(bucket, categories=dict(bucket['categories'])) for bucket in series}
+    for rule in rules:
+        first, stop = rule_span(rule, filters, today)
+        for date_value in schedule_dates(rule['start'], rule['cadence'], first, stop):
+            bucket = buckets.setdefault(date_value[:length], {
+                'period': date_value[:length], 'income': 0.0, 'expenses': 0.0, 'net': 0.0,
+                'categories': {}})
+            if rule['type'] == 'income':
+                bucket['income'] += rule['amount']
+            else:
+                bucket['expenses'] += rule['amount']
+                bucket['categories'][rule['category']] = (
+                    bucket['categories'].get(rule['category'], 0.0) + rule['amount'])
+            bucket['net'] = bucket['income'] - bucket['expenses']
+    return [buckets[period] for period in sorted(buckets)]
+
+
+def _text(value, name):
+    if not isinstance(value, str) or not value.strip():
+        raise ValueError(f'invalid {name}')
+    return value.strip()
+
+
+def _amount(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('invalid amount')
+    amount = float(value)
+    if not (amount > 0 and math.isfinite(amount)):
+        raise ValueError('amount must be a positive number')
+    return amount
+
+
+def _day(value, name):
+    if not isinstance(value, str):
+        raise ValueError(f'invalid {name}')
+    try:
+        return date.fromisoformat(value.strip()[:10]).isoformat()
+    except ValueError:
+        raise ValueError(f'invalid {name}, use YYYY-MM-DD')
+
+
+def parse_rule(payload, categories, today=None):
+    """Validate a new rule's fields into a rule without an id.
+
+    Rules start today unless a start date is given, and run until an
+    optional end date. Raises ValueError on a missing or invalid field.
+    """
+    payload = payload if isinstance(payload, dict) else {}
+    rule_type = payload.get('type')
+    if rule_type not in RULE_KINDS:
+        raise ValueError('type must be income or expense')
+    rule = {'type': rule_type}
+    if rule_type == 'income':
+        rule['source'] = _text(payload.get('source'), 'source')
+    else:
+        if payload.get('category') not in categories:
+            raise ValueError('unknown category')
+        rule['category'] = payload['category']
+        rule['description'] = _text(payload.get('description') or rule['category'], 'description')
+    rule['amount'] = _amount(payload.get('amount'))
+    if payload.get('cadence') not in CADENCES:
+        raise ValueError(f"cadence must be one of {', '.join(CADENCES)}")
+    rule['cadence'] = payload['cadence']
+    rule['start'] = _day(payload['start'], 'start') if payload.get('start') else _today(today)
+    rule['end'] = _day(payload['end'], 'end') if payload.get('end') else None
+    if rule['end'] is not None and rule['end'] < rule['start']:
+        raise ValueError('end is before start')
+    return rule
+
+
+def parse_rule_changes(payload, rule, categories):
+    """Validate a rule PATCH body into the fields to change.
+
+    A null end makes the rule open-ended. Raises ValueError on unknown
+    fields or invalid values.
+    """
+    if not isinstance(payload, dict) or not payload:
+        raise ValueError('nothing to change')
+    changes = {}
+    for key, value in payload.items():
+        if key not in EDITABLE_RULE_FIELDS[rule['type']]:
+            raise ValueError(f'{key} cannot be changed')
+        if key == 'amount':
+            changes[key] = _amount(value)
+        elif key == 'end':
+            changes[key] = _day(value, 'end') if value else None
+            if changes[key] is not None and changes[key] < rule['start']:
+                raise ValueError('end is before start')
+        elif key == 'category':
+            if value not in categories:
+                raise ValueError('unknown category')
+            changes[key] = value
+        else:
+            changes[key] = _text(value, key)
+    return changes
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Search Index
+Inverted index over transaction descriptions and income sources
+"""
+
+import heapq
+import math
+import re
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+
+from ledger import RULE_OPS, apply_record, find_entry, matches_filters
+
+# Searchable text per kind, and the result type it is reported as
+LABEL_KEYS = {'income_sources': 'source', 'expenses': 'description'}
+RESULT_TYPES = {'income_sources': 'income', 'expenses': 'expense'}
+
+# The last query term also matches longer terms it prefixes, up to this many
+MAX_EXPANSIONS = 32
+
+# A prefix-only match scores this fraction of an exact one
+PREFIX_WEIGHT = 0.5
+
+_TOKEN = re.compile(r'\w+')
+
+
+@lru_cache(maxsize=65536)
+def terms(text):
+    """Return the distinct lowercase search terms in a piece of text"""
+    return tuple(dict.fromkeys(_TOKEN.findall(text.lower())))
+
+
+def _label_terms(kind, entry):
+    label = entry.get(LABEL_KEYS[kind])
+    return terms(label) if isinstance(label, str) else ()
+
+
+def _contains(postings, entry_id):
+    position = bisect_left(postings, entry_id)
+    return position < len(postings) and postings[position] == entry_id
+
+
+def _intersect_newest_first(lists):
+    """Yield ids present in every sorted list, highest first"""
+    lists = sorted(lists, key=len)
+    for entry_id in reversed(lists[0]):
+        if all(_contains(other, entry_id) for other in lists[1:]):
+            yield entry_id
+
+
+def _tagged(stream, kind):
+    for entry_id in stream:
+        yield entry_id, kind
+
+
+class SearchIndex:
+    """Sorted entry ids per term, kept in step with a ledger.
+
+    Each kind maps every term in its entries' text to an ``array('q')``
+    of entry ids. Ids grow with insertion, so adds are appends and a
+    query walks the posting lists newest first, intersecting them by
+    binary search. Results come out lazily, so a page costs about the
+    same on ten entries or ten million.
+    """
+
+    def __init__(self):
+        self.postings = {kind: {} for kind in LABEL_KEYS}
+        self.size = 0
+        self._vocabulary = None
+
+    @classmethod
+    def from_ledger(cls, data):
+        """Index every entry of a dict-based ledger"""
+        index = cls()
+        for kind in LABEL_KEYS:
+            for entry in data[kind]:
+                index.add(kind, entry)
+        return index
+
+    def add(self, kind, entry):
+        """Index one entry"""
+        entry_id = entry['id']
+        postings = self.postings[kind]
+        for term in _label_terms(kind, entry):
+            ids = postings.get(term)
+            if ids is None:
+                ids = postings[term] = array('q')
+                self._vocabulary = None
+            if not ids or ids[-1] < entry_id:
+                ids.append(entry_id)
+            else:
+                ids.insert(bisect_left(ids, entry_id), entry_id)
+        self.size += 1
+
+    def remove(self, kind, entry):
+        """Drop one entry from the index"""
+        entry_id = entry['id']
+        postings = self.postings[kind]
+        for term in _label_terms(kind, entry):
+            ids = postings.get(term)
+            if ids is None:
+                continue
+            position = bisect_left(ids, entry_id)
+            if position < len(ids) and ids[position] == entry_id:
+                del ids[position]
+            if not ids:
+                del postings[term]
+                self._vocabulary = None
+        self.size -= 1
+
+    def apply(self, data, record):
+        """Apply a change record to a ledger and mirror it in the index.
+
+        Returns what ledger.apply_record returns.
+        """
+        op = record['op']
+        if op in RULE_OPS:
+            # Recurring rules are not indexed
+            return apply_record(data, record)
+        kind = ('income_sources' if op.endswith('_income') else 'expenses')
+        before = None
+        if op.startswith(('delete_', 'update_')):
+            # Read the entry's old text before the record changes it
+            entries = data[kind]
+            entry = entries[find_entry(entries, record['id']) if 'id' in record else record['index']]
+            before = {LABEL_KEYS[kind]: entry.get(LABEL_KEYS[kind]), 'id': entry['id']}
+        result = apply_record(data, record)
+        if op == 'add_batch':
+            for entry in record['income']:
+                self.add('income_sources', entry)
+            for entry in record['expenses']:
+                self.add('expenses', entry)
+        elif op.startswith('add_'):
+            self.add(kind, result)
+        elif op.startswith('delete_'):
+            self.remove(kind, before)
+        elif op.startswith('update_') and LABEL_KEYS[kind] in record['changes']:
+            self.remove(kind, before)
+            self.add(kind, result)
+        elif op == 'clear':
+            self.__init__()
+        return result
+
+    def _expand(self, prefix):
+        """Return up to MAX_EXPANSIONS indexed terms starting with prefix"""
+        if self._vocabulary is None:
+            self._vocabulary = sorted(set().union(*self.postings.values()))
+        position = bisect_left(self._vocabulary, prefix)
+        expansions = []
+        while (position < len(self._vocabulary) and len(expansions) < MAX_EXPANSIONS
+               and self._vocabulary[position].startswith(prefix)):
+            expansions.append(self._vocabulary[position])
+            position += 1
+        return expansions
+
+    def _idf(self, term):
+        frequency = sum(len(postings.get(term, ())) for postings in self.postings.values())
+        return math.log(1 + self.size / frequency) if frequency else 0.0
+
+    def _tiers(self, query, kinds):
+        """Yield (score, newest-first id stream per kind) from best to worst"""
+        query_terms = terms(query)
+        if not query_terms:
+            return
+        *leading, last = query_terms
+        base = sum(self._idf(term) for term in leading)
+        tiers = []
+        for term in self._expand(last):
+            weight = 1.0 if term == last else PREFIX_WEIGHT
+            tiers.append((base + weight * self._idf(term), term))
+        tiers.sort(key=lambda tier: -tier[0])
+        for score, term in tiers:
+            streams = {}
+            for kind in kinds:
+                postings = self.postings[kind]
+                lists = [postings.get(query_term) for query_term in leading] + [postings.get(term)]
+                if all(ids is not None for ids in lists):
+                    streams[kind] = _intersect_newest_first(lists)
+            yield score, streams
+
+    def search(self, data, query, filters=None, after=None, limit=50):
+        """Return one page of ranked matches and the cursor for the next.
+
+        Every term of the query must appear in an entry's description or
+        source; the last may also be the start of a longer word. Rarer
+        terms and exact words rank higher, and ties go to the newest entry.
+        The cursor is the number of results already returned.
+        """
+        filters = filters or {}
+        kinds = ['expenses'] if 'category' in filters else list(LABEL_KEYS)
+        skip = after or 0
+        results = []
+        seen = set()
+        for score, streams in self._tiers(query, kinds):
+            merged = heapq.merge(*(_tagged(stream, kind) for kind, stream in streams.items()),
+                                 reverse=True)
+            for entry_id, kind in merged:
+                if (kind, entry_id) in seen:
+                    continue
+                seen.add((kind, entry_id))
+                entry = data[kind][find_entry(data[kind], entry_id)]
+                if not matches_filters(entry, filters):
+                    continue
+                if skip:
+                    skip -= 1
+                    continue
+                if len(results) == limit:
+                    return results, (after or 0) + limit
+                results.append({'type': RESULT_TYPES[kind], 'score': round(score, 4),
+                                'entry': entry})
+        return results, None
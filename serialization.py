@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Serialization
+Compact JSON through the fastest available encoder, and response compression
+"""
+
+import json
+import os
+import zlib
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the encoder in use, for benchmarks and diagnostics
+JSON_BACKEND = 'orjson' if orjson is not None else 'json'
+
+# Separators for compact stdlib output
+COMPACT_SEPARATORS = (',', ':')
+
+if orjson is not None:
+    # Dates and dataclasses go to default, as they would with the stdlib
+    ORJSON_OPTIONS = (orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+                      | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+# Responses smaller than this are sent uncompressed
+MIN_COMPRESS_SIZE = int(os.environ.get('BUDGET_BUDDY_COMPRESS_MIN_BYTES', 1024))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+COMPRESSIBLE_TYPES = {
+    'application/json', 'application/javascript', 'application/x-ndjson', 'image/svg+xml'
+}
+
+
+def dumps(obj, sort_keys=False, default=None):
+    """Encode obj as compact UTF-8 JSON bytes.
+
+    orjson is used when installed. Anything it refuses (lone surrogates,
+    integers beyond 64 bits, non-string keys) falls back to the stdlib.
+    NaN and infinities are written as null, so callers keep amounts finite.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=default,
+                                option=(ORJSON_OPTIONS | orjson.OPT_SORT_KEYS) if sort_keys
+                                else ORJSON_OPTIONS)
+        except TypeError:
+            pass
+    return json.dumps(obj, sort_keys=sort_keys, default=default,
+                      separators=COMPACT_SEPARATORS).encode('ascii')
+
+
+def loads(raw):
+    """Decode JSON from bytes or str, compact or indented.
+
+    Input orjson rejects but the stdlib accepts (NaN, lone surrogate
+    escapes) is retried with the stdlib. Raises ValueError if neither can
+    decode it.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(raw)
+        except ValueError:
+            pass
+    return json.loads(raw)
+
+
+@lru_cache(maxsize=None)
+def _brotli():
+    """Import brotli on first use, returning None when it is not installed"""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def compressible(content_type):
+    """Check whether a Content-Type is worth compressing"""
+    mimetype = content_type.split(';', 1)[0].strip().lower()
+    return mimetype.startswith('text/') or mimetype in COMPRESSIBLE_TYPES
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None to send as is.
+
+    The highest q-value wins; on a tie brotli is preferred when installed.
+    """
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip().lower() == 'q':
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+        weights[name] = weight
+    encodings = ('br', 'gzip') if _brotli() is not None else ('gzip',)
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(body, encoding):
+    """Compress a response body with an encoding from negotiate_encoding"""
+    if encoding == 'br':
+        return _brotli().compress(body, quality=BROTLI_QUALITY)
+    return zlib.compress(body, GZIP_LEVEL, wbits=31)
@@ -0,0 +1,721 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy SQLite Storage Backend
+Indexed per-entity tables with pooled WAL-mode connections
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from budgets import budget_limits
+from ledger import ROLLUP_KEYS, new_aggregates
+from recurring import recurring_rules
+from serialization import dumps, loads
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    user_id TEXT PRIMARY KEY,
+    mode TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    modified REAL
+);
+CREATE TABLE IF NOT EXISTS income (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    amount REAL NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS expenses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    description TEXT NOT NULL,
+    amount REAL NOT NULL,
+    date TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_income_user_date ON income (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_date ON expenses (user_id, date);
+CREATE INDEX IF NOT EXISTS idx_expenses_user_category ON expenses (user_id, category);
+CREATE TABLE IF NOT EXISTS budgets (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    monthly_limit REAL NOT NULL,
+    PRIMARY KEY (user_id, category)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recurring_rules (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    rule TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recurring_rules_user ON recurring_rules (user_id);
+"""
+
+# Running spend per user, category and YYYY-MM month, kept in step with the
+# expenses table by triggers so a budget check is one primary-key lookup
+SPENDING_SCHEMA = """
+CREATE TABLE IF NOT EXISTS category_months (
+    user_id TEXT NOT NULL,
+    category TEXT NOT NULL,
+    month TEXT NOT NULL,
+    amount REAL NOT NULL,
+    PRIMARY KEY (user_id, category, month)
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS category_months_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO category_months VALUES (new.user_id, new.category, substr(new.date, 1, 7), new.amount)
+        ON CONFLICT DO UPDATE SET amount = amount + excluded.amount;
+END;
+CREATE TRIGGER IF NOT EXISTS category_months_delete AFTER DELETE ON expenses BEGIN
+    UPDATE category_months SET amount = amount - old.amount
+        WHERE user_id = old.user_id AND category = old.category AND month = substr(old.date, 1, 7);
+END;
+CREATE TRIGGER IF NOT EXISTS category_months_update
+AFTER UPDATE OF category, amount, date ON expenses BEGIN
+    UPDATE category_months SET amount = amount - old.amount
+        WHERE user_id = old.user_id AND category = old.category AND month = substr(old.date, 1, 7);
+    INSERT INTO category_months VALUES (new.user_id, new.category, substr(new.date, 1, 7), new.amount)
+        ON CONFLICT DO UPDATE SET amount = amount + excluded.amount;
+END;
+"""
+
+# Full-text indexes over income sources and expense descriptions, kept in
+# step with their tables by triggers
+SEARCH_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS income_search
+    USING fts5(source, content='income', content_rowid='id');
+CREATE VIRTUAL TABLE IF NOT EXISTS expenses_search
+    USING fts5(description, content='expenses', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS income_search_insert AFTER INSERT ON income BEGIN
+    INSERT INTO income_search (rowid, source) VALUES (new.id, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS income_search_delete AFTER DELETE ON income BEGIN
+    INSERT INTO income_search (income_search, rowid, source) VALUES ('delete', old.id, old.source);
+END;
+CREATE TRIGGER IF NOT EXISTS income_search_update AFTER UPDATE OF source ON income BEGIN
+    INSERT INTO income_search (income_search, rowid, source) VALUES ('delete', old.id, old.source);
+    INSERT INTO income_search (rowid, source) VALUES (new.id, new.source);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_search_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO expenses_search (rowid, description) VALUES (new.id, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_search_delete AFTER DELETE ON expenses BEGIN
+    INSERT INTO expenses_search (expenses_search, rowid, description)
+        VALUES ('delete', old.id, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_search_update AFTER UPDATE OF description ON expenses BEGIN
+    INSERT INTO expenses_search (expenses_search, rowid, description)
+        VALUES ('delete', old.id, old.description);
+    INSERT INTO expenses_search (rowid, description) VALUES (new.id, new.description);
+END;
+"""
+
+# The user version at which each entry was last added, changed or deleted,
+# kept by triggers for the sync change feed. A save bumps users.version
+# after its row changes, so the triggers stamp rows with version + 1.
+SYNC_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entry_versions (
+    user_id TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (user_id, kind, entry_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_entry_versions_user_version ON entry_versions (user_id, version);
+CREATE TRIGGER IF NOT EXISTS income_versions_insert AFTER INSERT ON income BEGIN
+    INSERT INTO entry_versions VALUES (new.user_id, 'income_sources', new.id,
+        COALESCE((SELECT version FROM users WHERE user_id = new.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+CREATE TRIGGER IF NOT EXISTS income_versions_delete AFTER DELETE ON income BEGIN
+    INSERT INTO entry_versions VALUES (old.user_id, 'income_sources', old.id,
+        COALESCE((SELECT version FROM users WHERE user_id = old.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+CREATE TRIGGER IF NOT EXISTS income_versions_update AFTER UPDATE ON income BEGIN
+    INSERT INTO entry_versions VALUES (new.user_id, 'income_sources', new.id,
+        COALESCE((SELECT version FROM users WHERE user_id = new.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_versions_insert AFTER INSERT ON expenses BEGIN
+    INSERT INTO entry_versions VALUES (new.user_id, 'expenses', new.id,
+        COALESCE((SELECT version FROM users WHERE user_id = new.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_versions_delete AFTER DELETE ON expenses BEGIN
+    INSERT INTO entry_versions VALUES (old.user_id, 'expenses', old.id,
+        COALESCE((SELECT version FROM users WHERE user_id = old.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+CREATE TRIGGER IF NOT EXISTS expenses_versions_update AFTER UPDATE ON expenses BEGIN
+    INSERT INTO entry_versions VALUES (new.user_id, 'expenses', new.id,
+        COALESCE((SELECT version FROM users WHERE user_id = new.user_id), 0) + 1)
+        ON CONFLICT DO UPDATE SET version = excluded.version;
+END;
+"""
+
+INCOME_COLUMNS = ('source', 'amount', 'date')
+EXPENSE_COLUMNS = ('category', 'description', 'amount', 'date')
+TABLES = {
+    'income_sources': ('income', INCOME_COLUMNS),
+    'expenses': ('expenses', EXPENSE_COLUMNS)
+}
+# Per kind: table, searchable column and the category column expression
+SEARCH_COLUMNS = {
+    'income_sources': ('income', 'source', 'NULL'),
+    'expenses': ('expenses', 'description', 't.category')
+}
+RECORD_KINDS = {
+    'delete_income': 'income_sources',
+    'update_income': 'income_sources',
+    'delete_expense': 'expenses',
+    'update_expense': 'expenses'
+}
+
+
+def _add_filter_clauses(filters, clauses, params, prefix=''):
+    """Append WHERE clauses and parameters for listing filters on prefixed columns"""
+    if 'from' in filters:
+        clauses.append(f'{prefix}date >= ?')
+        params.append(filters['from'])
+    if 'to' in filters:
+        # '~' sorts after every timestamp character, making 'to' inclusive
+        clauses.append(f'{prefix}date < ?')
+        params.append(filters['to'] + '~')
+    if 'category' in filters:
+        clauses.append(f'{prefix}category = ?')
+        params.append(filters['category'])
+    if 'min_amount' in filters:
+        clauses.append(f'{prefix}amount >= ?')
+        params.append(filters['min_amount'])
+    if 'max_amount' in filters:
+        clauses.append(f'{prefix}amount <= ?')
+        params.append(filters['max_amount'])
+
+
+def _entry(row, columns):
+    """Build an entry dict from a row, with its row id as the entry id"""
+    entry = {column: row[column] for column in columns}
+    entry['id'] = row['id']
+    return entry
+
+
+class ConnectionPool:
+    """Fixed-size pool of SQLite connections for one worker process.
+
+    The pool is rebuilt if it is used from a forked child, since SQLite
+    connections must not cross a fork.
+    """
+
+    def __init__(self, db_path, size=8, timeout=30.0):
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                               check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._idle = queue.Queue(maxsize=self.size)
+                for _ in range(self.size):
+                    self._idle.put(self._connect())
+                self._pid = os.getpid()
+            return self._idle
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection, committing on success and rolling back on error"""
+        idle = self._ensure_pool()
+        conn = idle.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            idle.put(conn)
+
+
+class SQLiteLedger(dict):
+    """A user's ledger whose lists and aggregates are queried on first access.
+
+    Only ``mode`` is fetched up front, so routes that never touch the
+    transaction lists never load them.
+    """
+
+    LAZY_KEYS = ('income_sources', 'expenses', 'aggregates', 'budgets', 'recurring')
+
+    def __init__(self, backend, user_id, mode):
+        super().__init__(mode=mode)
+        self.backend = backend
+        self.user_id = user_id
+
+    def __contains__(self, key):
+        return key in self.LAZY_KEYS or super().__contains__(key)
+
+    def __missing__(self, key):
+        if key == 'income_sources':
+            value = self.backend.list_income(self.user_id)
+        elif key == 'expenses':
+            value = self.backend.list_expenses(self.user_id)
+        elif key == 'aggregates':
+            value = self.backend.aggregates(self.user_id)
+        elif key == 'budgets':
+            value = self.backend.budgets(self.user_id)
+        elif key == 'recurring':
+            value = self.backend.recurring(self.user_id)
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def invalidate(self):
+        """Drop fetched lists and aggregates so they are re-queried"""
+        for key in self.LAZY_KEYS:
+            self.pop(key, None)
+
+
+class SQLiteBackend:
+    """Ledgers stored as rows in a shared SQLite database"""
+
+    def __init__(self, db_path, pool_size=8):
+        self.pool = ConnectionPool(db_path, size=pool_size)
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = [row['name'] for row in conn.execute('PRAGMA table_info(users)')]
+            if 'version' not in columns:
+                conn.execute('ALTER TABLE users ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+            if 'modified' not in columns:
+                conn.execute('ALTER TABLE users ADD COLUMN modified REAL')
+            if 'sync_floor' not in columns:
+                # Versions up to the floor have no per-entry history
+                conn.execute('ALTER TABLE users ADD COLUMN sync_floor INTEGER NOT NULL DEFAULT 0')
+            indexed = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'expenses_search'").fetchone()
+            conn.executescript(SEARCH_SCHEMA)
+            if not indexed:
+                # Index the rows of a database created before search existed
+                conn.execute("INSERT INTO income_search (income_search) VALUES ('rebuild')")
+                conn.execute("INSERT INTO expenses_search (expenses_search) VALUES ('rebuild')")
+            counted = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'category_months'").fetchone()
+            conn.executescript(SPENDING_SCHEMA)
+            if not counted:
+                conn.execute(
+                    'INSERT INTO category_months SELECT user_id, category, substr(date, 1, 7), '
+                    'SUM(amount) FROM expenses GROUP BY 1, 2, 3')
+            versioned = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'entry_versions'").fetchone()
+            conn.executescript(SYNC_SCHEMA)
+            if not versioned:
+                # Changes made before the table existed were never recorded
+                conn.execute('UPDATE users SET sync_floor = version')
+
+    def load(self, user_id):
+        """Load a lazily-populated ledger for a user"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT mode FROM users WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return SQLiteLedger(self, user_id, row['mode'] if row else None)
+
+    def version(self, user_id):
+        """Return a number that changes whenever a user's ledger does"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT version FROM users WHERE user_id = ?',
+                               (user_id,)).fetchone()
+        return row['version'] if row else 0
+
+    def changes_since(self, user_id, version):
+        """Return (current version, {kind: ids touched after version}).
+
+        The second item is None if version predates the user's recorded
+        history (the last clear or full save) or is ahead of the ledger.
+        """
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT version, sync_floor FROM users WHERE user_id = ?',
+                               (user_id,)).fetchone()
+            current, floor = (row['version'], row['sync_floor']) if row else (0, 0)
+            if not floor <= version <= current:
+                return current, None
+            rows = conn.execute(
+                'SELECT kind, entry_id FROM entry_versions WHERE user_id = ? AND version > ?',
+                (user_id, version)).fetchall()
+        touched = {kind: set() for kind in TABLES}
+        for row in rows:
+            touched[row['kind']].add(row['entry_id'])
+        return current, touched
+
+    def entries(self, user_id, kind, ids):
+        """Return a user's income_sources or expenses with the given ids, skipping missing ones"""
+        table, columns = TABLES[kind]
+        ids = sorted(ids)
+        found = []
+        with self.pool.connection() as conn:
+            # Stay under SQLite's default limit on bound parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                found.extend(_entry(row, columns) for row in conn.execute(
+                    f'SELECT id, {", ".join(columns)} FROM {table} '
+                    f'WHERE user_id = ? AND id IN ({", ".join("?" for _ in chunk)}) ORDER BY id',
+                    (user_id, *chunk)))
+        return found
+
+    def list_tenants(self, after=None, limit=100):
+        """Return one page of users ordered by id with their entry counts, and the next cursor"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT user_id, NULL AS size_bytes, '
+                '(SELECT COUNT(*) FROM income WHERE income.user_id = users.user_id) AS income_count, '
+                '(SELECT COUNT(*) FROM expenses WHERE expenses.user_id = users.user_id) AS expense_count, '
+                'modified FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (after or '', limit + 1)).fetchall()
+        next_cursor = rows[limit - 1]['user_id'] if len(rows) > limit else None
+        return [dict(row) for row in rows[:limit]], next_cursor
+
+    def list_income(self, user_id):
+        """Fetch a user's income entries in insertion order"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT source, amount, date, id FROM income WHERE user_id = ? ORDER BY id',
+                (user_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def list_expenses(self, user_id):
+        """Fetch a user's expenses in insertion order"""
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                'SELECT category, description, amount, date, id FROM expenses '
+                'WHERE user_id = ? ORDER BY id',
+                (user_id,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def aggregates(self, user_id):
+        """Compute the aggregate block with SQL aggregates"""
+        aggregates = new_aggregates()
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT COALESCE(SUM(amount), 0.0) AS total FROM income WHERE user_id = ?',
+                (user_id,)).fetchone()
+            aggregates['total_income'] = row['total']
+            rows = conn.execute(
+                'SELECT category, SUM(amount) AS amount, COUNT(*) AS count '
+                'FROM expenses WHERE user_id = ? GROUP BY category',
+                (user_id,)).fetchall()
+        for row in rows:
+            aggregates['categories'][row['category']] = {
+                'amount': row['amount'],
+                'count': row['count']
+            }
+            aggregates['total_expenses'] += row['amount']
+        return aggregates
+
+    def budgets(self, user_id):
+        """Fetch a user's monthly limit per category"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT category, monthly_limit FROM budgets WHERE user_id = ?',
+                                (user_id,)).fetchall()
+        return {row['category']: row['monthly_limit'] for row in rows}
+
+    def recurring(self, user_id):
+        """Fetch a user's recurring rules, oldest first"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('SELECT id, rule FROM recurring_rules WHERE user_id = ? ORDER BY id',
+                                (user_id,)).fetchall()
+        return [dict(loads(row['rule']), id=row['id']) for row in rows]
+
+    def month_spent(self, user_id, category, month):
+        """Return a user's spending in one category and YYYY-MM month"""
+        with self.pool.connection() as conn:
+            row = conn.execute(
+                'SELECT amount FROM category_months WHERE user_id = ? AND category = ? AND month = ?',
+                (user_id, category, month)).fetchone()
+        return row['amount'] if row else 0.0
+
+    def page(self, user_id, kind, filters, after, limit):
+        """Return one page of matching rows and the cursor (row id) for the next"""
+        table, columns = TABLES[kind]
+        if 'category' in filters and 'category' not in columns:
+            return [], None
+        clauses = ['user_id = ?']
+        params = [user_id]
+        if after is not None:
+            clauses.append('id > ?')
+            params.append(after)
+        _add_filter_clauses(filters, clauses, params)
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f'SELECT id, {", ".join(columns)} FROM {table} '
+                f'WHERE {" AND ".join(clauses)} ORDER BY id LIMIT ?',
+                (*params, limit + 1)).fetchall()
+        next_cursor = rows[limit - 1]['id'] if len(rows) > limit else None
+        return [_entry(row, columns) for row in rows[:limit]], next_cursor
+
+    def search(self, user_id, query, filters, after, limit):
+        """Return one page of matches ranked by FTS5's bm25, and the cursor (an offset) for the next"""
+        from search import RESULT_TYPES, terms
+        query_terms = terms(query)
+        if not query_terms:
+            return [], None
+        # Every term must match; the last may also start a longer word
+        match = ' AND '.join(f'"{term}"' for term in query_terms) + '*'
+        selects = []
+        params = []
+        for kind in (('expenses',) if 'category' in filters else ('income_sources', 'expenses')):
+            table, label, category = SEARCH_COLUMNS[kind]
+            clauses = [f'{table}_search MATCH ?', 't.user_id = ?']
+            params.extend([match, user_id])
+            _add_filter_clauses(filters, clauses, params, 't.')
+            selects.append(
+                f"SELECT '{kind}' AS kind, -bm25({table}_search) AS score, t.id AS id, "
+                f"t.{label} AS label, {category} AS category, t.amount AS amount, t.date AS date "
+                f"FROM {table}_search JOIN {table} t ON t.id = {table}_search.rowid "
+                f"WHERE {' AND '.join(clauses)}")
+        offset = after or 0
+        with self.pool.connection() as conn:
+            rows = conn.execute(
+                f"{' UNION ALL '.join(selects)} ORDER BY score DESC, id DESC LIMIT ? OFFSET ?",
+                (*params, limit + 1, offset)).fetchall()
+        results = []
+        for row in rows[:limit]:
+            if row['kind'] == 'expenses':
+                entry = {'category': row['category'], 'description': row['label']}
+            else:
+                entry = {'source': row['label']}
+            entry.update(amount=row['amount'], date=row['date'], id=row['id'])
+            results.append({'type': RESULT_TYPES[row['kind']], 'score': round(row['score'], 4),
+                            'entry': entry})
+        return results, offset + limit if len(rows) > limit else None
+
+    def summarize(self, user_id, filters):
+        """Return (total income, total expenses, per-category totals) for a date range"""
+        clauses = ['user_id = ?']
+        params = [user_id]
+        if 'from' in filters:
+            clauses.append('date >= ?')
+            params.append(filters['from'])
+        if 'to' in filters:
+            clauses.append('date < ?')
+            params.append(filters['to'] + '~')
+        where = ' AND '.join(clauses)
+        with self.pool.connection() as conn:
+            total_income = conn.execute(
+                f'SELECT COALESCE(SUM(amount), 0.0) AS total FROM income WHERE {where}',
+                params).fetchone()['total']
+            rows = conn.execute(
+                f'SELECT category, SUM(amount) AS amount FROM expenses '
+                f'WHERE {where} GROUP BY category',
+                params).fetchall()
+        category_totals = {row['category']: row['amount'] for row in rows}
+        return total_income, sum(category_totals.values()), category_totals
+
+    def trends(self, user_id, granularity, filters):
+        """Return day or month buckets within a date range, grouped in SQL"""
+        length = ROLLUP_KEYS[granularity]
+
+        def where(column):
+            clauses = ['user_id = ?']
+            params = [user_id]
+            if 'from' in filters:
+                clauses.append(f'{column} >= ?')
+                params.append(filters['from'][:length])
+            if 'to' in filters:
+                clauses.append(f'{column} < ?')
+                params.append(filters['to'][:length] + '~')
+            return ' AND '.join(clauses), params
+
+        if granularity == 'month':
+            # category_months already holds these sums, so no expense rows are read
+            clause, params = where('month')
+            expense_query = (f'SELECT month AS period, category, amount FROM category_months '
+                             f'WHERE {clause} AND abs(amount) > 1e-9', params)
+        else:
+            clause, params = where('date')
+            expense_query = (f'SELECT substr(date, 1, {length}) AS period, category, SUM(amount) AS amount '
+                             f'FROM expenses WHERE {clause} GROUP BY period, category', params)
+        buckets = {}
+        with self.pool.connection() as conn:
+            clause, params = where('date')
+            for row in conn.execute(
+                    f'SELECT substr(date, 1, {length}) AS period, SUM(amount) AS amount '
+                    f'FROM income WHERE {clause} GROUP BY period', params):
+                buckets.setdefault(row['period'], {'income': 0.0, 'expenses': 0.0, 'categories': {}})
+                buckets[row['period']]['income'] = row['amount']
+            for row in conn.execute(*expense_query):
+                bucket = buckets.setdefault(row['period'], {'income': 0.0, 'expenses': 0.0, 'categories': {}})
+                bucket['expenses'] += row['amount']
+                bucket['categories'][row['category']] = row['amount']
+        return [{'period': period, 'income': bucket['income'], 'expenses': bucket['expenses'],
+                 'net': bucket['income'] - bucket['expenses'], 'categories': bucket['categories']}
+                for period, bucket in sorted(buckets.items())]
+
+    def _insert(self, conn, table, columns, user_id, entry):
+        cursor = conn.execute(
+            f'INSERT INTO {table} (user_id, {", ".join(columns)}) '
+            f'VALUES (?, {", ".join("?" for _ in columns)})',
+            (user_id, *(entry[column] for column in columns)))
+        entry['id'] = cursor.lastrowid
+
+    def _insert_many(self, conn, table, columns, user_id, entries):
+        conn.executemany(
+            f'INSERT INTO {table} (user_id, {", ".join(columns)}) '
+            f'VALUES (?, {", ".join("?" for _ in columns)})',
+            ((user_id, *(entry[column] for column in columns)) for entry in entries))
+
+    def _delete_at(self, conn, table, columns, user_id, index):
+        row = conn.execute(
+            f'SELECT id, {", ".join(columns)} FROM {table} '
+            'WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?',
+            (user_id, index)).fetchone()
+        if row is None:
+            raise IndexError(f"{table} index out of range")
+        conn.execute(f'DELETE FROM {table} WHERE id = ?', (row['id'],))
+        return _entry(row, columns)
+
+    def _fetch(self, conn, table, columns, user_id, entry_id):
+        row = conn.execute(
+            f'SELECT id, {", ".join(columns)} FROM {table} WHERE id = ? AND user_id = ?',
+            (entry_id, user_id)).fetchone()
+        if row is None:
+            raise KeyError(entry_id)
+        return _entry(row, columns)
+
+    def _delete_id(self, conn, table, columns, user_id, entry_id):
+        entry = self._fetch(conn, table, columns, user_id, entry_id)
+        conn.execute(f'DELETE FROM {table} WHERE id = ?', (entry_id,))
+        return entry
+
+    def _update(self, conn, table, columns, user_id, entry_id, changes):
+        entry = self._fetch(conn, table, columns, user_id, entry_id)
+        changes = {column: changes[column] for column in columns if column in changes}
+        if changes:
+            conn.execute(
+                f'UPDATE {table} SET {", ".join(f"{column} = ?" for column in changes)} '
+                'WHERE id = ?', (*changes.values(), entry_id))
+            entry.update(changes)
+        return entry
+
+    def _set_budget(self, conn, user_id, category, limit):
+        if limit is None:
+            conn.execute('DELETE FROM budgets WHERE user_id = ? AND category = ?',
+                         (user_id, category))
+        else:
+            conn.execute(
+                'INSERT INTO budgets VALUES (?, ?, ?) '
+                'ON CONFLICT (user_id, category) DO UPDATE SET monthly_limit = excluded.monthly_limit',
+                (user_id, category, limit))
+
+    def _insert_rule(self, conn, user_id, rule):
+        fields = {key: value for key, value in rule.items() if key != 'id'}
+        # A rule rewritten by a full save keeps its id; a new one is numbered
+        cursor = conn.execute('INSERT INTO recurring_rules (id, user_id, rule) VALUES (?, ?, ?)',
+                              (rule.get('id'), user_id, dumps(fields).decode('utf-8')))
+        rule['id'] = cursor.lastrowid
+
+    def _update_rule(self, conn, user_id, rule_id, changes):
+        row = conn.execute('SELECT rule FROM recurring_rules WHERE id = ? AND user_id = ?',
+                           (rule_id, user_id)).fetchone()
+        if row is None:
+            raise KeyError(rule_id)
+        rule = dict(loads(row['rule']), **changes)
+        conn.execute('UPDATE recurring_rules SET rule = ? WHERE id = ?',
+                     (dumps(rule).decode('utf-8'), rule_id))
+        return dict(rule, id=rule_id)
+
+    def _delete_rule(self, conn, user_id, rule_id):
+        row = conn.execute('SELECT rule FROM recurring_rules WHERE id = ? AND user_id = ?',
+                           (rule_id, user_id)).fetchone()
+        if row is None:
+            raise KeyError(rule_id)
+        conn.execute('DELETE FROM recurring_rules WHERE id = ?', (rule_id,))
+        return dict(loads(row['rule']), id=rule_id)
+
+    def _set_mode(self, conn, user_id, mode):
+        conn.execute(
+            'INSERT INTO users (user_id, mode) VALUES (?, ?) '
+            'ON CONFLICT (user_id) DO UPDATE SET mode = excluded.mode',
+            (user_id, mode))
+
+    def save(self, user_id, data, record=None):
+        """Apply a single record as SQL, or replace the ledger when none is given.
+
+        Returns the entry the record added or removed, if any.
+        """
+        result = None
+        if record is None:
+            # Fetch lazy lists before this transaction holds a pooled connection
+            income, expenses = data['income_sources'], data['expenses']
+            budgets = budget_limits(data)
+            rules = recurring_rules(data)
+        with self.pool.connection() as conn:
+            if record is None:
+                self._set_mode(conn, user_id, data['mode'])
+                conn.execute('DELETE FROM income WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
+                self._insert_many(conn, 'income', INCOME_COLUMNS, user_id, income)
+                self._insert_many(conn, 'expenses', EXPENSE_COLUMNS, user_id, expenses)
+                conn.execute('DELETE FROM budgets WHERE user_id = ?', (user_id,))
+                for category, limit in budgets.items():
+                    self._set_budget(conn, user_id, category, limit)
+                conn.execute('DELETE FROM recurring_rules WHERE user_id = ?', (user_id,))
+                for rule in rules:
+                    self._insert_rule(conn, user_id, rule)
+            elif record['op'] == 'set_mode':
+                self._set_mode(conn, user_id, record['mode'])
+                data['mode'] = record['mode']
+            elif record['op'] == 'set_budget':
+                self._set_budget(conn, user_id, record['category'], record['limit'])
+            elif record['op'] == 'add_income':
+                self._insert(conn, 'income', INCOME_COLUMNS, user_id, record['entry'])
+                result = record['entry']
+            elif record['op'] == 'add_expense':
+                self._insert(conn, 'expenses', EXPENSE_COLUMNS, user_id, record['entry'])
+                result = record['entry']
+            elif record['op'] == 'add_batch':
+                self._insert_many(conn, 'income', INCOME_COLUMNS, user_id, record['income'])
+                self._insert_many(conn, 'expenses', EXPENSE_COLUMNS, user_id, record['expenses'])
+            elif record['op'] in ('delete_income', 'delete_expense'):
+                table, columns = TABLES[RECORD_KINDS[record['op']]]
+                if 'id' in record:
+                    result = self._delete_id(conn, table, columns, user_id, record['id'])
+                else:
+                    result = self._delete_at(conn, table, columns, user_id, record['index'])
+            elif record['op'] in ('update_income', 'update_expense'):
+                table, columns = TABLES[RECORD_KINDS[record['op']]]
+                result = self._update(conn, table, columns, user_id,
+                                      record['id'], record['changes'])
+            elif record['op'] == 'add_rule':
+                self._insert_rule(conn, user_id, record['rule'])
+                result = record['rule']
+            elif record['op'] == 'update_rule':
+                result = self._update_rule(conn, user_id, record['id'], record['changes'])
+            elif record['op'] == 'delete_rule':
+                result = self._delete_rule(conn, user_id, record['id'])
+            elif record['op'] == 'clear':
+                conn.execute('DELETE FROM income WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM expenses WHERE user_id = ?', (user_id,))
+                conn.execute('DELETE FROM recurring_rules WHERE user_id = ?', (user_id,))
+            else:
+                raise ValueError(f"Unknown ledger operation: {record['op']}")
+            conn.execute(
+                'INSERT INTO users (user_id, version, modified) VALUES (?, 1, ?) '
+                'ON CONFLICT (user_id) DO UPDATE SET version = version + 1, '
+                'modified = excluded.modified',
+                (user_id, time.time()))
+            if record is None or record['op'] == 'clear':
+                # Every entry was replaced, so clients must resync in full
+                conn.execute('DELETE FROM entry_versions WHERE user_id = ?', (user_id,))
+                conn.execute('UPDATE users SET sync_floor = version WHERE user_id = ?', (user_id,))
+        if isinstance(data, SQLiteLedger):
+            data.invalidate()
+        return result
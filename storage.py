@@ -0,0 +1,953 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Storage Engine
+Append-only change journal with background snapshot compaction
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from binary_ledger import HEADER, MAGIC, BinaryLedger, dumps, header_seq, is_binary_ledger
+from budgets import month_spent
+from ledger import (added_entries, apply_record, empty_ledger, ensure_aggregates, ensure_ids,
+                    find_entry, page_entries, replay_next_id, rollup_series, touched_entries)
+from metrics import (CACHE_LOOKUPS, DISK_SECONDS, LEDGER_BYTES_READ, LEDGER_BYTES_WRITTEN,
+                     PARSE_SECONDS, SERIALIZE_SECONDS)
+from serialization import dumps as dumps_json, loads
+from tenants import DATA_SUFFIX, INDEX_FILE, TenantIndex, shard_dir, user_ids
+
+JOURNAL_SUFFIX = '.journal'
+COMPACTING_SUFFIX = '.compacting'
+# The last folded journal is kept so sync clients can still fetch its changes
+HISTORY_SUFFIX = '.history'
+LOCK_SUFFIX = '.lock'
+COMPACT_LOCK_SUFFIX = '.compact.lock'
+
+# Compact the snapshot once the journal holds this many records or bytes
+COMPACT_MAX_RECORDS = 1000
+COMPACT_MAX_BYTES = 1024 * 1024
+
+# Extra seconds a group-commit leader waits for more records before
+# writing. Records queued while a write is in flight always share the
+# next write, so this only needs raising for very bursty workloads.
+GROUP_COMMIT_WINDOW = float(os.environ.get('BUDGET_BUDDY_GROUP_COMMIT_WINDOW', 0))
+
+# Default limits for the in-process ledger cache
+CACHE_MAX_ENTRIES = 256
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Structures derived from a ledger, cached beside it under (user_id, name)
+# and kept in step by applying each change record
+DERIVED_VIEWS = ('columns', 'search')
+
+_SNAPSHOT_SEQ = re.compile(rb'"journal_seq":\s*(\d+)')
+_SNAPSHOT_MODE = re.compile(rb'"mode":\s*(null|"(?:[^"\\]|\\.)*")')
+_SNAPSHOT_NEXT_ID = re.compile(rb'"next_id":\s*(\d+)')
+
+
+class FileLock:
+    """Exclusive lock on a file, held across threads and processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self._thread_lock = threading.Lock()
+        self._file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock, returning False if blocking is off and it is held"""
+        if not self._thread_lock.acquire(blocking):
+            return False
+        f = open(self.path, 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+            else:
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+        except OSError:
+            f.close()
+            self._thread_lock.release()
+            if blocking:
+                raise
+            return False
+        self._file = f
+        return True
+
+    def release(self):
+        """Release the lock"""
+        f, self._file = self._file, None
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        f.close()
+        self._thread_lock.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class PendingCommit:
+    """A journal record waiting for its group commit"""
+
+    def __init__(self, record):
+        self.record = record
+        self.error = None
+        self.done = threading.Event()
+
+
+def _tail_seq(path):
+    """Return the seq of the last complete record in a journal file"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return 0
+    with f:
+        position = f.seek(0, os.SEEK_END)
+        buffer = b''
+        while position > 0:
+            step = min(8192, position)
+            position -= step
+            f.seek(position)
+            buffer = f.read(step) + buffer
+            lines = buffer.split(b'\n')
+            # The first line may be cut off unless we have read from the start
+            candidates = lines if position == 0 else lines[1:]
+            for line in reversed(candidates):
+                try:
+                    return loads(line)['seq']
+                except (ValueError, KeyError):
+                    continue
+    return 0
+
+
+class JournalStore:
+    """Ledger stored as a JSON or binary snapshot plus an append-only journal.
+
+    Every mutation appends one fsync'd line to ``<snapshot>.journal``.
+    Records submitted while another write is in flight are group-committed
+    into a single write and fsync. Writers in any thread or process are
+    serialized by an exclusive lock on ``<snapshot>.lock``, and snapshots
+    are written to a temp file and swapped in with ``os.replace``. New
+    entries get their final id while that lock is held, after catching
+    up on any records another process wrote, so the id a save returns
+    is always the one stored.
+
+    Once the journal grows past the record or byte threshold it is
+    rotated aside and folded into a new snapshot on a background thread.
+    Each record carries a sequence number and the snapshot remembers the
+    last one it contains, so a crash half-way through compaction never
+    replays a record twice.
+    """
+
+    def __init__(self, snapshot_path, max_records=COMPACT_MAX_RECORDS,
+                 max_bytes=COMPACT_MAX_BYTES, commit_window=GROUP_COMMIT_WINDOW):
+        self.snapshot_path = snapshot_path
+        self.journal_path = snapshot_path + JOURNAL_SUFFIX
+        self.compacting_path = self.journal_path + COMPACTING_SUFFIX
+        self.history_path = self.journal_path + HISTORY_SUFFIX
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.commit_window = commit_window
+        self.seq = 0
+        # Id the next added entry gets, or None until a load finds it
+        self.next_id = None
+        # Records newer than the snapshot by seq, as replay numbers their entries
+        self._replayed = {}
+        self.journal_records = 0
+        self.journal_bytes = 0
+        # Set when another process wrote since this store last loaded
+        self.foreign_writes = False
+        # Backing file signature as this process last left it
+        self._last_signature = None
+        self._version = (None, 0)
+        # Held while a change is applied in memory and queued, so queue
+        # order always matches the order changes were applied
+        self.mutex = threading.Lock()
+        self.lock = FileLock(snapshot_path + LOCK_SUFFIX)
+        self._compact_lock = FileLock(snapshot_path + COMPACT_LOCK_SUFFIX)
+        self._queue = []
+        self._queue_lock = threading.Lock()
+        self._leading = False
+        self._last_commit = None
+        self._compactor = None
+
+    def signature(self):
+        """Return (mtime, size) of every backing file, for cache validation"""
+        signature = []
+        for path in (self.snapshot_path, self.compacting_path, self.journal_path):
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                signature.append(None)
+        return tuple(signature)
+
+    def _read_snapshot(self):
+        """Read the snapshot file in either format, returning (data, last folded seq)"""
+        if not os.path.exists(self.snapshot_path):
+            return empty_ledger(), 0
+        if is_binary_ledger(self.snapshot_path):
+            with PARSE_SECONDS.time(source='snapshot'), BinaryLedger(self.snapshot_path) as ledger:
+                data = ledger.to_ledger()
+                data['journal_seq'] = ledger.journal_seq
+            LEDGER_BYTES_READ.inc(os.path.getsize(self.snapshot_path), file='snapshot')
+        else:
+            with open(self.snapshot_path, 'rb') as f, DISK_SECONDS.time(operation='read'):
+                raw = f.read()
+            LEDGER_BYTES_READ.inc(len(raw), file='snapshot')
+            with PARSE_SECONDS.time(source='snapshot'):
+                data = loads(raw)
+            del raw
+        seq = data.pop('journal_seq', 0)
+        data.setdefault('mode', None)
+        data.setdefault('income_sources', [])
+        data.setdefault('expenses', [])
+        ensure_aggregates(data)
+        ensure_ids(data)
+        return data, seq
+
+    def _snapshot_seq(self):
+        """Read the snapshot's journal_seq without parsing the whole file"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                head = f.read(HEADER.size)
+                if head.startswith(MAGIC):
+                    return header_seq(head)
+                match = _SNAPSHOT_SEQ.search(head)
+                if match is None:
+                    # Older snapshots stored it as the last key
+                    f.seek(max(0, os.fstat(f.fileno()).st_size - 64))
+                    match = _SNAPSHOT_SEQ.search(f.read())
+        except FileNotFoundError:
+            return 0
+        return int(match.group(1)) if match else 0
+
+    def _snapshot_next_id(self):
+        """Read the snapshot's next id without parsing its entries, or None if it has none"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                head = f.read(256)
+        except FileNotFoundError:
+            return 1
+        if head.startswith(MAGIC):
+            with BinaryLedger(self.snapshot_path) as ledger:
+                return ledger.meta.get('next_id')
+        # Snapshots are written with next_id right after mode
+        match = _SNAPSHOT_NEXT_ID.search(head)
+        return int(match.group(1)) if match else None
+
+    def version(self):
+        """Return the seq of the newest change, without loading the ledger"""
+        signature = self.signature()
+        if self._version[0] != signature:
+            seq = max(_tail_seq(self.journal_path), _tail_seq(self.compacting_path),
+                      self._snapshot_seq())
+            self._version = (signature, seq)
+        return self._version[1]
+
+    def _read_journal(self, path):
+        """Parse every complete record in a journal file"""
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as f, DISK_SECONDS.time(operation='read'):
+            lines = f.readlines()
+        LEDGER_BYTES_READ.inc(sum(map(len, lines)), file='journal')
+        records = []
+        with PARSE_SECONDS.time(source='journal'):
+            for line in lines:
+                try:
+                    records.append(loads(line))
+                except ValueError:
+                    # A torn line from a crash mid-append
+                    continue
+        return records
+
+    def _snapshot_mode(self):
+        """Read the snapshot's mode and journal_seq without parsing its entries"""
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                head = f.read(256)
+        except FileNotFoundError:
+            return None, 0
+        if head.startswith(MAGIC):
+            with BinaryLedger(self.snapshot_path) as ledger:
+                return ledger.mode, ledger.journal_seq
+        # Snapshots are written with mode right after journal_seq
+        match = _SNAPSHOT_MODE.search(head)
+        if match is None:
+            data, seq = self._read_snapshot()
+            return data['mode'], seq
+        return loads(match.group(1)), self._snapshot_seq()
+
+    def mode(self):
+        """Return the ledger's mode without loading its entries"""
+        with self.lock:
+            mode, seq = self._snapshot_mode()
+            for path in (self.compacting_path, self.journal_path):
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    continue
+                with f:
+                    for line in f:
+                        if b'"set_mode"' not in line:
+                            continue
+                        try:
+                            record = loads(line)
+                        except ValueError:
+                            continue
+                        if record['op'] == 'set_mode' and record['seq'] > seq:
+                            mode = record['mode']
+            return mode
+
+    def _fold(self, data, path, after_seq, replayed=None):
+        """Apply journal records newer than after_seq, returning (last seq, records read).
+
+        Applying a record gives the entries it adds their ids in the
+        ledger; applied records are also stored by seq in replayed when
+        it is given.
+        """
+        records = self._read_journal(path)
+        for record in records:
+            if record['seq'] > after_seq:
+                try:
+                    apply_record(data, record)
+                except (IndexError, KeyError):
+                    # A delete or update that lost a race for the same entry
+                    pass
+                after_seq = record['seq']
+                if replayed is not None:
+                    replayed[after_seq] = record
+        return after_seq, records
+
+    def load(self):
+        """Load the snapshot and replay any journal records on top of it"""
+        with self.lock:
+            return self._replay()
+
+    def _replay(self):
+        """Load the ledger with the lock held, syncing seq and next id with it"""
+        data, seq, records = self._replay_records()
+        self.seq, self.journal_records = seq, len(records)
+        self.next_id = data['next_id']
+        self.journal_bytes = self._journal_size()
+        self._last_signature = self.signature()
+        return data
+
+    def _replay_records(self):
+        """Replay the journals onto the snapshot with the lock held.
+
+        Returns (ledger, last seq, records in the journal), and keeps the
+        replayed records newer than the snapshot, whose ids are the ones
+        the ledger holds, for records_since.
+        """
+        data, seq = self._read_snapshot()
+        self._replayed = {}
+        seq, _ = self._fold(data, self.compacting_path, seq, self._replayed)
+        seq, records = self._fold(data, self.journal_path, seq, self._replayed)
+        return data, seq, records
+
+    def _records_after(self, seq):
+        """Return {seq: record} for every journaled record after seq, with the lock held"""
+        records = {}
+        for path in (self.history_path, self.compacting_path, self.journal_path):
+            if _tail_seq(path) > seq:
+                for record in self._read_journal(path):
+                    if record['seq'] > seq:
+                        records[record['seq']] = record
+        return records
+
+    def _catch_up(self):
+        """Continue seq and id numbering after records another process wrote.
+
+        Only the records after what this store last saw (or, if it never
+        loaded, after the snapshot) are read, unless some change left no
+        record, in which case the whole ledger is replayed.
+        """
+        seq, next_id = self.seq, self.next_id
+        if next_id is None:
+            seq, next_id = self._snapshot_seq(), self._snapshot_next_id()
+        version = self.version()
+        records = self._records_after(seq)
+        if (next_id is None or version < seq or len(records) != version - seq
+                or (records and min(records) != seq + 1)):
+            self._replay()
+            return
+        self.next_id = replay_next_id((records[key] for key in sorted(records)), next_id)
+        self._replayed.update(records)
+        self.seq = version
+
+    def records_since(self, seq):
+        """Return (newest seq, journaled records after seq, oldest first).
+
+        The records come from the journal, the one being compacted and
+        the last one folded into the snapshot, with the ids replay gave
+        the entries they add rather than the ids they were journaled
+        with. If any change after seq is no longer among them (compacted
+        away, or a snapshot written without a record), None is returned
+        instead of the records.
+        """
+        with self.lock:
+            version = self.version()
+            records = self._records_after(seq)
+            if seq > version or len(records) != version - seq or (records and min(records) != seq + 1):
+                return version, None
+            # Folded records were rewritten with their final ids by compaction
+            folded = self._snapshot_seq()
+            if any(key > folded and key not in self._replayed for key in records):
+                self._replay_records()
+            return version, [self._replayed.get(key, records[key]) for key in sorted(records)]
+
+    def load_binary(self):
+        """Map a binary snapshot without decoding it.
+
+        Returns the BinaryLedger and the journal records newer than it,
+        for callers that overlay the records on the mapped entries
+        instead of loading the whole ledger.
+        """
+        with self.lock:
+            ledger = BinaryLedger(self.snapshot_path)
+            seq = ledger.journal_seq
+            pending = []
+            for path in (self.compacting_path, self.journal_path):
+                records = self._read_journal(path)
+                pending.extend(record for record in records if record['seq'] > seq)
+                seq = max([seq] + [record['seq'] for record in records])
+            self.seq, self.journal_records = seq, len(records)
+            if 'next_id' in ledger.meta:
+                self.next_id = replay_next_id(pending, ledger.meta['next_id'])
+            else:
+                self.next_id = None
+            self.journal_bytes = self._journal_size()
+            self._last_signature = self.signature()
+            return ledger, pending
+
+    def _journal_size(self):
+        try:
+            return os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            return 0
+
+    def submit(self, record):
+        """Queue a record for the next group commit; call wait() on the result"""
+        commit = PendingCommit(record)
+        with self._queue_lock:
+            self._queue.append(commit)
+            self._last_commit = commit
+        return commit
+
+    def _settle(self, commit):
+        """Block until a commit is done, leading the group commit if idle"""
+        with self._queue_lock:
+            lead = not self._leading and not commit.done.is_set()
+            if lead:
+                self._leading = True
+        if lead:
+            self._lead()
+        commit.done.wait()
+
+    def wait(self, commit):
+        """Block until a submitted record is durable, re-raising any write error"""
+        self._settle(commit)
+        if commit.error is not None:
+            raise commit.error
+
+    def sync(self):
+        """Block until every record submitted so far has been written"""
+        commit = self._last_commit
+        if commit is not None:
+            self._settle(commit)
+
+    def append(self, record):
+        """Durably append one change record to the journal"""
+        self.wait(self.submit(record))
+
+    def _lead(self):
+        """Write queued records in groups until the queue is empty"""
+        if self.commit_window:
+            time.sleep(self.commit_window)
+        while True:
+            with self._queue_lock:
+                batch, self._queue = self._queue, []
+                if not batch:
+                    self._leading = False
+                    return
+            try:
+                self._write([commit.record for commit in batch])
+            except Exception as e:
+                for commit in batch:
+                    commit.error = e
+            for commit in batch:
+                commit.done.set()
+
+    def _write(self, records):
+        """Append records to the journal in one write and fsync.
+
+        Entries the records add are numbered here, overwriting any id
+        they were applied in memory with, so callers holding a record's
+        entry see the id that was journaled.
+        """
+        with self.lock:
+            if self.signature() != self._last_signature or self.next_id is None:
+                # Another process appended or compacted; continue its numbering
+                self.foreign_writes = True
+                self._catch_up()
+            with SERIALIZE_SECONDS.time(target='journal'):
+                lines = []
+                for record in records:
+                    for entry in added_entries(record):
+                        if entry.get('id') != self.next_id:
+                            # Numbered from a stale ledger; it must be reloaded
+                            self.foreign_writes = True
+                            entry['id'] = self.next_id
+                        self.next_id += 1
+                    self.seq += 1
+                    journaled = self._replayed[self.seq] = dict(record, seq=self.seq)
+                    lines.append(dumps_json(journaled))
+                payload = b'\n'.join(lines) + b'\n'
+            with open(self.journal_path, 'ab') as f:
+                prefix = b''
+                if f.tell():
+                    # Never glue a record onto a torn line left by a crash
+                    with open(self.journal_path, 'rb') as tail:
+                        tail.seek(-1, os.SEEK_END)
+                        prefix = b'' if tail.read(1) == b'\n' else b'\n'
+                with DISK_SECONDS.time(operation='write'):
+                    f.write(prefix + payload)
+                    f.flush()
+                with DISK_SECONDS.time(operation='fsync'):
+                    os.fsync(f.fileno())
+                self.journal_bytes = f.tell()
+            LEDGER_BYTES_WRITTEN.inc(len(prefix) + len(payload), file='journal')
+            self.journal_records += len(records)
+            self._last_signature = self.signature()
+        if (self.journal_records >= self.max_records
+                or self.journal_bytes >= self.max_bytes):
+            self.compact_in_background()
+
+    def _compacting(self):
+        compactor = self._compactor
+        return compactor is not None and compactor.is_alive()
+
+    def _write_snapshot_file(self, data, seq, binary=None):
+        """Write data to a temp file, returning its path.
+
+        The format follows the current snapshot unless binary is given.
+        """
+        if binary is None:
+            binary = is_binary_ledger(self.snapshot_path)
+        tmp_path = f'{self.snapshot_path}.{os.getpid()}.tmp'
+        with SERIALIZE_SECONDS.time(target='snapshot'):
+            if binary:
+                payload = dumps(data, seq)
+            else:
+                # journal_seq, mode and next_id go first so they can be read cheaply
+                head = {'journal_seq': seq, 'mode': data.get('mode')}
+                if 'next_id' in data:
+                    head['next_id'] = data['next_id']
+                payload = dumps_json({**head, **data})
+        with open(tmp_path, 'wb') as f:
+            with DISK_SECONDS.time(operation='write'):
+                f.write(payload)
+                f.flush()
+            with DISK_SECONDS.time(operation='fsync'):
+                os.fsync(f.fileno())
+        LEDGER_BYTES_WRITTEN.inc(len(payload), file='snapshot')
+        return tmp_path
+
+    def write_snapshot(self, data, binary=None):
+        """Replace the snapshot with data and discard the journal.
+
+        If another process has written since data was loaded, data is
+        missing its changes, so the journal is compacted instead and
+        False is returned. Pass binary to switch the snapshot format.
+        """
+        with self._compact_lock:
+            with self.lock:
+                current = (not self.foreign_writes
+                           and self.signature() == self._last_signature
+                           and not os.path.exists(self.compacting_path))
+                if current:
+                    # A snapshot may carry changes no record describes (a
+                    # repaired aggregate block), so it gets its own seq
+                    self.seq += 1
+                    self.next_id = data.get('next_id')
+                    tmp_path = self._write_snapshot_file(data, self.seq, binary)
+                    os.replace(tmp_path, self.snapshot_path)
+                    if os.path.exists(self.journal_path):
+                        os.remove(self.journal_path)
+                    self.journal_records = 0
+                    self.journal_bytes = 0
+                    self._last_signature = self.signature()
+                    return True
+            self._compact()
+            return False
+
+    def compact(self, blocking=True):
+        """Fold the journal into a new snapshot"""
+        if not self._compact_lock.acquire(blocking):
+            return
+        try:
+            self._compact()
+        finally:
+            self._compact_lock.release()
+
+    def _compact(self):
+        with self.lock:
+            if not os.path.exists(self.compacting_path):
+                if not os.path.exists(self.journal_path):
+                    return
+                self._replace(self.journal_path, self.compacting_path)
+            self.journal_records = 0
+            self.journal_bytes = 0
+
+        # New appends land in a fresh journal while the old one is folded
+        data, seq = self._read_snapshot()
+        seq, records = self._fold(data, self.compacting_path, seq)
+        tmp_path = self._write_snapshot_file(data, seq)
+        # History keeps the folded records with the ids replay gave them
+        history_path = self._write_history_file(records)
+        with self.lock:
+            self._replace(tmp_path, self.snapshot_path)
+            os.replace(history_path, self.history_path)
+            self._replace(self.compacting_path, None)
+            for key in [key for key in self._replayed if key <= seq]:
+                del self._replayed[key]
+
+    def _write_history_file(self, records):
+        """Write folded records to a temp file, returning its path"""
+        tmp_path = f'{self.history_path}.{os.getpid()}.tmp'
+        with SERIALIZE_SECONDS.time(target='journal'):
+            payload = b''.join(dumps_json(record) + b'\n' for record in records)
+        with open(tmp_path, 'wb') as f, DISK_SECONDS.time(operation='write'):
+            f.write(payload)
+        LEDGER_BYTES_WRITTEN.inc(len(payload), file='journal')
+        return tmp_path
+
+    def _replace(self, source, target):
+        """Move (or, without a target, remove) a file, tracking our own signature"""
+        # Only keep our signature current if nobody else has written in
+        # the meantime, so the next append still notices foreign writes
+        current = self.signature() == self._last_signature
+        if target is None:
+            os.remove(source)
+        else:
+            os.replace(source, target)
+        if current:
+            self._last_signature = self.signature()
+
+    def compact_in_background(self):
+        """Start a compaction thread unless one is already running"""
+        with self._queue_lock:
+            if self._compacting():
+                return
+            self._compactor = threading.Thread(target=self.compact, args=(False,), daemon=True)
+            self._compactor.start()
+
+    def wait_for_compaction(self):
+        """Block until any running background compaction finishes"""
+        compactor = self._compactor
+        if compactor is not None:
+            compactor.join()
+
+
+class LedgerCache:
+    """Per-process LRU cache of parsed ledgers keyed by user id.
+
+    Each entry remembers the store signature it was loaded at and is
+    dropped as soon as the files on disk no longer match. Entries are
+    evicted least-recently-used first once either the entry cap or the
+    byte cap (measured by on-disk ledger size) is exceeded. A ledger
+    larger than the byte cap on its own is kept until the next put.
+    """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def size_bytes(self):
+        """On-disk size of every cached ledger"""
+        return self._bytes
+
+    @staticmethod
+    def _size(signature):
+        return sum(part[1] for part in signature if part is not None)
+
+    def get(self, key, signature):
+        """Return the cached ledger if it still matches signature"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != signature:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result='miss')
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result='hit')
+            return entry[1]
+
+    def signature_of(self, key):
+        """Return the signature a key was cached at, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def put(self, key, signature, data):
+        """Cache a ledger, evicting least-recently-used entries over the caps"""
+        size = self._size(signature)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (signature, data, size)
+            self._bytes += size
+            # The newest entry always stays, even alone over the byte cap;
+            # otherwise paging through a huge ledger re-parses it per page
+            while len(self._entries) > 1 and (len(self._entries) > self.max_entries
+                                              or self._bytes > self.max_bytes):
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+
+    def invalidate(self, key):
+        """Forget a cached ledger"""
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+
+class JsonBackend:
+    """Per-user JSON snapshot + journal files behind an LRU cache"""
+
+    def __init__(self, data_dir, cache=None, tenants=None):
+        self.data_dir = data_dir
+        self.cache = cache if cache is not None else LedgerCache()
+        self.tenants = (tenants if tenants is not None
+                        else TenantIndex(os.path.join(data_dir, INDEX_FILE)))
+        self._stores = {}
+        self._stores_lock = threading.Lock()
+        # Ledger (and derived views) with every submitted record applied, and how
+        # many of those records are still waiting for their group commit
+        self._working = {}
+        self._inflight = {}
+
+    def user_file(self, user_id):
+        """Get the snapshot path for a user, inside their shard directory"""
+        return os.path.join(shard_dir(self.data_dir, user_id), user_id + DATA_SUFFIX)
+
+    def store_for(self, user_id):
+        """Get the journal store backing a user's data file"""
+        with self._stores_lock:
+            store = self._stores.get(user_id)
+            if store is None:
+                path = self.user_file(user_id)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                self._migrate_legacy(user_id, path)
+                store = self._stores[user_id] = JournalStore(path)
+        return store
+
+    def _migrate_legacy(self, user_id, path):
+        """Move a user's files from the old flat layout into their shard"""
+        legacy = os.path.join(self.data_dir, user_id + DATA_SUFFIX)
+        if not os.path.exists(legacy) and not os.path.exists(legacy + JOURNAL_SUFFIX):
+            return
+        with FileLock(legacy + LOCK_SUFFIX):
+            for suffix in ('', JOURNAL_SUFFIX + COMPACTING_SUFFIX, JOURNAL_SUFFIX):
+                if os.path.exists(legacy + suffix) and not os.path.exists(path + suffix):
+                    os.replace(legacy + suffix, path + suffix)
+        for suffix in (LOCK_SUFFIX, COMPACT_LOCK_SUFFIX):
+            try:
+                os.remove(legacy + suffix)
+            except FileNotFoundError:
+                pass
+
+    def migrate_legacy_files(self):
+        """Move every flat-layout ledger into its shard, returning how many moved"""
+        legacy = user_ids(os.listdir(self.data_dir))
+        for user_id in legacy:
+            self.store_for(user_id)
+        return len(legacy)
+
+    def track(self, user_id, data=None, signature=None):
+        """Update a user's entry in the tenant index from their files and ledger"""
+        if signature is None:
+            signature = self.store_for(user_id).signature()
+        if data is None:
+            data = self.load(user_id)
+        files = [entry for entry in signature if entry is not None]
+        self.tenants.update(user_id, sum(size for _, size in files),
+                            len(data['income_sources']), len(data['expenses']),
+                            max(mtime for mtime, _ in files) / 1e9 if files else None)
+
+    def load(self, user_id):
+        """Load a ledger from the cache, or from snapshot and journal"""
+        store = self.store_for(user_id)
+        signature = store.signature()
+        data = self.cache.get(user_id, signature)
+        if data is None:
+            try:
+                data = store.load()
+            except (OSError, ValueError):
+                return empty_ledger()
+            self.cache.put(user_id, signature, data)
+        return data
+
+    def save(self, user_id, data, record=None):
+        """Apply and journal a single record, or snapshot data when none is given.
+
+        Saves for one user are applied in memory one at a time, but the
+        journal writes of concurrent saves are group-committed together.
+        Returns the entry the record added or removed, if any.
+        """
+        store = self.store_for(user_id)
+        if record is None:
+            with store.mutex:
+                store.sync()
+                fresh = self.cache.signature_of(user_id) == store.signature()
+                if store.write_snapshot(data) and fresh:
+                    self.cache.put(user_id, store.signature(), data)
+                else:
+                    self.cache.invalidate(user_id)
+                for view in DERIVED_VIEWS:
+                    self.cache.invalidate((user_id, view))
+                self.track(user_id, data)
+            return None
+
+        with store.mutex:
+            if self._inflight.get(user_id) and not store.foreign_writes:
+                # Earlier saves are still being written; build on their result
+                data, views = self._working[user_id]
+            else:
+                signature = store.signature()
+                if store.foreign_writes or self.cache.signature_of(user_id) != signature:
+                    # Another process changed the ledger; apply on top of its version
+                    store.sync()
+                    data, views = store.load(), {}
+                    store.foreign_writes = False
+                else:
+                    # Views are optional, so one never built is not a cache miss
+                    views = {view: self.cache.get((user_id, view), signature)
+                             for view in DERIVED_VIEWS
+                             if self.cache.signature_of((user_id, view)) is not None}
+            if views.get('search') is not None:
+                # The index reads an entry's old text before the record changes it
+                result = views['search'].apply(data, record)
+            else:
+                result = apply_record(data, record)
+            if views.get('columns') is not None:
+                views['columns'].apply(record)
+            self._working[user_id] = (data, views)
+            self._inflight[user_id] = self._inflight.get(user_id, 0) + 1
+            commit = store.submit(record)
+
+        try:
+            store.wait(commit)
+        finally:
+            with store.mutex:
+                self._inflight[user_id] -= 1
+                if commit.error is not None or store.foreign_writes:
+                    self.cache.invalidate(user_id)
+                    for view in DERIVED_VIEWS:
+                        self.cache.invalidate((user_id, view))
+                elif self._working[user_id][0] is data:
+                    # Otherwise a later save reloaded the ledger and caches its own copy
+                    signature = store.signature()
+                    self.cache.put(user_id, signature, data)
+                    for view in DERIVED_VIEWS:
+                        if views.get(view) is not None:
+                            self.cache.put((user_id, view), signature, views[view])
+                        else:
+                            self.cache.invalidate((user_id, view))
+                    self.track(user_id, data, signature)
+        return result
+
+    def version(self, user_id):
+        """Return a number that changes whenever a user's ledger does"""
+        return self.store_for(user_id).version()
+
+    def changes_since(self, user_id, version):
+        """Return (current version, {kind: ids touched after version}).
+
+        The ids are the ones the replayed ledger gave each journaled
+        record's entries; when the records no longer cover every change,
+        the second item is None.
+        """
+        # Loading first replays any records this process has not seen yet
+        self.load(user_id)
+        current, records = self.store_for(user_id).records_since(version)
+        return current, touched_entries(records) if records is not None else None
+
+    def entries(self, user_id, kind, ids):
+        """Return a user's income_sources or expenses with the given ids, skipping missing ones"""
+        entries = self.load(user_id)[kind]
+        found = []
+        for entry_id in sorted(ids):
+            try:
+                found.append(entries[find_entry(entries, entry_id)])
+            except KeyError:
+                continue
+        return found
+
+    def list_tenants(self, after=None, limit=100):
+        """Return one page of users ordered by id with their ledger stats, and the next cursor"""
+        return self.tenants.list(after, limit)
+
+    def page(self, user_id, kind, filters, after, limit):
+        """Return one page of a user's income_sources or expenses"""
+        return page_entries(self.load(user_id)[kind], filters, after, limit)
+
+    def summarize(self, user_id, filters):
+        """Return (total income, total expenses, per-category totals) for a date range"""
+        signature = self.store_for(user_id).signature()
+        columns = self.cache.get((user_id, 'columns'), signature)
+        if columns is None:
+            from columnar import ColumnarLedger
+            columns = ColumnarLedger.from_ledger(self.load(user_id))
+            self.cache.put((user_id, 'columns'), signature, columns)
+        return columns.summarize(filters)
+
+    def search(self, user_id, query, filters, after, limit):
+        """Return one page of ranked matches for a text query, and the cursor for the next"""
+        signature = self.store_for(user_id).signature()
+        index = self.cache.get((user_id, 'search'), signature)
+        data = self.load(user_id)
+        if index is None:
+            from search import SearchIndex
+            index = SearchIndex.from_ledger(data)
+            self.cache.put((user_id, 'search'), signature, index)
+        return index.search(data, query, filters, after, limit)
+
+    def trends(self, user_id, granularity, filters):
+        """Return day or month rollup buckets within a date range"""
+        return rollup_series(ensure_aggregates(self.load(user_id)), granularity, filters)
+
+    def month_spent(self, user_id, category, month):
+        """Return a user's spending in one category and YYYY-MM month"""
+        return month_spent(ensure_aggregates(self.load(user_id)), category, month)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Sync
+Versioned change feed and batched offline pushes with conflict detection
+"""
+
+from budgets import budget_limits
+from recurring import recurring_rules
+
+# Payload key per ledger kind, and the suffix of its change record ops
+SYNC_KEYS = {'income_sources': 'income', 'expenses': 'expenses'}
+RECORD_SUFFIXES = {'income_sources': 'income', 'expenses': 'expense'}
+
+# Fields compared to detect a conflicting edit, and to spot a retried add
+ENTRY_FIELDS = {
+    'income_sources': ('source', 'amount', 'date'),
+    'expenses': ('category', 'description', 'amount', 'date')
+}
+
+
+def build_delta(backend, user_id, since):
+    """Return what a client holding version since needs to catch up.
+
+    Normally that is the entries added or changed after since and the
+    ids of those deleted. With since 0, or when the backend no longer
+    knows every change after since, the delta is full: it lists every
+    entry and the client replaces its lists. The mode, budget limits and
+    recurring rules are small, so they are always sent.
+    """
+    touched = None
+    if since > 0:
+        version, touched = backend.changes_since(user_id, since)
+    else:
+        version = backend.version(user_id)
+    # Loaded after the version was read, so it holds at least those changes
+    data = backend.load(user_id)
+    delta = {
+        'version': version,
+        'full': touched is None,
+        'mode': data['mode'],
+        'budgets': dict(budget_limits(data)),
+        'recurring': list(recurring_rules(data)),
+        'deleted': {}
+    }
+    for kind, key in SYNC_KEYS.items():
+        if touched is None:
+            delta[key] = list(data[kind])
+            delta['deleted'][key] = []
+        else:
+            entries = backend.entries(user_id, kind, touched[kind])
+            delta[key] = entries
+            delta['deleted'][key] = sorted(touched[kind] - {entry['id'] for entry in entries})
+    return delta
+
+
+def _identity(kind, entry):
+    return tuple(entry.get(field) for field in ENTRY_FIELDS[kind])
+
+
+def _changed(kind, entry, base):
+    """Check whether an entry differs from the copy a client based its change on"""
+    return any(entry.get(field) != base.get(field) for field in ENTRY_FIELDS[kind])
+
+
+def apply_push(backend, user_id, base_version, changes):
+    """Apply validated offline changes in order, returning one result per change.
+
+    Each result echoes the change's client_id with a status:
+
+    - ``applied``: the change was made; adds and updates carry the entry
+    - ``duplicate``: an identical entry (same fields and date) already
+      arrived after base_version, so a push retried after a lost
+      response does not add it twice; the existing entry is returned
+    - ``conflict``: the update or delete names an entry that was changed
+      or removed after the client's ``base`` copy of it; nothing is
+      applied and the server's entry (or None) is returned for the
+      client to keep
+
+    Deleting an entry that is already gone counts as applied.
+    """
+    recent = None
+    results = []
+    for change in changes:
+        op = change['op']
+        result = {'client_id': change['client_id']}
+        results.append(result)
+        if op == 'mode':
+            backend.save(user_id, backend.load(user_id), {'op': 'set_mode', 'mode': change['mode']})
+            result['status'] = 'applied'
+            continue
+        if op == 'clear':
+            backend.save(user_id, backend.load(user_id), {'op': 'clear'})
+            result['status'] = 'applied'
+            continue
+
+        kind = change['kind']
+        suffix = RECORD_SUFFIXES[kind]
+        if op == 'add':
+            if recent is None:
+                # Everything that arrived after the client's version, before this push
+                delta = build_delta(backend, user_id, base_version)
+                recent = {kind: {} for kind in SYNC_KEYS}
+                for recent_kind, key in SYNC_KEYS.items():
+                    for entry in delta[key]:
+                        recent[recent_kind].setdefault(_identity(recent_kind, entry), []).append(entry)
+            # Each arrived entry stands in for at most one add
+            matches = recent[kind].get(_identity(kind, change['entry']))
+            if matches:
+                result.update(status='duplicate', entry=matches.pop(0))
+            else:
+                entry = backend.save(user_id, backend.load(user_id),
+                                     {'op': f'add_{suffix}', 'entry': change['entry']})
+                result.update(status='applied', entry=entry)
+            continue
+
+        current = backend.entries(user_id, kind, [change['id']])
+        current = current[0] if current else None
+        if current is None and op == 'delete':
+            result.update(status='applied', entry=None)
+            continue
+        if current is None or (change['base'] is not None and _changed(kind, current, change['base'])):
+            result.update(status='conflict', entry=current)
+            continue
+        record = {'op': f'{op}_{suffix}', 'id': change['id']}
+        if op == 'update':
+            record['changes'] = change['changes']
+        try:
+            entry = backend.save(user_id, backend.load(user_id), record)
+        except KeyError:
+            # Removed by another request since the check above
+            result.update(status='conflict', entry=None)
+            continue
+        result.update(status='applied', entry=entry if op == 'update' else None)
+    return results
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""
+Budget Buddy Tenant Index
+User ids, sharded ledger paths and a SQLite index of per-user ledger stats
+"""
+
+import argparse
+import atexit
+import json
+import os
+import re
+import threading
+import time
+
+# hashlib, secrets and sqlite3 are imported where used, since the CLI
+# imports this module through storage but never needs them
+
+INDEX_FILE = 'tenants.db'
+DATA_SUFFIX = '_data.json'
+
+# Buffered index updates are written at most this often, in one transaction
+FLUSH_INTERVAL = float(os.environ.get('BUDGET_BUDDY_TENANT_FLUSH_INTERVAL', 1.0))
+
+# A shard directory name is two hex digits
+_SHARD = re.compile(r'^[0-9a-f]{2}$')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tenants (
+    user_id TEXT PRIMARY KEY,
+    size_bytes INTEGER NOT NULL,
+    income_count INTEGER NOT NULL,
+    expense_count INTEGER NOT NULL,
+    modified REAL NOT NULL
+) WITHOUT ROWID;
+"""
+
+COLUMNS = ('user_id', 'size_bytes', 'income_count', 'expense_count', 'modified')
+
+
+def new_user_id():
+    """Generate a random, unguessable user id"""
+    import secrets
+    return secrets.token_hex(16)
+
+
+def shard_dir(data_dir, user_id):
+    """Get the two-level hash-prefixed directory holding a user's files.
+
+    256 x 256 directories keep every directory small even with millions
+    of users, and the hash spreads sequential or similar ids evenly.
+    """
+    import hashlib
+    digest = hashlib.sha1(user_id.encode('utf-8')).hexdigest()
+    return os.path.join(data_dir, digest[:2], digest[2:4])
+
+
+def user_ids(names):
+    """Return the sorted user ids owning a snapshot or journal among file names"""
+    found = set()
+    for name in names:
+        user_id, suffix, rest = name.partition(DATA_SUFFIX)
+        if suffix and rest in ('', '.journal', '.journal.compacting'):
+            found.add(user_id)
+    return sorted(found)
+
+
+def top_shards(data_dir):
+    """Return the sorted names of the top-level shard directories under data_dir"""
+    return [outer for outer in sorted(os.listdir(data_dir))
+            if _SHARD.match(outer) and os.path.isdir(os.path.join(data_dir, outer))]
+
+
+def iter_shard_files(data_dir, outer):
+    """Yield (user_id, snapshot path) for every ledger under one top-level shard.
+
+    A ledger whose changes are all still in its journal has no snapshot
+    file yet, so users are found by either.
+    """
+    for inner in sorted(os.listdir(os.path.join(data_dir, outer))):
+        shard = os.path.join(data_dir, outer, inner)
+        if not _SHARD.match(inner) or not os.path.isdir(shard):
+            continue
+        for user_id in user_ids(os.listdir(shard)):
+            yield user_id, os.path.join(shard, user_id + DATA_SUFFIX)
+
+
+def iter_user_files(data_dir):
+    """Yield (user_id, snapshot path) for every sharded ledger under data_dir"""
+    for outer in top_shards(data_dir):
+        yield from iter_shard_files(data_dir, outer)
+
+
+class TenantIndex:
+    """Per-user ledger size, entry counts and last change, kept in SQLite.
+
+    Updates are buffered in memory and written in one transaction at most
+    every flush_interval seconds, so a burst of saves costs one write.
+    Reads see buffered updates immediately; other processes see them once
+    flushed.
+    """
+
+    def __init__(self, db_path, flush_interval=FLUSH_INTERVAL):
+        import sqlite3
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._timer = None
+        atexit.register(self.flush)
+
+    def update(self, user_id, size_bytes, income_count, expense_count, modified=None):
+        """Record a user's current ledger stats"""
+        row = (user_id, size_bytes, income_count, expense_count,
+               time.time() if modified is None else modified)
+        with self._lock:
+            self._pending[user_id] = row
+            if self._timer is None and self.flush_interval > 0:
+                self._timer = threading.Timer(self.flush_interval, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        if self.flush_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """Write buffered updates to the database"""
+        with self._lock:
+            rows = list(self._pending.values())
+            self._pending.clear()
+            self._timer = None
+            if not rows:
+                return
+            with self._conn:
+                self._conn.executemany(
+                    'INSERT INTO tenants VALUES (?, ?, ?, ?, ?) '
+                    'ON CONFLICT (user_id) DO UPDATE SET size_bytes = excluded.size_bytes, '
+                    'income_count = excluded.income_count, '
+                    'expense_count = excluded.expense_count, modified = excluded.modified',
+                    rows)
+
+    def get(self, user_id):
+        """Return one user's stats as a dict, or None if unknown"""
+        with self._lock:
+            row = self._pending.get(user_id)
+            if row is None:
+                row = self._conn.execute('SELECT * FROM tenants WHERE user_id = ?',
+                                         (user_id,)).fetchone()
+        return dict(zip(COLUMNS, row)) if row else None
+
+    def list(self, after=None, limit=100):
+        """Return one page of users ordered by id, and the cursor for the next page"""
+        self.flush()
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM tenants WHERE user_id > ? ORDER BY user_id LIMIT ?',
+                (after or '', limit + 1)).fetchall()
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [dict(zip(COLUMNS, row)) for row in rows[:limit]], next_cursor
+
+    def count(self):
+        """Return how many users are indexed"""
+        self.flush()
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM tenants').fetchone()[0]
+
+    def totals(self):
+        """Return the summed size and entry counts of every indexed user"""
+        self.flush()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(income_count), 0), '
+                'COALESCE(SUM(expense_count), 0) FROM tenants').fetchone()
+        return dict(zip(('users', 'size_bytes', 'income_count', 'expense_count'), row))
+
+    def rebuild(self, backend):
+        """Re-index every ledger a JsonBackend can find, returning the user count"""
+        backend.migrate_legacy_files()
+        with self._lock:
+            self._pending.clear()
+            with self._conn:
+                self._conn.execute('DELETE FROM tenants')
+        users = 0
+        for user_id, _ in iter_user_files(backend.data_dir):
+            backend.track(user_id)
+            users += 1
+        self.flush()
+        return users
+
+    def close(self):
+        """Flush and close the database"""
+        self.flush()
+        atexit.unregister(self.flush)
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('command', choices=['rebuild', 'list', 'totals'])
+    parser.add_argument('--data-dir', default='user_data')
+    parser.add_argument('--after')
+    parser.add_argument('--limit', type=int, default=100)
+    args = parser.parse_args()
+
+    from storage import JsonBackend
+    backend = JsonBackend(args.data_dir)
+    if args.command == 'rebuild':
+        print(f"✓ Indexed {backend.tenants.rebuild(backend)} users in {args.data_dir}")
+    elif args.command == 'list':
+        tenants, next_cursor = backend.tenants.list(args.after, args.limit)
+        print(json.dumps({'tenants': tenants, 'next_cursor': next_cursor}, indent=2))
+    else:
+        print(json.dumps(backend.tenants.totals(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
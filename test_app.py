@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+API tests for Budget Buddy
+Run with: python -m pytest test_app.py
+"""
+
+import importlib
+import os
+
+import pytest
+
+from storage import JsonBackend
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def api(request, tmp_path, monkeypatch):
+    """Return (Flask module, test client) backed by a fresh store of each kind"""
+    # app creates its data directory in the working directory on import
+    monkeypatch.chdir(tmp_path)
+    app = importlib.import_module('app')
+    if request.param == 'sqlite':
+        from sqlite_store import SQLiteBackend
+        backend = SQLiteBackend(os.path.join(str(tmp_path), 'budget_buddy.db'))
+    else:
+        backend = JsonBackend(str(tmp_path))
+    monkeypatch.setattr(app, 'backend', backend)
+    client = app.app.test_client()
+    client.post('/api/mode', json={'mode': 'student'})
+    return app, client
+
+
+def add_expense(client, **fields):
+    payload = {'category': 'Food & Dining', 'description': 'Lunch', 'amount': 12.5}
+    payload.update(fields)
+    response = client.post('/api/expenses', json=payload)
+    assert response.status_code == 200
+    return response.get_json()['entry']
+
+
+def test_patch_rejects_category_outside_mode(api):
+    _, client = api
+    entry = add_expense(client)
+
+    response = client.patch(f"/api/expenses/{entry['id']}", json={'category': 'Nonexistent'})
+    assert response.status_code == 400
+    response = client.patch(f"/api/expenses/{entry['id']}", json={'category': 'Transportation'})
+    assert response.status_code == 200
+
+    summary = client.get('/api/summary?lists=0').get_json()
+    assert summary['breakdown'] == [{'category': 'Transportation', 'amount': 12.5, 'percentage': 100.0}]
+
+
+def test_recurring_occurrences_page_by_their_own_cursor(api):
+    _, client = api
+    client.post('/api/recurring', json={'type': 'expense', 'category': 'Other', 'description': 'Bus',
+                                        'amount': 2, 'cadence': 'weekly', 'start': '2020-01-06'})
+    client.post('/api/recurring', json={'type': 'expense', 'category': 'Food & Dining',
+                                        'description': 'Box', 'amount': 5, 'cadence': 'monthly',
+                                        'start': '2020-01-01', 'end': '2020-03-31'})
+
+    seen = []
+    response = client.get('/api/expenses?limit=50').get_json()
+    while True:
+        assert len(response['recurring']) <= 50
+        seen.extend(response['recurring'])
+        if response['recurring_cursor'] is None:
+            break
+        response = client.get(f"/api/expenses?limit=50&recurring_cursor={response['recurring_cursor']}").get_json()
+    summary = client.get('/api/summary').get_json()
+    due = sum(entry['amount'] for entry in seen)
+    assert len({(entry['rule_id'], entry['date']) for entry in seen}) == len(seen)
+    assert due == summary['totals']['total_expenses']
+    assert len(summary['recurring']['expenses']) == 100
+    assert summary['recurring_cursor']['expenses'] is not None
+    assert client.get('/api/expenses?recurring_cursor=bad').status_code == 400
+
+
+@pytest.mark.parametrize('amount', ['12', None, 0, -5, True, 'nan'])
+def test_post_rejects_invalid_amounts(api, amount):
+    _, client = api
+    response = client.post('/api/expenses', json={'category': 'Other', 'amount': amount})
+    assert response.status_code == 400
+    response = client.post('/api/income', json={'source': 'Job', 'amount': amount})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('query', ['from=garbage', 'to=2026-13', 'from=2026-10-18T00:00'])
+def test_trends_rejects_malformed_dates(api, query):
+    _, client = api
+    assert client.get(f'/api/trends?{query}').status_code == 400
+    assert client.get('/api/trends?from=2026-01&to=2026-12-31').status_code == 200
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Storage engine tests for Budget Buddy
+Run with: python -m pytest test_storage.py
+"""
+
+import multiprocessing
+import os
+import threading
+
+import pytest
+
+from ledger import apply_record, compute_aggregates, find_entry
+from serialization import dumps
+from storage import JournalStore, JsonBackend
+
+USER_ID = 'shared'
+WRITERS = 4
+ENTRIES_PER_WRITER = 300
+
+
+def expense_record(description, amount=1.0):
+    return {'op': 'add_expense', 'entry': {
+        'category': 'Other',
+        'description': description,
+        'amount': amount,
+        'date': '2026-10-18 12:00:00'
+    }}
+
+
+def add_expenses(data_dir, writer):
+    """Add expenses to the shared ledger, returning (returned id, description) pairs"""
+    backend = JsonBackend(data_dir)
+    added = []
+    for number in range(ENTRIES_PER_WRITER):
+        description = f'writer {writer} entry {number}'
+        record = {'op': 'add_expense', 'entry': {
+            'category': 'Other',
+            'description': description,
+            'amount': 1.0,
+            'date': '2026-10-18 12:00:00'
+        }}
+        entry = backend.save(USER_ID, backend.load(USER_ID), record)
+        added.append((entry['id'], description))
+    return added
+
+
+def test_returned_ids_match_stored_entries_across_processes(tmp_path):
+    with multiprocessing.Pool(WRITERS) as pool:
+        results = pool.starmap(add_expenses, [(str(tmp_path), writer) for writer in range(WRITERS)])
+    added = [pair for result in results for pair in result]
+
+    expenses = JsonBackend(str(tmp_path)).load(USER_ID)['expenses']
+    assert len(expenses) == WRITERS * ENTRIES_PER_WRITER
+    assert len({entry_id for entry_id, _ in added}) == len(added)
+    for entry_id, description in added:
+        assert expenses[find_entry(expenses, entry_id)]['description'] == description
+
+
+def test_change_feed_reports_replayed_ids(tmp_path):
+    store = JsonBackend(str(tmp_path)).store_for(USER_ID)
+    # Journals written before ids were assigned under the lock can repeat an id
+    with open(store.journal_path, 'wb') as f:
+        for seq, description in enumerate(('first', 'second'), 1):
+            f.write(dumps({'op': 'add_expense', 'seq': seq, 'entry': {
+                'id': 1,
+                'category': 'Other',
+                'description': description,
+                'amount': 1.0,
+                'date': '2026-10-18 12:00:00'
+            }}) + b'\n')
+
+    assert JsonBackend(str(tmp_path)).changes_since(USER_ID, 0)[1]['expenses'] == {1, 2}
+    store.compact()
+    backend = JsonBackend(str(tmp_path))
+    assert backend.changes_since(USER_ID, 1)[1]['expenses'] == {2}
+    backend.save(USER_ID, backend.load(USER_ID), {'op': 'delete_expense', 'id': 2})
+    assert backend.changes_since(USER_ID, 1)[1]['expenses'] == {2}
+    assert [entry['description'] for entry in backend.load(USER_ID)['expenses']] == ['first']
+
+
+@pytest.mark.parametrize('leftover', ['journal', 'compacting'])
+def test_replay_skips_records_already_in_the_snapshot(tmp_path, leftover):
+    path = str(tmp_path / 'ledger.json')
+    store = JournalStore(path)
+    data = store.load()
+    for number in range(3):
+        record = expense_record(f'entry {number}', number + 1.0)
+        apply_record(data, record)
+        store.append(record)
+    # Crash after the snapshot holding every record is swapped in, before the
+    # journal (or the journal being compacted) is removed
+    os.replace(store._write_snapshot_file(data, store.seq), path)
+    if leftover == 'compacting':
+        os.replace(store.journal_path, store.compacting_path)
+
+    store = JournalStore(path)
+    reloaded = store.load()
+    assert [entry['description'] for entry in reloaded['expenses']] == ['entry 0', 'entry 1', 'entry 2']
+    assert reloaded['aggregates'] == compute_aggregates(reloaded)
+    assert reloaded['aggregates']['total_expenses'] == 6.0
+    record = expense_record('after the crash')
+    store.append(record)
+    assert record['entry']['id'] == 4
+    assert len(JournalStore(path).load()['expenses']) == 4
+
+
+def check_stored(path, added):
+    """Check a fresh load holds every added entry exactly once under the id it was given"""
+    data = JournalStore(path).load()
+    expenses = data['expenses']
+    assert len(expenses) == len(added)
+    assert len({entry['id'] for entry in expenses}) == len(expenses)
+    for entry in added:
+        assert expenses[find_entry(expenses, entry['id'])]['description'] == entry['description']
+    assert data['aggregates'] == compute_aggregates(data)
+
+
+def test_compaction_while_another_writer_appends(tmp_path):
+    path = str(tmp_path / 'ledger.json')
+    # Thresholds high enough that only the explicit compactions run
+    compactor = JournalStore(path, max_records=10 ** 6, max_bytes=10 ** 9)
+    writer = JournalStore(path, max_records=10 ** 6, max_bytes=10 ** 9)
+    added = []
+    for number in range(2000):
+        record = expense_record(f'before {number}')
+        compactor.append(record)
+        added.append(record['entry'])
+
+    thread = threading.Thread(target=compactor.compact)
+    thread.start()
+    for number in range(300):
+        record = expense_record(f'during {number}')
+        writer.append(record)
+        added.append(record['entry'])
+    thread.join()
+
+    check_stored(path, added)
+    compactor.compact()
+    check_stored(path, added)
+
+
+def test_two_stores_writing_one_file(tmp_path):
+    path = str(tmp_path / 'ledger.json')
+    stores = [JournalStore(path), JournalStore(path)]
+    added = [[], []]
+
+    def write(number):
+        for count in range(300):
+            record = expense_record(f'store {number} entry {count}')
+            stores[number].append(record)
+            added[number].append(record['entry'])
+
+    threads = [threading.Thread(target=write, args=(number,)) for number in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for store in stores:
+        store.wait_for_compaction()
+
+    check_stored(path, added[0] + added[1])
+    seqs = [record['seq'] for journal in (stores[0].history_path, stores[0].journal_path)
+            for record in stores[0]._read_journal(journal)]
+    assert seqs == sorted(set(seqs))